@@ -2,10 +2,11 @@ from fastapi import APIRouter, Depends, HTTPException, status, Form
 from sqlalchemy.orm import Session
 from sqlalchemy.exc import IntegrityError
 from typing import Optional
-from app.database.database import get_db
+from app.database.database import run_in_session
 from app.schemas.schemas import UserCreate, User, Token, UserLogin
 from app.services import user_service, auth_service, auth_utils
 from app.core.config import settings
+from app.core.security import PasswordHasherBusy, get_password_hash_async, verify_password_async
 from datetime import timedelta
 from pydantic import BaseModel
 import logging
@@ -26,14 +27,13 @@ class UserLoginForm(BaseModel):
 router = APIRouter()
 
 @router.post("/register", response_model=User)
-def register_user(
+async def register_user(
     # 支持JSON和表单数据
     user: UserCreate = None,
     # 表单数据参数
     username: str = Form(None),
     email: str = Form(None),
-    password: str = Form(None),
-    db: Session = Depends(get_db)
+    password: str = Form(None)
 ):
     try:
         # 如果通过表单传递数据，则创建UserCreate对象
@@ -45,18 +45,23 @@ def register_user(
             raise HTTPException(status_code=400, detail="Missing user data")
         
         # 检查用户名是否已存在
-        db_user = user_service.get_user_by_username(db, username=user.username)
+        db_user = await run_in_session(user_service.get_user_by_username, username=user.username)
         if db_user:
             raise HTTPException(status_code=400, detail="Username already registered")
         
         # 检查邮箱是否已存在
-        db_user = user_service.get_user_by_email(db, email=user.email)
+        db_user = await run_in_session(user_service.get_user_by_email, email=user.email)
         if db_user:
             raise HTTPException(status_code=400, detail="Email already registered")
         
+        # 在专用的密码哈希执行器中计算哈希，不占用数据库会话
+        hashed_password = await get_password_hash_async(user.password)
+        
         # 创建新用户
-        return user_service.create_user(db=db, user=user)
+        return await run_in_session(user_service.create_user, user=user, hashed_password=hashed_password)
     
+    except PasswordHasherBusy as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         logger.error(f"用户注册失败: {str(e)}")
         # 如果是已知的HTTP异常，重新抛出
@@ -67,13 +72,12 @@ def register_user(
 
 
 @router.post("/login", response_model=Token)
-def login_user(
+async def login_user(
     # 支持JSON和表单数据
     user: UserLogin = None,
     # 表单数据参数
     username: str = Form(None),
-    password: str = Form(None),
-    db: Session = Depends(get_db)
+    password: str = Form(None)
 ):
     try:
         # 如果通过表单传递数据，则创建UserLogin对象
@@ -84,9 +88,9 @@ def login_user(
         if user is None:
             raise HTTPException(status_code=400, detail="Missing login credentials")
         
-        # 验证用户
-        db_user = user_service.authenticate_user(db, user.username, user.password)
-        if not db_user:
+        # 验证用户，密码校验在专用的密码哈希执行器中进行
+        db_user = await run_in_session(user_service.get_user_by_username, username=user.username)
+        if not db_user or not await verify_password_async(user.password, db_user.hashed_password):
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="Incorrect username or password",
@@ -101,6 +105,8 @@ def login_user(
         
         return {"access_token": access_token, "token_type": "bearer"}
     
+    except PasswordHasherBusy as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         logger.error(f"用户登录失败: {str(e)}")
         # 如果是已知的HTTP异常，重新抛出
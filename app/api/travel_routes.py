@@ -1,11 +1,20 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Request
+from fastapi import APIRouter, Depends, HTTPException, Query, status, Request, Response
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional
 from pydantic import BaseModel
 from datetime import datetime
-from app.database.database import get_db
-from app.schemas.schemas import TravelPlanCreate, TravelPlan, TravelPlanUpdate, ExpenseCreate, Expense, User
-from app.services import user_service, auth_utils, travel_service
+from app.database import database
+from app.database.database import get_db, run_in_session
+from app.schemas.schemas import (
+    TravelPlanCreate, TravelPlan, TravelPlanSummary, TravelPlanUpdate, ExpenseCreate, Expense, User, GenerationJob,
+    Itinerary, ItineraryDay, BudgetSummary, BudgetStatus, PlanSearchResult
+)
+from app.services import (
+    user_service, async_user_service, auth_utils, travel_service, job_service, itinerary_parser, budget_service,
+    expense_import_service, pagination, search_service
+)
+from app.core.config import settings
 from app.services.speech_service import speech_service
 
 # 定义请求模型
@@ -17,6 +26,9 @@ class GeneratePlanRequest(BaseModel):
     preferences: str = ""
     travelers: int = 1
 
+class RegenerateDayRequest(BaseModel):
+    instructions: str = ""
+
 # 添加新的请求模型
 class BudgetAnalysisRequest(BaseModel):
     plan_id: int
@@ -24,15 +36,44 @@ class BudgetAnalysisRequest(BaseModel):
 
 router = APIRouter()
 
-@router.get("/plans/", response_model=List[TravelPlan])
-def read_travel_plans(skip: int = 0, limit: int = 100, db: Session = Depends(get_db), current_user: User = Depends(auth_utils.get_current_user)):
-    plans = user_service.get_travel_plans(db, user_id=current_user.id, skip=skip, limit=limit)
+@router.get("/plans/", response_model=List[TravelPlanSummary])
+def read_travel_plans(response: Response, cursor: Optional[str] = None, limit: int = 100, skip: Optional[int] = Query(None, ge=0, deprecated=True, description="已弃用，请改用 cursor 分页"), db: Session = Depends(get_db), current_user: User = Depends(auth_utils.get_current_user)):
+    """
+    获取计划列表（不含计划详情），按创建时间排序；还有下一页时在 X-Next-Cursor 响应头中返回游标
+    """
+    _check_skip(skip, cursor)
+    try:
+        plans = user_service.get_travel_plans(db, user_id=current_user.id, cursor=cursor, limit=limit, skip=skip or 0)
+    except pagination.InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    _set_next_cursor(response, plans, limit)
     return plans
 
 
+def _check_skip(skip: Optional[int], cursor: Optional[str]):
+    # skip 只为兼容旧客户端保留，两种分页方式不能混用
+    if skip and cursor:
+        raise HTTPException(status_code=400, detail="skip 参数已弃用，不能与 cursor 同时使用")
+
+
+def _set_next_cursor(response: Response, rows, limit: int):
+    cursor = pagination.next_cursor(rows, pagination.page_size(limit))
+    if cursor:
+        response.headers[pagination.NEXT_CURSOR_HEADER] = cursor
+
+
+@router.get("/plans/search", response_model=List[PlanSearchResult])
+def search_travel_plans(q: str, limit: int = 20, offset: int = 0, db: Session = Depends(get_db), current_user: User = Depends(auth_utils.get_current_user)):
+    """
+    全文检索当前用户的计划（标题、目的地、详情），按相关度排序；
+    高亮字段已做HTML转义，检索词用 <mark> 标出
+    """
+    return search_service.search_plans(db, user_id=current_user.id, query=q, limit=limit, offset=offset)
+
+
 @router.get("/plans/{plan_id}", response_model=TravelPlan)
 def read_travel_plan(plan_id: int, db: Session = Depends(get_db), current_user: User = Depends(auth_utils.get_current_user)):
-    db_plan = user_service.get_travel_plan(db, plan_id=plan_id)
+    db_plan = user_service.get_travel_plan_with_details(db, plan_id=plan_id)
     if db_plan is None:
         raise HTTPException(status_code=404, detail="Travel plan not found")
     if db_plan.user_id != current_user.id:
@@ -40,6 +81,50 @@ def read_travel_plan(plan_id: int, db: Session = Depends(get_db), current_user:
     return db_plan
 
 
+@router.get("/plans/{plan_id}/itinerary", response_model=Itinerary)
+def read_itinerary(plan_id: int, db: Session = Depends(get_db), current_user: User = Depends(auth_utils.get_current_user)):
+    """
+    获取计划的结构化行程（按天排列的活动、时间、地点和预估花费）
+    """
+    db_plan = user_service.get_travel_plan(db, plan_id=plan_id)
+    if db_plan is None:
+        raise HTTPException(status_code=404, detail="Travel plan not found")
+    if db_plan.user_id != current_user.id:
+        raise HTTPException(status_code=403, detail="Not authorized to access this plan")
+    days = user_service.get_itinerary(db, plan_id=plan_id)
+    return Itinerary(plan_id=plan_id, days=[ItineraryDay.model_validate(day) for day in days])
+
+
+@router.post("/plans/{plan_id}/days/{day_number}/regenerate", response_model=TravelPlan)
+async def regenerate_plan_day(
+    plan_id: int,
+    day_number: int,
+    request: RegenerateDayRequest,
+    current_user: User = Depends(auth_utils.get_current_user)
+):
+    """
+    只重新生成计划中的某一天，结果替换到原计划中，不创建新计划
+    """
+    db_plan, days = await travel_service.travel_service.load_plan_itinerary(plan_id)
+    if db_plan is None:
+        raise HTTPException(status_code=404, detail="Travel plan not found")
+    if db_plan.user_id != current_user.id:
+        raise HTTPException(status_code=403, detail="Not authorized to update this plan")
+    if not any(day.day_number == day_number for day in days) and \
+            itinerary_parser.find_day_section(db_plan.details or "", day_number) is None:
+        raise HTTPException(status_code=404, detail=f"计划中没有第{day_number}天")
+    
+    result = await travel_service.travel_service.regenerate_day(
+        current_user.id, db_plan, days, day_number, request.instructions
+    )
+    if not result["success"]:
+        raise HTTPException(
+            status_code=503 if result.get("unavailable") else 500,
+            detail=f"Failed to regenerate day: {result['error']}"
+        )
+    return result["plan"]
+
+
 @router.post("/plans/", response_model=TravelPlan)
 def create_travel_plan(plan: TravelPlanCreate, db: Session = Depends(get_db), current_user: User = Depends(auth_utils.get_current_user)):
     return user_service.create_travel_plan(db=db, plan=plan, user_id=current_user.id)
@@ -48,30 +133,13 @@ def create_travel_plan(plan: TravelPlanCreate, db: Session = Depends(get_db), cu
 @router.post("/plans/generate", response_model=TravelPlan)
 async def generate_travel_plan(
     request: GeneratePlanRequest,
-    db: Session = Depends(get_db),
     current_user: User = Depends(auth_utils.get_current_user)
 ):
     """
     通过AI大语言模型生成旅游计划
     """
     # 验证输入参数
-    if not request.destination:
-        raise HTTPException(
-            status_code=400,
-            detail="目的地不能为空"
-        )
-    
-    if request.budget <= 0:
-        raise HTTPException(
-            status_code=400,
-            detail="预算必须大于0"
-        )
-    
-    if request.travelers <= 0:
-        raise HTTPException(
-            status_code=400,
-            detail="旅行人数必须大于0"
-        )
+    _validate_generate_request(request)
     
     try:
         # 解析日期字符串
@@ -79,7 +147,6 @@ async def generate_travel_plan(
         end_date = datetime.strptime(request.end_date, "%Y-%m-%d")
         
         result = await travel_service.travel_service.generate_and_save_travel_plan(
-            db=db,
             user_id=current_user.id,
             destination=request.destination,
             start_date=start_date,
@@ -90,8 +157,9 @@ async def generate_travel_plan(
         )
         
         if not result["success"]:
+            # AI服务熔断或过载时返回503，提示客户端稍后重试
             raise HTTPException(
-                status_code=500,
+                status_code=503 if result.get("unavailable") else 500,
                 detail=f"Failed to generate travel plan: {result['error']}"
             )
         
@@ -131,6 +199,118 @@ async def generate_travel_plan(
             detail=f"生成旅游计划时发生错误: {str(e)}"
         )
 
+
+@router.post("/plans/generate/stream")
+async def generate_travel_plan_stream(
+    request: GeneratePlanRequest,
+    current_user: User = Depends(auth_utils.get_current_user)
+):
+    """
+    通过AI大语言模型流式生成旅游计划
+
+    以NDJSON格式逐行返回增量内容，生成完成后保存计划并返回 done 事件
+    """
+    # 验证输入参数
+    _validate_generate_request(request)
+    
+    try:
+        # 解析日期字符串
+        start_date = datetime.strptime(request.start_date, "%Y-%m-%d")
+        end_date = datetime.strptime(request.end_date, "%Y-%m-%d")
+    except ValueError as e:
+        raise HTTPException(
+            status_code=400,
+            detail=f"日期格式错误: {str(e)}"
+        )
+    
+    events = travel_service.travel_service.stream_and_save_travel_plan(
+        user_id=current_user.id,
+        destination=request.destination,
+        start_date=start_date,
+        end_date=end_date,
+        budget=request.budget,
+        preferences=request.preferences,
+        travelers=request.travelers
+    )
+    return StreamingResponse(
+        events,
+        media_type="application/x-ndjson",
+        # 禁止反向代理缓冲，保证增量内容及时到达客户端
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@router.post("/plans/jobs", response_model=GenerationJob, status_code=202)
+async def create_generation_job(
+    request: GeneratePlanRequest,
+    current_user: User = Depends(auth_utils.get_current_user)
+):
+    """
+    提交后台生成任务，立即返回任务ID，通过 GET /plans/jobs/{job_id} 查询进度
+    """
+    # 验证输入参数
+    _validate_generate_request(request)
+    
+    try:
+        # 解析日期字符串
+        start_date = datetime.strptime(request.start_date, "%Y-%m-%d")
+        end_date = datetime.strptime(request.end_date, "%Y-%m-%d")
+    except ValueError as e:
+        raise HTTPException(
+            status_code=400,
+            detail=f"日期格式错误: {str(e)}"
+        )
+    
+    try:
+        return await job_service.generation_job_queue.submit(
+            user_id=current_user.id,
+            destination=request.destination,
+            start_date=start_date,
+            end_date=end_date,
+            budget=request.budget,
+            preferences=request.preferences,
+            travelers=request.travelers
+        )
+    except job_service.JobLimitExceeded as e:
+        raise HTTPException(status_code=429, detail=str(e))
+
+
+@router.get("/plans/jobs/{job_id}", response_model=GenerationJob)
+async def read_generation_job(job_id: str, current_user: User = Depends(auth_utils.get_current_user)):
+    """
+    查询生成任务状态：queued / running / done / failed，完成后返回 plan_id
+    """
+    db_job = await run_in_session(job_service.get_job, job_id)
+    if db_job is None:
+        raise HTTPException(status_code=404, detail="Generation job not found")
+    if db_job.user_id != current_user.id:
+        raise HTTPException(status_code=403, detail="Not authorized to access this job")
+    return db_job
+
+
+def _validate_generate_request(request: GeneratePlanRequest):
+    """
+    校验生成旅游计划的请求参数
+    """
+    if not request.destination:
+        raise HTTPException(
+            status_code=400,
+            detail="目的地不能为空"
+        )
+    
+    if request.budget <= 0:
+        raise HTTPException(
+            status_code=400,
+            detail="预算必须大于0"
+        )
+    
+    if request.travelers <= 0:
+        raise HTTPException(
+            status_code=400,
+            detail="旅行人数必须大于0"
+        )
+
+
 @router.put("/plans/{plan_id}", response_model=TravelPlan)
 def update_travel_plan(plan_id: int, plan: TravelPlanUpdate, db: Session = Depends(get_db), current_user: User = Depends(auth_utils.get_current_user)):
     db_plan = user_service.get_travel_plan(db, plan_id=plan_id)
@@ -138,7 +318,11 @@ def update_travel_plan(plan_id: int, plan: TravelPlanUpdate, db: Session = Depen
         raise HTTPException(status_code=404, detail="Travel plan not found")
     if db_plan.user_id != current_user.id:
         raise HTTPException(status_code=403, detail="Not authorized to update this plan")
-    return user_service.update_travel_plan(db=db, plan_id=plan_id, plan=plan)
+    itinerary = None
+    if plan.details is not None:
+        # 计划正文被修改，重新解析结构化行程
+        _, itinerary, _ = itinerary_parser.parse_itinerary(plan.details)
+    return user_service.update_travel_plan(db=db, plan_id=plan_id, plan=plan, itinerary=itinerary)
 
 
 @router.delete("/plans/{plan_id}")
@@ -153,8 +337,13 @@ def delete_travel_plan(plan_id: int, db: Session = Depends(get_db), current_user
 
 
 @router.get("/expenses/", response_model=List[Expense])
-def read_expenses(plan_id: int = None, skip: int = 0, limit: int = 100, db: Session = Depends(get_db), current_user: User = Depends(auth_utils.get_current_user)):
-    expenses = user_service.get_expenses(db, user_id=current_user.id, plan_id=plan_id, skip=skip, limit=limit)
+def read_expenses(response: Response, plan_id: int = None, cursor: Optional[str] = None, limit: int = 100, skip: Optional[int] = Query(None, ge=0, deprecated=True, description="已弃用，请改用 cursor 分页"), db: Session = Depends(get_db), current_user: User = Depends(auth_utils.get_current_user)):
+    _check_skip(skip, cursor)
+    try:
+        expenses = user_service.get_expenses(db, user_id=current_user.id, plan_id=plan_id, cursor=cursor, limit=limit, skip=skip or 0)
+    except pagination.InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    _set_next_cursor(response, expenses, limit)
     return expenses
 
 
@@ -170,19 +359,58 @@ def create_expense(expense: ExpenseCreate, db: Session = Depends(get_db), curren
     return user_service.create_expense(db=db, expense=expense, user_id=current_user.id)
 
 
+@router.post("/expenses/bulk")
+async def import_expenses(
+    request: Request,
+    plan_id: Optional[int] = None,
+    current_user: User = Depends(auth_utils.get_current_user)
+):
+    """
+    批量导入开销
+
+    请求体可以是开销对象的JSON数组（application/json），也可以是CSV（text/csv 直接上传，
+    或 multipart/form-data 的 file 字段）；两种格式都边接收边解析写入。plan_id 为行中未指定计划时的默认值。
+    返回导入成功的行数和失败行的错误信息
+    """
+    importer = expense_import_service.ExpenseImporter(current_user.id, plan_id=plan_id)
+    content_type = request.headers.get("content-type", "").lower()
+    try:
+        if "json" in content_type:
+            return await expense_import_service.import_json(importer, request.stream())
+        if content_type.startswith("multipart/form-data"):
+            # 上传的文件由框架暂存到临时文件，再分块读取
+            form = await request.form()
+            upload = form.get("file")
+            if upload is None or isinstance(upload, str):
+                raise HTTPException(status_code=400, detail="缺少CSV文件（file字段）")
+            return await expense_import_service.import_csv(importer, _read_upload(upload))
+        if "csv" in content_type or content_type.startswith("text/plain"):
+            return await expense_import_service.import_csv(importer, request.stream())
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    raise HTTPException(status_code=415, detail="仅支持JSON数组或CSV")
+
+
+async def _read_upload(upload, size: int = 64 * 1024):
+    while True:
+        chunk = await upload.read(size)
+        if not chunk:
+            return
+        yield chunk
+
+
 # 添加新的预算分析端点
 @router.post("/budget/analyze")
 async def analyze_budget(
     request: BudgetAnalysisRequest,
-    db: Session = Depends(get_db),
     current_user: User = Depends(auth_utils.get_current_user)
 ):
     """
     通过AI分析旅行预算和开销
     """
     try:
-        # 获取旅行计划
-        db_plan = user_service.get_travel_plan(db, plan_id=request.plan_id)
+        # 获取旅行计划并在数据库中汇总开销，查询结束后即释放会话
+        db_plan, summary = await _fetch_plan_with_summary(request.plan_id, current_user.id)
         if db_plan is None:
             raise HTTPException(status_code=404, detail="Travel plan not found")
         
@@ -190,19 +418,16 @@ async def analyze_budget(
         if db_plan.user_id != current_user.id:
             raise HTTPException(status_code=403, detail="Not authorized to analyze budget for this plan")
         
-        # 获取该计划的所有开销
-        expenses = user_service.get_expenses(db, user_id=current_user.id, plan_id=request.plan_id)
-        
         # 调用AI服务进行预算分析
         from app.services import llm_service
         analysis_result = await llm_service.llm_service.analyze_budget(
             plan=db_plan,
-            expenses=expenses
+            summary=summary
         )
         
         if not analysis_result.get("success", False):
             raise HTTPException(
-                status_code=500,
+                status_code=503 if analysis_result.get("unavailable") else 500,
                 detail=f"Failed to analyze budget: {analysis_result.get('error', 'Unknown error')}"
             )
         
@@ -221,11 +446,60 @@ async def analyze_budget(
         )
 
 
+@router.get("/plans/{plan_id}/budget", response_model=BudgetSummary)
+async def read_budget_summary(plan_id: int, current_user: User = Depends(auth_utils.get_current_user)):
+    """
+    获取计划的预算摘要：分类合计、每日合计和大额开销
+    """
+    db_plan, summary = await _fetch_plan_with_summary(plan_id, current_user.id)
+    if db_plan is None:
+        raise HTTPException(status_code=404, detail="Travel plan not found")
+    if db_plan.user_id != current_user.id:
+        raise HTTPException(status_code=403, detail="Not authorized to access this plan")
+    return summary
+
+
+@router.get("/plans/{plan_id}/budget/status", response_model=BudgetStatus)
+def read_budget_status(plan_id: int, db: Session = Depends(get_db), current_user: User = Depends(auth_utils.get_current_user)):
+    """
+    获取计划的预算状态（总额、分类合计、每日合计），读取预先维护的汇总，适合频繁轮询
+    """
+    db_plan = user_service.get_travel_plan(db, plan_id=plan_id)
+    if db_plan is None:
+        raise HTTPException(status_code=404, detail="Travel plan not found")
+    if db_plan.user_id != current_user.id:
+        raise HTTPException(status_code=403, detail="Not authorized to access this plan")
+    return budget_service.get_budget_status(db, db_plan)
+
+
+async def _fetch_plan_with_summary(plan_id: int, user_id: int):
+    """
+    获取旅行计划及其预算摘要，查询结束后即释放会话
+    """
+    if settings.DATABASE_ASYNC:
+        async with database.AsyncSessionLocal() as db:
+            db_plan = await async_user_service.get_travel_plan(db, plan_id=plan_id)
+            if db_plan is None or db_plan.user_id != user_id:
+                return db_plan, None
+            return db_plan, await budget_service.get_budget_summary_async(db, db_plan)
+    # 在工作线程中查询
+    return await run_in_session(_load_plan_with_summary, plan_id=plan_id, user_id=user_id)
+
+
+def _load_plan_with_summary(db: Session, plan_id: int, user_id: int):
+    """
+    获取旅行计划及其预算摘要；计划不存在或不属于该用户时不汇总开销
+    """
+    db_plan = user_service.get_travel_plan(db, plan_id=plan_id)
+    if db_plan is None or db_plan.user_id != user_id:
+        return db_plan, None
+    return db_plan, budget_service.get_budget_summary(db, db_plan)
+
+
 # 添加语音识别端点
 @router.post("/speech/recognize")
 async def recognize_speech(
     request: Request,
-    db: Session = Depends(get_db),
     current_user: User = Depends(auth_utils.get_current_user)
 ):
     """
@@ -236,7 +510,7 @@ async def recognize_speech(
         audio_data = await request.body()
         
         # 调用语音识别服务
-        result = speech_service.recognize_speech(audio_data)
+        result = await speech_service.recognize_speech(audio_data)
         
         if not result["success"]:
             raise HTTPException(
@@ -0,0 +1,177 @@
+import functools
+import importlib
+import logging
+import os
+import threading
+import zlib
+from typing import Iterable, Optional, Union
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# 压缩后的值以1字节标记开头，标明编码方式
+_RAW = b"\x00"
+_ZLIB = b"\x01"
+_ZSTD = b"\x02"
+_TAGS = {_RAW: "raw", _ZLIB: "zlib", _ZSTD: "zstd"}
+
+# 字典文件名为 <字典ID>.zdict
+DICTIONARY_SUFFIX = ".zdict"
+
+_local = threading.local()
+_warned_missing_zstd = False
+_dictionaries = {}
+_dictionaries_lock = threading.Lock()
+
+
+@functools.lru_cache(maxsize=None)
+def _zstd():
+    """
+    zstandard 为可选依赖，未安装时返回None
+    """
+    try:
+        return importlib.import_module("zstandard")
+    except ImportError:
+        return None
+
+
+def current_codec() -> str:
+    """
+    当前写入使用的编码：zstd / zlib / none
+    """
+    global _warned_missing_zstd
+    codec = settings.COMPRESSION_CODEC.lower()
+    if codec not in ("zstd", "zlib", "none"):
+        raise ValueError(f"无效的COMPRESSION_CODEC: {settings.COMPRESSION_CODEC}")
+    if codec == "zstd" and _zstd() is None:
+        # 与 LLM_HTTP2 相同的处理方式：可选依赖缺失时退回内置实现
+        if not _warned_missing_zstd:
+            logger.warning("未安装zstandard，压缩改用zlib")
+            _warned_missing_zstd = True
+        return "zlib"
+    return codec
+
+
+def compress_text(value: Optional[str]) -> Optional[bytes]:
+    """
+    压缩文本；过短或压缩后没有变小时按原文存储（同样带标记）
+    """
+    if value is None:
+        return None
+    data = value.encode("utf-8")
+    codec = current_codec()
+    if codec == "none" or len(data) < settings.COMPRESSION_MIN_BYTES:
+        return _RAW + data
+    if codec == "zstd":
+        compressed = _ZSTD + _compressor().compress(data)
+    else:
+        compressed = _ZLIB + zlib.compress(data, settings.COMPRESSION_ZLIB_LEVEL)
+    return compressed if len(compressed) < len(data) + 1 else _RAW + data
+
+
+def decompress_text(value: Union[bytes, memoryview, str, None]) -> Optional[str]:
+    """
+    解压 compress_text 的结果
+
+    也接受压缩之前写入的值：SQLite 中为文本，PostgreSQL 转换列类型后为不带标记的UTF-8字节
+    """
+    if value is None or isinstance(value, str):
+        return value
+    data = bytes(value)
+    tag = data[:1]
+    if tag == _RAW:
+        return data[1:].decode("utf-8")
+    if tag == _ZLIB:
+        return zlib.decompress(data[1:]).decode("utf-8")
+    if tag == _ZSTD:
+        return _decompress_zstd(data[1:]).decode("utf-8")
+    return data.decode("utf-8")
+
+
+def stored_codec(value: Union[bytes, memoryview, str, None]) -> Optional[str]:
+    """
+    判断已存储的值使用的编码
+
+    Returns:
+        raw / zlib / zstd；压缩之前写入的值返回 text；None 返回 None
+    """
+    if value is None:
+        return None
+    if isinstance(value, str):
+        return "text"
+    return _TAGS.get(bytes(value[:1]), "text")
+
+
+def needs_recompress(value: Union[bytes, memoryview, str, None]) -> bool:
+    """
+    已存储的值与当前的压缩配置不一致时返回True（未压缩的旧值、换了编码或zstd字典）
+    """
+    codec = stored_codec(value)
+    if codec in (None, "raw"):
+        return False
+    current = current_codec()
+    if codec == "text":
+        return True
+    if current == "none":
+        return True
+    if codec != current:
+        return True
+    if codec == "zstd":
+        return _zstd().get_frame_parameters(bytes(value)[1:]).dict_id != settings.COMPRESSION_ZSTD_DICT_ID
+    return False
+
+
+def train_dictionary(samples: Iterable[str], size: int = 112640) -> int:
+    """
+    用样本训练 zstd 字典并保存到 COMPRESSION_ZSTD_DICT_DIR
+
+    Returns:
+        字典ID，需要配置到 COMPRESSION_ZSTD_DICT_ID 后才会用于压缩
+
+    Raises:
+        RuntimeError: 未安装 zstandard
+    """
+    zstd = _zstd()
+    if zstd is None:
+        raise RuntimeError("训练字典需要安装 zstandard")
+    dictionary = zstd.train_dictionary(size, [sample.encode("utf-8") for sample in samples if sample])
+    os.makedirs(settings.COMPRESSION_ZSTD_DICT_DIR, exist_ok=True)
+    path = os.path.join(settings.COMPRESSION_ZSTD_DICT_DIR, f"{dictionary.dict_id()}{DICTIONARY_SUFFIX}")
+    with open(path, "wb") as f:
+        f.write(dictionary.as_bytes())
+    return dictionary.dict_id()
+
+
+def _dictionary(dict_id: int):
+    """
+    按ID读取字典；更换字典后旧字典文件需保留，已有数据仍然依赖它解压
+    """
+    with _dictionaries_lock:
+        if dict_id not in _dictionaries:
+            path = os.path.join(settings.COMPRESSION_ZSTD_DICT_DIR, f"{dict_id}{DICTIONARY_SUFFIX}")
+            if not os.path.exists(path):
+                raise RuntimeError(f"缺少zstd字典文件: {path}")
+            with open(path, "rb") as f:
+                _dictionaries[dict_id] = _zstd().ZstdCompressionDict(f.read())
+        return _dictionaries[dict_id]
+
+
+def _compressor():
+    # ZstdCompressor 不能在多个线程中同时使用，每个线程各建一个
+    key = (settings.COMPRESSION_ZSTD_LEVEL, settings.COMPRESSION_ZSTD_DICT_ID)
+    compressors = _local.__dict__.setdefault("compressors", {})
+    if key not in compressors:
+        dictionary = _dictionary(key[1]) if key[1] else None
+        compressors[key] = _zstd().ZstdCompressor(level=key[0], dict_data=dictionary)
+    return compressors[key]
+
+
+def _decompress_zstd(frame: bytes) -> bytes:
+    zstd = _zstd()
+    if zstd is None:
+        raise RuntimeError("数据使用zstd压缩，需要安装 zstandard")
+    dict_id = zstd.get_frame_parameters(frame).dict_id
+    decompressors = _local.__dict__.setdefault("decompressors", {})
+    if dict_id not in decompressors:
+        decompressors[dict_id] = zstd.ZstdDecompressor(dict_data=_dictionary(dict_id) if dict_id else None)
+    return decompressors[dict_id].decompress(frame)
@@ -1,19 +1,50 @@
 from pydantic_settings import BaseSettings
-from typing import Optional
+from typing import Optional, List, Dict
 
 
 class Settings(BaseSettings):
     # 数据库配置
     DATABASE_URL: str = "sqlite:///./travel_planner.db"
+    # 异步数据库配置（可选），未设置 ASYNC_DATABASE_URL 时由 DATABASE_URL 推导
+    DATABASE_ASYNC: bool = False
+    ASYNC_DATABASE_URL: Optional[str] = None
+    # 连接池配置（SQLite不使用）
+    DB_POOL_SIZE: int = 5
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_TIMEOUT: int = 30
+    DB_POOL_RECYCLE: int = 1800
+    DB_POOL_PRE_PING: bool = True
+    # SQLite性能配置（每个连接建立时通过PRAGMA设置）
+    SQLITE_JOURNAL_MODE: str = "WAL"
+    SQLITE_SYNCHRONOUS: str = "NORMAL"
+    SQLITE_BUSY_TIMEOUT_MS: int = 5000
+    SQLITE_CACHE_SIZE: int = -64000  # 负数表示KiB，即约64MB
+    SQLITE_MMAP_SIZE: int = 268435456  # 256MB
+    SQLITE_TEMP_STORE: str = "MEMORY"
+    
+    # 应用日志级别（启动自检、迁移、后台任务等日志）
+    LOG_LEVEL: str = "INFO"
     
     # JWT配置
     SECRET_KEY: str = "your-secret-key-here-change-in-production"
     ALGORITHM: str = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 30
+    # 已认证用户缓存（秒），不会晚于令牌过期时间；设为0关闭
+    AUTH_CACHE_TTL_SECONDS: int = 60
+    AUTH_CACHE_MAX_ENTRIES: int = 10000
+    
+    # 密码哈希配置
+    BCRYPT_ROUNDS: int = 12
+    PASSWORD_HASH_WORKERS: int = 2
+    PASSWORD_HASH_MAX_QUEUE: int = 100  # 超过该排队数的登录/注册请求直接返回503
+    PASSWORD_HASH_USE_PROCESSES: bool = False  # 使用进程池以利用多核
     
     # 语音识别API配置
     SPEECH_API_KEY: Optional[str] = None
     SPEECH_API_SECRET: Optional[str] = None
+    SPEECH_CONNECT_TIMEOUT: float = 5.0
+    SPEECH_READ_TIMEOUT: float = 30.0
+    SPEECH_MAX_CONNECTIONS: int = 20
     
     # 地图API配置
     MAP_API_KEY: Optional[str] = None
@@ -21,6 +52,68 @@ class Settings(BaseSettings):
     # AI大模型API配置
     AI_API_KEY: Optional[str] = None
     AI_API_ENDPOINT: Optional[str] = None
+    LLM_PROVIDER: Optional[str] = None  # openai / dashscope，为空时根据 AI_API_ENDPOINT 自动判断
+    LLM_MODEL: Optional[str] = None  # 为空时使用提供方默认模型
+    # 备用提供方（JSON列表），按顺序用于故障转移和对冲请求，例如：
+    # [{"provider": "openai", "endpoint": "https://api.openai.com/v1/chat/completions", "api_key": "sk-xxx", "model": "gpt-3.5-turbo"}]
+    LLM_FALLBACK_PROVIDERS: List[Dict[str, str]] = []
+    # 熔断器：连续失败达到阈值后熔断，冷却结束后放行少量探测请求
+    LLM_PROVIDER_FAILURE_THRESHOLD: int = 3
+    LLM_PROVIDER_COOLDOWN_SECONDS: float = 30.0
+    LLM_CIRCUIT_HALF_OPEN_MAX_CALLS: int = 1
+    # 自适应并发限制（AIMD）：每个提供方的并发上限随延迟和错误自动调整
+    LLM_CONCURRENCY_INITIAL: int = 10
+    LLM_CONCURRENCY_MIN: int = 1
+    LLM_CONCURRENCY_MAX: int = 20  # 不应超过 LLM_MAX_CONNECTIONS
+    LLM_CONCURRENCY_LATENCY_TARGET: float = 30.0  # 超过此延迟视为过载，收缩并发上限
+    LLM_CONCURRENCY_QUEUE_TIMEOUT: float = 5.0  # 并发已满时最多等待多久
+    # 本地配额调度：按合同的每分钟请求数和token数限流，0表示不限制
+    LLM_RATE_LIMIT_RPM: int = 0
+    LLM_RATE_LIMIT_TPM: int = 0
+    LLM_RATE_LIMIT_MAX_WAIT: float = 30.0  # 等待配额的最长时间
+    # 重试：限流（429）和上游5xx按去相关抖动退避重试，优先遵循 Retry-After
+    LLM_RETRY_MAX_ATTEMPTS: int = 3  # 包括首次请求
+    LLM_RETRY_BASE_DELAY: float = 0.5
+    LLM_RETRY_MAX_DELAY: float = 20.0
+    LLM_REQUEST_DEADLINE: float = 90.0  # 单次生成（含重试）的整体时限
+    # 对冲请求：首选提供方超过延迟分位数仍未返回时，向备用提供方再发一次请求
+    LLM_HEDGE_ENABLED: bool = False
+    LLM_HEDGE_PERCENTILE: float = 0.95
+    LLM_HEDGE_DEFAULT_DELAY: float = 10.0  # 延迟样本不足时使用
+    LLM_HEDGE_MIN_DELAY: float = 1.0
+    
+    # AI服务HTTP客户端配置
+    LLM_HTTP2: bool = True
+    LLM_MAX_CONNECTIONS: int = 20
+    LLM_MAX_KEEPALIVE_CONNECTIONS: int = 10
+    LLM_KEEPALIVE_EXPIRY: float = 30.0
+    LLM_CONNECT_TIMEOUT: float = 5.0
+    LLM_READ_TIMEOUT: float = 60.0
+    LLM_WRITE_TIMEOUT: float = 10.0
+    LLM_POOL_TIMEOUT: float = 5.0
+    
+    # AI响应缓存配置
+    LLM_CACHE_BACKEND: str = "memory"  # memory / sqlite / none
+    LLM_CACHE_TTL_SECONDS: int = 86400
+    LLM_CACHE_MAX_ENTRIES: int = 1000
+    LLM_CACHE_PATH: str = "./llm_cache.db"  # 仅sqlite后端使用
+    
+    # 后台生成任务配置
+    GENERATION_JOB_WORKERS: int = 2  # 同时执行的生成任务数
+    GENERATION_JOB_MAX_PER_USER: int = 3  # 每个用户排队和执行中的任务上限
+    GENERATION_JOB_LEASE_SECONDS: int = 60  # 执行中任务的租约，执行者超过该时间未续期时任务重新排队
+
+    # 批量导入开销配置
+    EXPENSE_IMPORT_CHUNK_SIZE: int = 500  # 每个事务插入的行数
+    EXPENSE_IMPORT_MAX_ROWS: int = 10000  # 单次导入的最大行数
+
+    # 大字段压缩配置（计划详情、SQLite缓存中的AI响应）
+    COMPRESSION_CODEC: str = "zlib"  # zstd / zlib / none，zstd需要安装zstandard，未安装时使用zlib
+    COMPRESSION_MIN_BYTES: int = 256  # 短于该长度的值不压缩
+    COMPRESSION_ZLIB_LEVEL: int = 6
+    COMPRESSION_ZSTD_LEVEL: int = 9
+    COMPRESSION_ZSTD_DICT_DIR: str = "./zstd_dicts"  # 字典文件目录，更换字典后旧文件需保留
+    COMPRESSION_ZSTD_DICT_ID: int = 0  # 压缩使用的字典ID，0表示不使用字典
     
     class Config:
         env_file = ".env"
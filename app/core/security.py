@@ -1,9 +1,13 @@
+import asyncio
+import threading
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
 from passlib.context import CryptContext
 from passlib.exc import MissingBackendError
+from app.core.config import settings
 
 # 初始化密码上下文，添加错误处理
 try:
-    pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+    pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=settings.BCRYPT_ROUNDS)
 except MissingBackendError:
     # 如果bcrypt不可用，使用默认的方案
     pwd_context = CryptContext(schemes=["django_pbkdf2_sha256"], deprecated="auto")
@@ -19,4 +23,108 @@ def get_password_hash(password):
         return pwd_context.hash(password)
     except MissingBackendError:
         # 如果首选方案不可用，使用任何可用的方案
-        return pwd_context.hash(password, scheme=None)
\ No newline at end of file
+        return pwd_context.hash(password, scheme=None)
+
+
+class PasswordHasherBusy(Exception):
+    """
+    密码哈希队列已满
+    """
+
+
+class PasswordHasher:
+    """
+    专用的有界密码哈希执行器
+
+    bcrypt每次耗时数百毫秒，放在独立的线程池（或进程池，可利用多核）中执行，
+    不占用其他同步路由共用的线程池；排队数超过上限时直接拒绝
+    """
+
+    def __init__(self, workers: int, max_queue: int, use_processes: bool = False):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.use_processes = use_processes
+        self._executor = None
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.completed = 0
+        self.rejected = 0
+        self.max_queue_depth_seen = 0
+
+    def _get_executor(self) -> Executor:
+        # 延迟创建，避免进程池在导入阶段启动子进程
+        with self._lock:
+            if self._executor is None:
+                if self.use_processes:
+                    self._executor = ProcessPoolExecutor(max_workers=self.workers)
+                else:
+                    self._executor = ThreadPoolExecutor(
+                        max_workers=self.workers, thread_name_prefix="password-hash"
+                    )
+            return self._executor
+
+    async def run(self, func, *args):
+        """
+        在专用执行器中运行哈希函数
+
+        Raises:
+            PasswordHasherBusy: 排队数已达上限
+        """
+        with self._lock:
+            if self.in_flight >= self.workers + self.max_queue:
+                self.rejected += 1
+                raise PasswordHasherBusy("密码哈希服务繁忙，请稍后重试")
+            self.in_flight += 1
+            self.max_queue_depth_seen = max(self.max_queue_depth_seen, self.queue_depth)
+
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._get_executor(), func, *args)
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+                self.completed += 1
+
+    @property
+    def queue_depth(self) -> int:
+        """
+        等待空闲工作者的任务数
+        """
+        return max(0, self.in_flight - self.workers)
+
+    def stats(self) -> dict:
+        """
+        队列深度等运行指标
+        """
+        return {
+            "mode": "process" if self.use_processes else "thread",
+            "workers": self.workers,
+            "max_queue": self.max_queue,
+            "in_flight": self.in_flight,
+            "queue_depth": self.queue_depth,
+            "max_queue_depth_seen": self.max_queue_depth_seen,
+            "completed": self.completed,
+            "rejected": self.rejected,
+        }
+
+    def shutdown(self) -> None:
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+
+# 创建全局实例
+password_hasher = PasswordHasher(
+    workers=settings.PASSWORD_HASH_WORKERS,
+    max_queue=settings.PASSWORD_HASH_MAX_QUEUE,
+    use_processes=settings.PASSWORD_HASH_USE_PROCESSES
+)
+
+
+async def verify_password_async(plain_password, hashed_password):
+    return await password_hasher.run(verify_password, plain_password, hashed_password)
+
+
+async def get_password_hash_async(password):
+    return await password_hasher.run(get_password_hash, password)
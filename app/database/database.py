@@ -1,20 +1,153 @@
-from sqlalchemy import create_engine
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import create_engine, event
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from app.core.config import settings
 
+
+def _engine_options(url: str) -> dict:
+    """
+    根据数据库类型生成连接池参数
+    """
+    if url.startswith("sqlite"):
+        # SQLite不使用连接池大小等参数
+        return {}
+    return {
+        "pool_size": settings.DB_POOL_SIZE,
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+        "pool_timeout": settings.DB_POOL_TIMEOUT,
+        "pool_recycle": settings.DB_POOL_RECYCLE,
+        "pool_pre_ping": settings.DB_POOL_PRE_PING,
+    }
+
+
+def get_async_database_url() -> str:
+    """
+    获取异步引擎使用的数据库URL，未配置时由 DATABASE_URL 推导
+    """
+    if settings.ASYNC_DATABASE_URL:
+        return settings.ASYNC_DATABASE_URL
+    url = settings.DATABASE_URL
+    if url.startswith("sqlite:"):
+        return url.replace("sqlite:", "sqlite+aiosqlite:", 1)
+    if url.startswith("postgresql:") or url.startswith("postgres:"):
+        return "postgresql+asyncpg:" + url.split(":", 1)[1]
+    return url
+
+
+_SQLITE_JOURNAL_MODES = {"DELETE", "TRUNCATE", "PERSIST", "MEMORY", "WAL", "OFF"}
+_SQLITE_SYNCHRONOUS_MODES = {"OFF", "NORMAL", "FULL", "EXTRA"}
+_SQLITE_TEMP_STORES = {"DEFAULT", "FILE", "MEMORY"}
+
+
+def _sqlite_pragmas() -> dict:
+    """
+    根据配置生成需要在每个SQLite连接上设置的PRAGMA
+    """
+    journal_mode = settings.SQLITE_JOURNAL_MODE.upper()
+    synchronous = settings.SQLITE_SYNCHRONOUS.upper()
+    temp_store = settings.SQLITE_TEMP_STORE.upper()
+    if journal_mode not in _SQLITE_JOURNAL_MODES:
+        raise ValueError(f"无效的SQLITE_JOURNAL_MODE: {settings.SQLITE_JOURNAL_MODE}")
+    if synchronous not in _SQLITE_SYNCHRONOUS_MODES:
+        raise ValueError(f"无效的SQLITE_SYNCHRONOUS: {settings.SQLITE_SYNCHRONOUS}")
+    if temp_store not in _SQLITE_TEMP_STORES:
+        raise ValueError(f"无效的SQLITE_TEMP_STORE: {settings.SQLITE_TEMP_STORE}")
+    # busy_timeout 放在最前面，后续PRAGMA遇到锁时也会等待
+    return {
+        "busy_timeout": int(settings.SQLITE_BUSY_TIMEOUT_MS),
+        "journal_mode": journal_mode,
+        "synchronous": synchronous,
+        "cache_size": int(settings.SQLITE_CACHE_SIZE),
+        "mmap_size": int(settings.SQLITE_MMAP_SIZE),
+        "temp_store": temp_store,
+        # SQLite 默认不检查外键约束，需要在每个连接上开启
+        "foreign_keys": "ON",
+    }
+
+
+def _apply_sqlite_pragmas(dbapi_connection, connection_record):
+    """
+    连接建立时设置SQLite性能参数：WAL模式下读写互不阻塞，busy_timeout避免 database is locked
+    """
+    cursor = dbapi_connection.cursor()
+    try:
+        for name, value in _sqlite_pragmas().items():
+            cursor.execute(f"PRAGMA {name}={value}")
+    finally:
+        cursor.close()
+
+
 engine = create_engine(
     settings.DATABASE_URL,
-    connect_args={"check_same_thread": False}  # 仅用于SQLite
+    connect_args={"check_same_thread": False} if settings.DATABASE_URL.startswith("sqlite") else {},  # 仅用于SQLite
+    **_engine_options(settings.DATABASE_URL)
 )
+if settings.DATABASE_URL.startswith("sqlite"):
+    event.listen(engine, "connect", _apply_sqlite_pragmas)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# 可选的异步引擎（DATABASE_ASYNC=true 时启用）
+async_engine = None
+AsyncSessionLocal = None
+if settings.DATABASE_ASYNC:
+    from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+    _async_url = get_async_database_url()
+    async_engine = create_async_engine(_async_url, **_engine_options(_async_url))
+    if _async_url.startswith("sqlite"):
+        event.listen(async_engine.sync_engine, "connect", _apply_sqlite_pragmas)
+    AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
 Base = declarative_base()
 
 
+def check_sqlite_pragmas() -> dict:
+    """
+    启动自检：读取当前连接实际生效的PRAGMA
+
+    Returns:
+        {PRAGMA名: 实际值}；非SQLite数据库返回空字典
+    """
+    if not settings.DATABASE_URL.startswith("sqlite"):
+        return {}
+    effective = {}
+    with engine.connect() as connection:
+        for name in _sqlite_pragmas():
+            effective[name] = connection.exec_driver_sql(f"PRAGMA {name}").scalar()
+    return effective
+
+
 def get_db():
     db = SessionLocal()
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+
+async def get_async_db():
+    """
+    异步会话依赖，需要 DATABASE_ASYNC=true
+    """
+    if AsyncSessionLocal is None:
+        raise RuntimeError("异步数据库未启用，请设置 DATABASE_ASYNC=true")
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+async def run_in_session(func, *args, **kwargs):
+    """
+    在工作线程中使用短生命周期的会话执行阻塞的数据库操作
+
+    供async路由使用：数据库I/O不占用事件循环，调用结束后立即归还连接，
+    避免在等待AI服务等长耗时操作期间一直占用会话
+    """
+    def _call():
+        db = SessionLocal()
+        try:
+            return func(db, *args, **kwargs)
+        finally:
+            db.close()
+
+    return await run_in_threadpool(_call)
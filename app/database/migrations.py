@@ -0,0 +1,691 @@
+import json
+import logging
+import re
+from contextlib import contextmanager
+from datetime import date, datetime
+from typing import Callable, List, Optional, Tuple
+from sqlalchemy import (
+    Column, Date, DateTime, Float, Index, Integer, LargeBinary, MetaData, String, Table, Text, exists, func,
+    inspect, select, text
+)
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+from app.core import compression
+from app.database import database
+
+logger = logging.getLogger(__name__)
+
+# 分批回填时每批处理的行数，每批单独提交
+BACKFILL_BATCH_SIZE = 500
+
+# PostgreSQL 上防止多个进程同时执行迁移的 advisory lock 编号
+_MIGRATION_LOCK_ID = 7342019
+
+_version_metadata = MetaData()
+
+schema_version = Table(
+    "schema_version",
+    _version_metadata,
+    Column("version", Integer, primary_key=True),
+    Column("name", String, nullable=False),
+    Column("applied_at", DateTime, nullable=False),
+)
+
+# 迁移之前最后一版模型由 create_all 建立的表结构，由第1步创建。
+# 这里的定义已经冻结，不随模型变化：之后的表、列和索引都由各自的迁移步骤添加，
+# 迁移也不引用ORM模型和服务层，保证任何时候从空库执行都得到相同的结果
+_baseline_metadata = MetaData()
+
+Table(
+    "users",
+    _baseline_metadata,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("username", String, unique=True, index=True),
+    Column("email", String, unique=True, index=True),
+    Column("hashed_password", String),
+    Column("created_at", DateTime(timezone=True), server_default=func.now()),
+)
+
+_travel_plans = Table(
+    "travel_plans",
+    _baseline_metadata,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("user_id", Integer),
+    Column("title", String),
+    Column("destination", String),
+    Column("start_date", DateTime),
+    Column("end_date", DateTime),
+    Column("budget", Float),
+    Column("preferences", Text),
+    Column("details", Text),
+    Column("created_at", DateTime(timezone=True), server_default=func.now()),
+    Column("updated_at", DateTime(timezone=True)),
+    Index("ix_travel_plans_user_created", "user_id", "created_at", "id"),
+)
+
+_expenses = Table(
+    "expenses",
+    _baseline_metadata,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("user_id", Integer),
+    Column("plan_id", Integer),
+    Column("category", String),
+    Column("amount", Float),
+    Column("description", String),
+    Column("expense_date", DateTime),
+    Column("created_at", DateTime(timezone=True), server_default=func.now()),
+    Index("ix_expenses_user_created", "user_id", "created_at", "id"),
+    Index("ix_expenses_user_plan_created", "user_id", "plan_id", "created_at", "id"),
+    Index("ix_expenses_plan_category_amount", "plan_id", "category", "amount"),
+    Index("ix_expenses_plan_date", "plan_id", "expense_date", "amount"),
+)
+
+Table(
+    "generation_jobs",
+    _baseline_metadata,
+    Column("id", String, primary_key=True, index=True),
+    Column("user_id", Integer),
+    Column("status", String),
+    Column("destination", String),
+    Column("start_date", DateTime),
+    Column("end_date", DateTime),
+    Column("budget", Float),
+    Column("preferences", Text),
+    Column("travelers", Integer),
+    Column("plan_id", Integer, nullable=True),
+    Column("error", Text, nullable=True),
+    Column("created_at", DateTime(timezone=True), server_default=func.now()),
+    Column("started_at", DateTime(timezone=True), nullable=True),
+    Column("finished_at", DateTime(timezone=True), nullable=True),
+    Index("ix_generation_jobs_user_status", "user_id", "status"),
+    Index("ix_generation_jobs_status_created", "status", "created_at"),
+)
+
+Table(
+    "itinerary_days",
+    _baseline_metadata,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("plan_id", Integer),
+    Column("day_number", Integer),
+    Column("date", Date, nullable=True),
+    Column("title", String, nullable=True),
+    Index("ix_itinerary_days_plan_day", "plan_id", "day_number"),
+)
+
+Table(
+    "itinerary_activities",
+    _baseline_metadata,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("plan_id", Integer),
+    Column("day_id", Integer, index=True),
+    Column("position", Integer),
+    Column("time", String, nullable=True),
+    Column("title", String),
+    Column("location", String, nullable=True),
+    Column("description", Text, nullable=True),
+    Column("estimated_cost", Float, nullable=True),
+    Index("ix_itinerary_activities_plan_position", "plan_id", "position"),
+)
+
+_plan_budget_rollup = Table(
+    "plan_budget_rollup",
+    _baseline_metadata,
+    Column("plan_id", Integer, primary_key=True),
+    Column("total_spent", Float),
+    Column("expense_count", Integer),
+    Column("category_totals", Text),
+    Column("daily_totals", Text),
+    Column("updated_at", DateTime),
+)
+
+# 以下是第4、6步写入检索表时的分词规则和表结构，同样冻结自当时的 search_index；
+# 检索规则变化时应新增迁移重建检索表，而不是修改这里
+_SEARCH_TABLE = "plan_search"
+_CJK = "\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff"
+_CJK_RUN = re.compile(f"[{_CJK}]+")
+_WORD = re.compile(f"[{_CJK}]+|[^\\W_{_CJK}]+")
+_POSTGRES_SEARCH_DDL = (
+    f"CREATE TABLE IF NOT EXISTS {_SEARCH_TABLE} "
+    "(plan_id INTEGER PRIMARY KEY, user_id INTEGER NOT NULL, document TSVECTOR NOT NULL)",
+    f"CREATE INDEX IF NOT EXISTS ix_{_SEARCH_TABLE}_document ON {_SEARCH_TABLE} USING GIN (document)",
+    f"CREATE INDEX IF NOT EXISTS ix_{_SEARCH_TABLE}_user ON {_SEARCH_TABLE} (user_id)",
+)
+_POSTGRES_SEARCH_DOCUMENT = (
+    "setweight(to_tsvector('simple', :title), 'A') || setweight(to_tsvector('simple', :destination), 'B') || "
+    "setweight(to_tsvector('simple', :details), 'C') || setweight(to_tsvector('simple', :chars), 'D')"
+)
+
+# 预算汇总中未填写类别的开销归入此类
+_DEFAULT_CATEGORY = "其他"
+
+# (版本号, 名称, 迁移函数)，按版本号递增排列
+MIGRATIONS: List[Tuple[int, str, Callable[["MigrationContext"], None]]] = []
+
+
+class SchemaVersionError(RuntimeError):
+    """
+    数据库结构版本落后于代码
+    """
+
+
+def migration(version: int, name: str):
+    """
+    注册迁移步骤
+
+    迁移中的每个操作都必须可以重复执行：全新数据库上第1步按冻结的表结构建表，
+    后续步骤再执行时应当跳过已经存在的表、索引和列；中途失败后重新运行也会从头执行未记录的步骤
+    """
+    def register(func):
+        MIGRATIONS.append((version, name, func))
+        return func
+    return register
+
+
+class MigrationContext:
+    """
+    迁移步骤可使用的在线安全操作
+
+    - PostgreSQL 上使用 CREATE/DROP INDEX CONCURRENTLY，建索引期间不阻塞写入
+    - SQLite 没有在线建索引，建索引期间会持有写锁，大表应在低峰期执行
+    - 数据回填分批提交，不在一个长事务中锁住整张表
+    """
+
+    def __init__(self, engine: Engine):
+        self.engine = engine
+        self.dialect = engine.dialect.name
+
+    @property
+    def is_postgres(self) -> bool:
+        return self.dialect == "postgresql"
+
+    def create_tables(self, *tables: Table) -> None:
+        """
+        创建尚不存在的表（连同表上定义的索引），已存在的表不做修改
+        """
+        for table in tables:
+            table.create(bind=self.engine, checkfirst=True)
+
+    def create_index(self, name: str, table: str, *columns: str) -> None:
+        """
+        创建索引，已存在时跳过
+        """
+        ddl = f"INDEX IF NOT EXISTS {name} ON {table} ({', '.join(columns)})"
+        if self.is_postgres:
+            with self._autocommit() as connection:
+                # 失败的并发建索引会留下无效索引，IF NOT EXISTS 会误以为已完成，需要先删除
+                valid = connection.execute(
+                    text(
+                        "SELECT i.indisvalid FROM pg_class c JOIN pg_index i ON i.indexrelid = c.oid "
+                        "WHERE c.relname = :name"
+                    ),
+                    {"name": name}
+                ).scalar()
+                if valid is False:
+                    connection.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {name}"))
+                connection.execute(text(f"CREATE {ddl.replace('INDEX', 'INDEX CONCURRENTLY', 1)}"))
+            return
+        if self.dialect == "sqlite":
+            with self.engine.begin() as connection:
+                connection.execute(text(f"CREATE {ddl}"))
+            return
+        if name not in self._index_names(table):
+            with self.engine.begin() as connection:
+                connection.execute(text(f"CREATE INDEX {name} ON {table} ({', '.join(columns)})"))
+
+    def drop_index(self, name: str, table: str) -> None:
+        """
+        删除索引，不存在时跳过
+        """
+        if self.is_postgres:
+            with self._autocommit() as connection:
+                connection.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {name}"))
+            return
+        if self.dialect == "sqlite":
+            with self.engine.begin() as connection:
+                connection.execute(text(f"DROP INDEX IF EXISTS {name}"))
+            return
+        if name in self._index_names(table):
+            with self.engine.begin() as connection:
+                connection.execute(text(f"DROP INDEX {name} ON {table}"))
+
+    def add_column(self, table: str, column: Column) -> None:
+        """
+        添加可为空且没有默认值的列，已存在时跳过；这类变更在 PostgreSQL 和 SQLite 上都只修改元数据
+        """
+        if not column.nullable or column.server_default is not None:
+            raise ValueError("在线迁移只能添加可为空且没有默认值的列，数据请通过 backfill 分批回填")
+        existing = {item["name"] for item in inspect(self.engine).get_columns(table)}
+        if column.name in existing:
+            return
+        column_type = column.type.compile(dialect=self.engine.dialect)
+        with self.engine.begin() as connection:
+            connection.execute(text(f"ALTER TABLE {table} ADD COLUMN {column.name} {column_type}"))
+
+    def drop_column(self, table: str, name: str) -> None:
+        """
+        删除列，不存在时跳过；PostgreSQL 上只修改元数据，SQLite 会重写整张表并持有写锁，大表应在低峰期执行
+        """
+        existing = {item["name"] for item in inspect(self.engine).get_columns(table)}
+        if name not in existing:
+            return
+        with self.engine.begin() as connection:
+            connection.execute(text(f"ALTER TABLE {table} DROP COLUMN {name}"))
+
+    def backfill(self, step: Callable[[Session, Optional[int], int], Optional[int]],
+                 batch_size: int = BACKFILL_BATCH_SIZE) -> None:
+        """
+        分批回填数据
+
+        Args:
+            step: step(会话, 上一批最后处理的键, 批大小)，处理一批并返回本批最后的键，没有数据时返回None
+            batch_size: 每批的行数
+        """
+        after = None
+        batches = 0
+        while True:
+            with Session(self.engine) as session:
+                after = step(session, after, batch_size)
+                session.commit()
+            if after is None:
+                break
+            batches += 1
+        logger.info(f"回填完成，共 {batches} 批")
+
+    @contextmanager
+    def _autocommit(self):
+        with self.engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+            yield connection
+
+    def _index_names(self, table: str):
+        return {item["name"] for item in inspect(self.engine).get_indexes(table)}
+
+
+@migration(1, "baseline")
+def _baseline(ctx: MigrationContext):
+    # 引入迁移之前由 create_all 建立的数据库已有这些表，只补建缺少的表
+    ctx.create_tables(*_baseline_metadata.sorted_tables)
+
+
+@migration(2, "composite_indexes")
+def _composite_indexes(ctx: MigrationContext):
+    # 先建新索引再删除被取代的单列索引，查询在整个过程中都有索引可用
+    ctx.create_index("ix_travel_plans_user_created", "travel_plans", "user_id", "created_at", "id")
+    ctx.create_index("ix_expenses_user_created", "expenses", "user_id", "created_at", "id")
+    ctx.create_index("ix_expenses_user_plan_created", "expenses", "user_id", "plan_id", "created_at", "id")
+    ctx.create_index("ix_expenses_plan_category_amount", "expenses", "plan_id", "category", "amount")
+    ctx.create_index("ix_expenses_plan_date", "expenses", "plan_id", "expense_date", "amount")
+    ctx.create_index("ix_generation_jobs_user_status", "generation_jobs", "user_id", "status")
+    ctx.create_index("ix_generation_jobs_status_created", "generation_jobs", "status", "created_at")
+    ctx.create_index("ix_itinerary_days_plan_day", "itinerary_days", "plan_id", "day_number")
+    ctx.create_index("ix_itinerary_activities_plan_position", "itinerary_activities", "plan_id", "position")
+
+    ctx.drop_index("ix_travel_plans_user_id", "travel_plans")
+    ctx.drop_index("ix_travel_plans_title", "travel_plans")
+    ctx.drop_index("ix_expenses_user_id", "expenses")
+    ctx.drop_index("ix_expenses_plan_id", "expenses")
+    ctx.drop_index("ix_generation_jobs_user_id", "generation_jobs")
+    ctx.drop_index("ix_generation_jobs_status", "generation_jobs")
+    ctx.drop_index("ix_itinerary_days_plan_id", "itinerary_days")
+    ctx.drop_index("ix_itinerary_activities_plan_id", "itinerary_activities")
+
+
+@migration(3, "backfill_budget_rollup")
+def _backfill_budget_rollup(ctx: MigrationContext):
+    plans, expenses, rollup = _travel_plans, _expenses, _plan_budget_rollup
+
+    def totals(rows):
+        result = {}
+        for key, total, count in rows:
+            item = result.setdefault(key, {"total": 0.0, "count": 0})
+            item["total"] = round(item["total"] + (total or 0.0), 2)
+            item["count"] += count
+        return result
+
+    def step(session: Session, after: Optional[int], limit: int) -> Optional[int]:
+        query = select(plans.c.id).where(
+            ~exists().where(rollup.c.plan_id == plans.c.id)
+        ).order_by(plans.c.id).limit(limit)
+        if after is not None:
+            query = query.where(plans.c.id > after)
+        plan_ids = session.execute(query).scalars().all()
+        for plan_id in plan_ids:
+            day = func.date(expenses.c.expense_date)
+            categories = totals(
+                (category or _DEFAULT_CATEGORY, total, count)
+                for category, total, count in session.execute(
+                    select(expenses.c.category, func.sum(expenses.c.amount), func.count())
+                    .where(expenses.c.plan_id == plan_id).group_by(expenses.c.category)
+                )
+            )
+            daily = totals(
+                (_day_key(value), total, count)
+                for value, total, count in session.execute(
+                    select(day, func.sum(expenses.c.amount), func.count())
+                    .where(expenses.c.plan_id == plan_id).group_by(day)
+                )
+            )
+            session.execute(rollup.insert().values(
+                plan_id=plan_id,
+                total_spent=round(sum(item["total"] for item in categories.values()), 2),
+                expense_count=sum(item["count"] for item in categories.values()),
+                category_totals=json.dumps(categories, ensure_ascii=False),
+                daily_totals=json.dumps(daily, ensure_ascii=False),
+                updated_at=datetime.utcnow()
+            ))
+        return plan_ids[-1] if plan_ids else None
+
+    ctx.backfill(step)
+
+
+@migration(4, "plan_search_index")
+def _plan_search_index(ctx: MigrationContext):
+    if ctx.dialect == "sqlite":
+        ddl = (
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {_SEARCH_TABLE} "
+            "USING fts5(owner, title, destination, details, chars, tokenize = 'unicode61')",
+        )
+    elif ctx.is_postgres:
+        ddl = _POSTGRES_SEARCH_DDL
+    else:
+        return
+    with ctx.engine.begin() as connection:
+        for statement in ddl:
+            connection.execute(text(statement))
+
+    def step(session: Session, after: Optional[int], limit: int) -> Optional[int]:
+        # 按计划ID分批重建索引行，重复执行会覆盖已有的行
+        rows = _searchable_plans(session.connection(), after or 0, limit)
+        for row in rows:
+            values = _search_document(row)
+            if ctx.is_postgres:
+                session.execute(
+                    text(
+                        f"INSERT INTO {_SEARCH_TABLE} (plan_id, user_id, document) "
+                        f"VALUES (:plan_id, :user_id, {_POSTGRES_SEARCH_DOCUMENT}) "
+                        "ON CONFLICT (plan_id) DO UPDATE SET user_id = excluded.user_id, document = excluded.document"
+                    ),
+                    values
+                )
+                continue
+            # 这一版检索表保存正文，可以按 rowid 删除旧行后重新写入
+            session.execute(text(f"DELETE FROM {_SEARCH_TABLE} WHERE rowid = :plan_id"), values)
+            session.execute(
+                text(
+                    f"INSERT INTO {_SEARCH_TABLE} (rowid, owner, title, destination, details, chars) "
+                    "VALUES (:plan_id, :owner, :title, :destination, :details, :chars)"
+                ),
+                values
+            )
+        return rows[-1][0] if rows else None
+
+    ctx.backfill(step)
+
+
+@migration(5, "compressed_details")
+def _compressed_details(ctx: MigrationContext):
+    # 这一步原先在 PostgreSQL 上把 details 改为 BYTEA，修改列类型会重写整张表并在期间持有排他锁，
+    # 改为由第8、9步添加新列、分批回填后删除旧列。已经执行过原步骤的数据库 details 是BYTEA，
+    # 第8步同样可以回填
+    pass
+
+
+@migration(6, "contentless_plan_search")
+def _contentless_plan_search(ctx: MigrationContext):
+    # 第4步建立的 SQLite 检索表保存了一份未压缩的分词正文，改为只保存索引的无内容表。
+    # 第4步的回填按当时的写入方式执行，在无内容表上中断重跑可能留下重复的行，
+    # 因此不修改已有的检索表：在新表中分批建好索引，再用一个短事务删除旧表并把新表改名。
+    # 建索引期间旧版本继续写入旧表，计划表上的触发器记录这期间变化的计划，切换时在新表中补齐
+    if ctx.dialect != "sqlite":
+        return
+    shadow, changes = f"{_SEARCH_TABLE}_new", f"{_SEARCH_TABLE}_changes"
+    with ctx.engine.begin() as connection:
+        # 上次中断留下的新表和变更记录作废，从头重建
+        _drop_search_triggers(connection)
+        connection.execute(text(f"DROP TABLE IF EXISTS {shadow}"))
+        connection.execute(text(f"DROP TABLE IF EXISTS {changes}"))
+        connection.execute(text(
+            f"CREATE VIRTUAL TABLE {shadow} "
+            "USING fts5(owner, title, destination, details, chars, content = '', tokenize = 'unicode61')"
+        ))
+        # 无内容表删除词元时需要写入时的原值，触发器保存计划第一次变化之前的检索字段
+        connection.execute(text(
+            f"CREATE TABLE {changes} (plan_id INTEGER PRIMARY KEY, user_id INTEGER, "
+            "title TEXT, destination TEXT, details BLOB)"
+        ))
+        connection.execute(text(
+            f"CREATE TRIGGER {changes}_insert AFTER INSERT ON travel_plans "
+            f"BEGIN INSERT OR IGNORE INTO {changes} (plan_id) VALUES (NEW.id); END"
+        ))
+        for action in ("update", "delete"):
+            connection.execute(text(
+                f"CREATE TRIGGER {changes}_{action} AFTER {action.upper()} ON travel_plans "
+                f"BEGIN INSERT OR IGNORE INTO {changes} VALUES "
+                "(OLD.id, OLD.user_id, OLD.title, OLD.destination, OLD.details); END"
+            ))
+
+    def insert(connection, row):
+        connection.execute(
+            text(
+                f"INSERT INTO {shadow} (rowid, owner, title, destination, details, chars) "
+                "VALUES (:plan_id, :owner, :title, :destination, :details, :chars)"
+            ),
+            _search_document(row)
+        )
+
+    def step(session: Session, after: Optional[int], limit: int) -> Optional[int]:
+        connection = session.connection()
+        rows = _searchable_plans(connection, after or 0, limit)
+        if not rows:
+            return None
+        # 已经变化过的计划在切换时按最新的值写入
+        changed = set(connection.execute(
+            text(f"SELECT plan_id FROM {changes} WHERE plan_id BETWEEN :first AND :last"),
+            {"first": rows[0][0], "last": rows[-1][0]}
+        ).scalars())
+        for row in rows:
+            if row[0] not in changed:
+                insert(connection, row)
+        return rows[-1][0]
+
+    ctx.backfill(step)
+
+    with ctx.engine.begin() as connection:
+        logged = connection.execute(
+            text(f"SELECT plan_id, user_id, title, destination, details FROM {changes}")
+        ).all()
+        for plan_id, user_id, title, destination, details in logged:
+            # 写入新表之后才变化的计划，按触发器保存的原值删除旧词元
+            indexed = connection.execute(
+                text(f"SELECT rowid FROM {shadow} WHERE rowid = :plan_id"), {"plan_id": plan_id}
+            ).first()
+            if indexed is not None:
+                connection.execute(
+                    text(
+                        f"INSERT INTO {shadow} ({shadow}, rowid, owner, title, destination, details, chars) "
+                        "VALUES ('delete', :plan_id, :owner, :title, :destination, :details, :chars)"
+                    ),
+                    _search_document(
+                        (plan_id, user_id, title, destination, compression.decompress_text(details))
+                    )
+                )
+            for row in _searchable_plans(connection, 0, 1, plan_id=plan_id):
+                insert(connection, row)
+        _drop_search_triggers(connection)
+        connection.execute(text(f"DROP TABLE {changes}"))
+        connection.execute(text(f"DROP TABLE IF EXISTS {_SEARCH_TABLE}"))
+        connection.execute(text(f"ALTER TABLE {shadow} RENAME TO {_SEARCH_TABLE}"))
+
+
+@migration(7, "generation_job_lease")
+def _generation_job_lease(ctx: MigrationContext):
+    # 执行中的任务记录执行者和续期时间；已有的 running 任务没有续期时间，视为租约已过期
+    ctx.add_column("generation_jobs", Column("worker_id", String, nullable=True))
+    ctx.add_column("generation_jobs", Column("heartbeat_at", DateTime(timezone=True), nullable=True))
+
+
+@migration(8, "details_compressed")
+def _details_compressed(ctx: MigrationContext):
+    # 压缩后的详情写入新的 BYTEA 列，添加可为空的列只修改元数据；
+    # 回填期间旧版本仍读写 details，新版本读取 details_compressed，为空时回退到 details
+    ctx.add_column("travel_plans", Column("details_compressed", LargeBinary, nullable=True))
+    ctx.backfill(_copy_details)
+
+
+@migration(9, "drop_legacy_details")
+def _drop_legacy_details(ctx: MigrationContext):
+    # 补齐第8步回填之后旧版本写入的详情，再删除旧列。
+    # 滚动发布期间旧版本可能仍在运行，删除后补一个空的同名 BYTEA 列，旧版本的写入不会失败，
+    # 新版本在 details_compressed 为空时回退读取该列；下一个版本去掉回退读取后再删除
+    ctx.backfill(_copy_details)
+    ctx.drop_column("travel_plans", "details")
+    ctx.add_column("travel_plans", Column("details", LargeBinary, nullable=True))
+
+
+def _copy_details(session: Session, after: Optional[int], limit: int) -> Optional[int]:
+    """
+    把一批尚未迁移的 details 压缩后写入 details_compressed，已带压缩标记的值原样复制
+    """
+    rows = session.execute(
+        text(
+            "SELECT id, details FROM travel_plans "
+            "WHERE id > :after AND details_compressed IS NULL AND details IS NOT NULL ORDER BY id LIMIT :limit"
+        ),
+        {"after": after or 0, "limit": limit}
+    ).all()
+    for plan_id, stored in rows:
+        stored = bytes(stored) if isinstance(stored, memoryview) else stored
+        if compression.stored_codec(stored) == "text":
+            stored = compression.compress_text(compression.decompress_text(stored))
+        # 只写入仍为空的行，回填期间新版本已经写入的值不会被覆盖
+        session.execute(
+            text("UPDATE travel_plans SET details_compressed = :value WHERE id = :id AND details_compressed IS NULL"),
+            {"id": plan_id, "value": stored}
+        )
+    return rows[-1][0] if rows else None
+
+
+def _drop_search_triggers(connection) -> None:
+    changes = f"{_SEARCH_TABLE}_changes"
+    for action in ("insert", "update", "delete"):
+        connection.execute(text(f"DROP TRIGGER IF EXISTS {changes}_{action}"))
+
+
+def _day_key(value) -> str:
+    # SQLite 的 date() 返回字符串，PostgreSQL 返回日期
+    if value is None:
+        return ""
+    return value.isoformat() if isinstance(value, date) else str(value)[:10]
+
+
+def _searchable_plans(connection, after: int, limit: int, plan_id: Optional[int] = None):
+    """
+    读取一批计划的检索字段：(计划ID, 用户ID, 标题, 目的地, 详情)，详情已解压；指定 plan_id 时只读取该计划
+    """
+    plans = _travel_plans
+    query = select(plans.c.id, plans.c.user_id, plans.c.title, plans.c.destination, plans.c.details)
+    if plan_id is not None:
+        query = query.where(plans.c.id == plan_id)
+    rows = connection.execute(query.where(plans.c.id > after).order_by(plans.c.id).limit(limit)).all()
+    return [(plan_id, user_id, title, destination, compression.decompress_text(details))
+            for plan_id, user_id, title, destination, details in rows]
+
+
+def _search_tokens(value: Optional[str]) -> str:
+    tokens = []
+    for word in _WORD.findall(value or ""):
+        if _CJK_RUN.fullmatch(word):
+            if len(word) == 1:
+                tokens.append(word)
+            else:
+                tokens.extend(word[i:i + 2] for i in range(len(word) - 1))
+        else:
+            tokens.append(word.lower())
+    return " ".join(tokens)
+
+
+def _search_document(row) -> dict:
+    plan_id, user_id, title, destination, details = row
+    return {
+        "plan_id": plan_id,
+        "user_id": user_id,
+        "owner": f"u{user_id}",
+        "title": _search_tokens(title),
+        "destination": _search_tokens(destination),
+        "details": _search_tokens(details),
+        "chars": " ".join(sorted(set("".join(_CJK_RUN.findall(f"{title} {destination} {details}"))))),
+    }
+
+
+def latest_version() -> int:
+    return MIGRATIONS[-1][0]
+
+
+def get_schema_version(engine: Optional[Engine] = None) -> int:
+    """
+    读取数据库当前的结构版本，还没有执行过迁移时返回0
+    """
+    engine = engine or database.engine
+    if not inspect(engine).has_table(schema_version.name):
+        return 0
+    with engine.connect() as connection:
+        return connection.execute(select(func.max(schema_version.c.version))).scalar() or 0
+
+
+def verify_schema(engine: Optional[Engine] = None) -> int:
+    """
+    启动时检查数据库结构版本，只读取版本号，不检查或修改表结构
+
+    Raises:
+        SchemaVersionError: 数据库版本落后于代码
+    """
+    current = get_schema_version(engine)
+    latest = latest_version()
+    if current < latest:
+        raise SchemaVersionError(
+            f"数据库结构版本为 {current}，当前代码需要 {latest}，请先运行 python init_db.py 执行迁移"
+        )
+    if current > latest:
+        # 滚动发布时新版本可能已经完成迁移，旧版本继续运行
+        logger.warning(f"数据库结构版本 {current} 高于当前代码的版本 {latest}")
+    return current
+
+
+def migrate(engine: Optional[Engine] = None) -> List[int]:
+    """
+    依次执行尚未执行的迁移
+
+    Returns:
+        本次执行的迁移版本号
+    """
+    engine = engine or database.engine
+    _version_metadata.create_all(bind=engine)
+    applied = []
+    with _migration_lock(engine):
+        with engine.connect() as connection:
+            done = set(connection.execute(select(schema_version.c.version)).scalars())
+        ctx = MigrationContext(engine)
+        for version, name, step in sorted(MIGRATIONS, key=lambda item: item[0]):
+            if version in done:
+                continue
+            logger.info(f"执行数据库迁移 {version}: {name}")
+            step(ctx)
+            with engine.begin() as connection:
+                connection.execute(schema_version.insert().values(
+                    version=version, name=name, applied_at=datetime.utcnow()
+                ))
+            applied.append(version)
+    return applied
+
+
+@contextmanager
+def _migration_lock(engine: Engine):
+    if engine.dialect.name != "postgresql":
+        # SQLite 部署通常只有一个实例，由部署流程保证同一时间只运行一个迁移
+        yield
+        return
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+        connection.execute(text("SELECT pg_advisory_lock(:id)"), {"id": _MIGRATION_LOCK_ID})
+        try:
+            yield
+        finally:
+            connection.execute(text("SELECT pg_advisory_unlock(:id)"), {"id": _MIGRATION_LOCK_ID})
@@ -0,0 +1,210 @@
+import re
+from typing import Iterable, List, Optional, Tuple
+from sqlalchemy import event, inspect, select, text
+
+# 计划全文检索表，不属于ORM模型，由本模块建表并在计划写入时同步
+SEARCH_TABLE = "plan_search"
+
+# 参与检索的字段，任一字段变化时重建该计划的索引行
+SEARCHABLE_COLUMNS = ("user_id", "title", "destination", "details")
+
+# 中日韩文字（汉字、假名、韩文）
+_CJK = "\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff"
+_CJK_RUN = re.compile(f"[{_CJK}]+")
+# 连续的中日韩文字，或由字母数字组成的词
+_WORD = re.compile(f"[{_CJK}]+|[^\\W_{_CJK}]+")
+
+_SQLITE_DDL = (
+    # 各文本列写入分词后以空格分隔的词元；owner 用于限定用户，chars 保存出现过的单个汉字以支持单字检索。
+    # 无内容表（content=''）只保存倒排索引，不再保存一份未压缩的正文；删除时需要提供写入时的原值
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} "
+    "USING fts5(owner, title, destination, details, chars, content = '', tokenize = 'unicode61')",
+)
+
+_POSTGRES_DDL = (
+    f"CREATE TABLE IF NOT EXISTS {SEARCH_TABLE} "
+    "(plan_id INTEGER PRIMARY KEY, user_id INTEGER NOT NULL, document TSVECTOR NOT NULL)",
+    f"CREATE INDEX IF NOT EXISTS ix_{SEARCH_TABLE}_document ON {SEARCH_TABLE} USING GIN (document)",
+    f"CREATE INDEX IF NOT EXISTS ix_{SEARCH_TABLE}_user ON {SEARCH_TABLE} (user_id)",
+)
+
+# 标题、目的地、详情、单字的权重依次为 A、B、C、D
+_POSTGRES_DOCUMENT = (
+    "setweight(to_tsvector('simple', :title), 'A') || setweight(to_tsvector('simple', :destination), 'B') || "
+    "setweight(to_tsvector('simple', :details), 'C') || setweight(to_tsvector('simple', :chars), 'D')"
+)
+
+
+def supports(dialect: str) -> bool:
+    return dialect in ("sqlite", "postgresql")
+
+
+def tokenize(value: Optional[str]) -> List[str]:
+    """
+    把文本切分为检索词元：中日韩文字按相邻两字切分（北京市 -> 北京 京市），其他文字按词切分并转为小写
+
+    SQLite 的 unicode61 和 PostgreSQL 的 simple 分词器都不会切分连续的汉字，
+    因此写入索引和构造查询时都先用这里的规则切分，再以空格连接交给数据库
+    """
+    tokens = []
+    for word in _WORD.findall(value or ""):
+        if _CJK_RUN.fullmatch(word):
+            if len(word) == 1:
+                tokens.append(word)
+            else:
+                tokens.extend(word[i:i + 2] for i in range(len(word) - 1))
+        else:
+            tokens.append(word.lower())
+    return tokens
+
+
+def query_terms(value: Optional[str]) -> List[str]:
+    """
+    把检索输入切分为检索词，标点和空白都作为分隔
+    """
+    return [word.lower() for word in _WORD.findall(value or "")]
+
+
+def is_single_char(term: str) -> bool:
+    # 单个汉字无法组成两字词元，改为匹配 chars 列
+    return len(term) == 1 and bool(_CJK_RUN.fullmatch(term))
+
+
+def owner_token(user_id: int) -> str:
+    return f"u{user_id}"
+
+
+def create_search_index(connection) -> None:
+    """
+    创建全文检索表，已存在时跳过；不支持的数据库不做处理
+    """
+    dialect = connection.dialect.name
+    statements = _SQLITE_DDL if dialect == "sqlite" else _POSTGRES_DDL if dialect == "postgresql" else ()
+    for statement in statements:
+        connection.execute(text(statement))
+
+
+def index_plans(connection, rows: Iterable[Tuple[int, int, Optional[str], Optional[str], Optional[str]]]) -> None:
+    """
+    写入计划的索引行；SQLite 上调用前需先用 remove_plans 删除旧行
+
+    Args:
+        connection: 与计划写入相同事务的连接
+        rows: (计划ID, 用户ID, 标题, 目的地, 详情) 序列
+    """
+    dialect = connection.dialect.name
+    if not supports(dialect):
+        return
+    for row in rows:
+        values = _document(row)
+        if dialect == "sqlite":
+            connection.execute(
+                text(
+                    f"INSERT INTO {SEARCH_TABLE} (rowid, owner, title, destination, details, chars) "
+                    "VALUES (:plan_id, :owner, :title, :destination, :details, :chars)"
+                ),
+                values
+            )
+        else:
+            connection.execute(
+                text(
+                    f"INSERT INTO {SEARCH_TABLE} (plan_id, user_id, document) "
+                    f"VALUES (:plan_id, :user_id, {_POSTGRES_DOCUMENT}) "
+                    "ON CONFLICT (plan_id) DO UPDATE SET user_id = excluded.user_id, document = excluded.document"
+                ),
+                values
+            )
+
+
+def remove_plans(connection, rows: Iterable[Tuple[int, int, Optional[str], Optional[str], Optional[str]]]) -> None:
+    """
+    删除计划的索引行
+
+    Args:
+        rows: 与 index_plans 相同格式的行，取值必须与写入索引时一致（SQLite 无内容表按原值删除词元）
+    """
+    dialect = connection.dialect.name
+    if not supports(dialect):
+        return
+    for row in rows:
+        if dialect != "sqlite":
+            connection.execute(text(f"DELETE FROM {SEARCH_TABLE} WHERE plan_id = :plan_id"), {"plan_id": row[0]})
+            continue
+        # 删除不存在的行会破坏无内容表的索引，先确认该计划已被索引
+        indexed = connection.execute(
+            text(f"SELECT rowid FROM {SEARCH_TABLE} WHERE rowid = :plan_id"), {"plan_id": row[0]}
+        ).first()
+        if indexed is not None:
+            connection.execute(
+                text(
+                    f"INSERT INTO {SEARCH_TABLE} ({SEARCH_TABLE}, rowid, owner, title, destination, details, chars) "
+                    "VALUES ('delete', :plan_id, :owner, :title, :destination, :details, :chars)"
+                ),
+                _document(row)
+            )
+
+
+def select_searchable(table):
+    """
+    读取建立索引所需的列，列顺序与 index_plans 的参数一致
+    """
+    return select(table.c.id, *(table.c[name] for name in SEARCHABLE_COLUMNS))
+
+
+def register(model, metadata) -> None:
+    """
+    在计划的ORM写入中同步索引，索引行与计划在同一事务中提交或回滚
+
+    通过ORM新增、修改、删除计划的所有路径（包括直接修改 details 后提交）都会触发同步；
+    绕过ORM的批量 UPDATE/DELETE 不会触发，需要自行调用 remove_plans / index_plans
+    """
+    table = model.__table__
+
+    def changed(target) -> bool:
+        state = inspect(target)
+        return any(state.attrs[name].history.has_changes() for name in SEARCHABLE_COLUMNS)
+
+    # 部分列可能没有加载（如列表查询未加载 details），新旧值都从数据库读取：
+    # before_* 在本行的 UPDATE/DELETE 之前执行，读到的是写入索引时的旧值
+    def after_insert(mapper, connection, target):
+        index_plans(connection, _read(connection, table, target.id))
+
+    def before_update(mapper, connection, target):
+        if changed(target):
+            remove_plans(connection, _read(connection, table, target.id))
+
+    def after_update(mapper, connection, target):
+        if changed(target):
+            index_plans(connection, _read(connection, table, target.id))
+
+    def before_delete(mapper, connection, target):
+        remove_plans(connection, _read(connection, table, target.id))
+
+    def after_create(target, connection, **kw):
+        create_search_index(connection)
+
+    event.listen(model, "after_insert", after_insert)
+    event.listen(model, "before_update", before_update)
+    event.listen(model, "after_update", after_update)
+    event.listen(model, "before_delete", before_delete)
+    # create_all 建表时一并创建检索表，迁移中由对应的步骤创建
+    event.listen(metadata, "after_create", after_create)
+
+
+def _read(connection, table, plan_id: int):
+    if not supports(connection.dialect.name):
+        return []
+    return connection.execute(select_searchable(table).where(table.c.id == plan_id)).all()
+
+
+def _document(row) -> dict:
+    plan_id, user_id, title, destination, details = row
+    return {
+        "plan_id": plan_id,
+        "user_id": user_id,
+        "owner": owner_token(user_id),
+        "title": " ".join(tokenize(title)),
+        "destination": " ".join(tokenize(destination)),
+        "details": " ".join(tokenize(details)),
+        "chars": " ".join(sorted(set("".join(_CJK_RUN.findall(f"{title} {destination} {details}"))))),
+    }
@@ -0,0 +1,37 @@
+from typing import Optional
+from sqlalchemy import LargeBinary, func
+from sqlalchemy.types import TypeDecorator
+from app.core import compression
+
+
+class CompressedText(TypeDecorator):
+    """
+    压缩存储的文本列，在Python中读写的仍是str
+
+    写入时按 COMPRESSION_CODEC 压缩，读取时解压；压缩之前写入的未压缩文本可以直接读取，
+    可通过 recompress_details.py 在后台逐批改写为压缩格式
+    """
+
+    impl = LargeBinary
+    cache_ok = True
+
+    def __init__(self, fallback: Optional[str] = None):
+        """
+        Args:
+            fallback: 同一张表中旧列的键，本列为NULL时读取旧列的值（把数据迁移到新列期间使用）
+        """
+        super().__init__()
+        self.fallback = fallback
+
+    def process_bind_param(self, value, dialect):
+        return compression.compress_text(value)
+
+    def result_processor(self, dialect, coltype):
+        # 不经过 LargeBinary 的 bytes() 转换：旧列中可能是压缩之前写入的文本，驱动返回 str
+        return compression.decompress_text
+
+    def column_expression(self, column):
+        table = getattr(column, "table", None)
+        if self.fallback is None or table is None:
+            return None
+        return func.coalesce(column, table.c[self.fallback], type_=self)
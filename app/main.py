@@ -3,13 +3,35 @@ from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from fastapi.responses import RedirectResponse
 import os
-from app.database.database import engine
-from app.models.models import Base
+import logging
+from app.core.config import settings
+from app.core.security import password_hasher
+from app.database.database import check_sqlite_pragmas
+from app.database.migrations import verify_schema
 import app.api.auth_routes as auth_routes
 import app.api.travel_routes as travel_routes
+from app.services.llm_service import llm_service
+from app.services.speech_service import speech_service
+from app.services.job_service import generation_job_queue
 
-# 创建数据库表
-Base.metadata.create_all(bind=engine)
+logger = logging.getLogger(__name__)
+
+
+def configure_logging():
+    """
+    uvicorn 只为自己的日志器配置输出，app 下各模块的日志（启动自检、迁移、后台任务等）默认不会显示；
+    没有另行配置日志时为 app 日志器添加输出，级别由 LOG_LEVEL 控制
+    """
+    app_logger = logging.getLogger("app")
+    if app_logger.handlers or logging.getLogger().handlers:
+        return
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter("%(levelname)s:     %(name)s - %(message)s"))
+    app_logger.addHandler(handler)
+    app_logger.setLevel(settings.LOG_LEVEL.upper())
+
+
+configure_logging()
 
 app = FastAPI(title="AI Travel Planner", description="An AI-powered travel planning application")
 
@@ -20,6 +42,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],  # 列表接口的分页游标
 )
 
 # 包含路由 (必须在静态文件挂载之前)
@@ -31,6 +54,36 @@ static_dir = os.path.join(os.path.dirname(__file__), "..", "frontend")
 if os.path.exists(static_dir):
     app.mount("/frontend", StaticFiles(directory=static_dir, html=True), name="frontend")
 
+@app.on_event("startup")
+def check_schema_version():
+    # 只核对结构版本，建表和索引变更由 python init_db.py 执行的迁移完成
+    version = verify_schema()
+    logger.info(f"数据库结构版本: {version}")
+
+@app.on_event("startup")
+def report_database_settings():
+    # 自检并输出SQLite实际生效的性能参数
+    pragmas = check_sqlite_pragmas()
+    if pragmas:
+        logger.info(f"SQLite PRAGMA: {pragmas}")
+        if str(pragmas.get("journal_mode", "")).upper() != settings.SQLITE_JOURNAL_MODE.upper():
+            logger.warning(
+                f"SQLite journal_mode 为 {pragmas.get('journal_mode')}，与配置的 {settings.SQLITE_JOURNAL_MODE} 不一致"
+            )
+
+@app.on_event("startup")
+async def start_generation_jobs():
+    # 启动后台生成任务队列，并恢复重启前未完成的任务
+    await generation_job_queue.start()
+
+@app.on_event("shutdown")
+async def close_http_clients():
+    await generation_job_queue.stop()
+    # 关闭外部服务的HTTP连接池
+    await llm_service.close()
+    await speech_service.close()
+    password_hasher.shutdown()
+
 @app.get("/")
 def read_root():
     # 重定向到前端页面
@@ -38,4 +91,9 @@ def read_root():
 
 @app.get("/health")
 def health_check():
-    return {"status": "healthy"}
\ No newline at end of file
+    return {
+        "status": "healthy",
+        "password_hasher": password_hasher.stats(),
+        "llm_providers": llm_service.router.stats(),
+        "llm_quota": llm_service.scheduler.stats()
+    }
\ No newline at end of file
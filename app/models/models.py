@@ -1,6 +1,9 @@
-from sqlalchemy import Column, Integer, String, DateTime, Float, Text
+from sqlalchemy import Column, Integer, String, Date, DateTime, Float, Text, Index, LargeBinary
+from sqlalchemy.orm import deferred, validates
 from sqlalchemy.sql import func
 from app.database.database import Base
+from app.database import search_index
+from app.database.types import CompressedText
 from datetime import datetime
 
 
@@ -20,26 +23,129 @@ class TravelPlan(Base):
     __tablename__ = "travel_plans"
 
     id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(Integer, index=True)
-    title = Column(String, index=True)
+    user_id = Column(Integer)
+    title = Column(String)
     destination = Column(String)
     start_date = Column(DateTime)
     end_date = Column(DateTime)
     budget = Column(Float)
     preferences = Column(Text)  # 存储用户偏好
-    details = Column(Text)  # 存储详细的旅行计划
+    # 存储详细的旅行计划（压缩存储）；默认不加载也不解压，需要时按需读取或在查询中 undefer。
+    # 滚动发布期间旧版本仍写入 details 列，details_compressed 为空时回退读取该列
+    details = deferred(Column("details_compressed", CompressedText(fallback="details_legacy"), key="details"))
+    details_legacy = deferred(Column("details", LargeBinary, key="details_legacy"))
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
 
+    @validates("details")
+    def _clear_legacy_details(self, key, value):
+        # 写入新列时清空旧列，之后不会回退读到过期的值
+        self.details_legacy = None
+        return value
+
+    __table_args__ = (
+        # 按用户列出计划，按 (created_at, id) 分页
+        Index("ix_travel_plans_user_created", "user_id", "created_at", "id"),
+    )
+
 
 class Expense(Base):
     __tablename__ = "expenses"
 
     id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(Integer, index=True)
-    plan_id = Column(Integer, index=True)
+    user_id = Column(Integer)
+    plan_id = Column(Integer)
     category = Column(String)
     amount = Column(Float)
     description = Column(String)
     expense_date = Column(DateTime, default=datetime.utcnow)
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
\ No newline at end of file
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    __table_args__ = (
+        # 按用户列出开销，按 (created_at, id) 分页
+        Index("ix_expenses_user_created", "user_id", "created_at", "id"),
+        # 按用户和计划列出开销
+        Index("ix_expenses_user_plan_created", "user_id", "plan_id", "created_at", "id"),
+        # 覆盖索引：按计划汇总各类别开销时只读索引
+        Index("ix_expenses_plan_category_amount", "plan_id", "category", "amount"),
+        # 覆盖索引：按计划汇总每日开销
+        Index("ix_expenses_plan_date", "plan_id", "expense_date", "amount"),
+    )
+
+
+class GenerationJob(Base):
+    __tablename__ = "generation_jobs"
+
+    id = Column(String, primary_key=True, index=True)  # UUID
+    user_id = Column(Integer)
+    status = Column(String, default="queued")  # queued / running / done / failed
+    destination = Column(String)
+    start_date = Column(DateTime)
+    end_date = Column(DateTime)
+    budget = Column(Float)
+    preferences = Column(Text)
+    travelers = Column(Integer, default=1)
+    plan_id = Column(Integer, nullable=True)  # 生成成功后的旅行计划ID
+    error = Column(Text, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    started_at = Column(DateTime(timezone=True), nullable=True)
+    finished_at = Column(DateTime(timezone=True), nullable=True)
+    worker_id = Column(String, nullable=True)  # 执行中任务的执行者（主机:进程:随机后缀）
+    heartbeat_at = Column(DateTime(timezone=True), nullable=True)  # 执行者最近一次续期租约的时间
+
+    __table_args__ = (
+        # 统计用户进行中的任务数
+        Index("ix_generation_jobs_user_status", "user_id", "status"),
+        # 重启后按创建时间恢复排队的任务
+        Index("ix_generation_jobs_status_created", "status", "created_at"),
+    )
+
+
+class ItineraryDay(Base):
+    __tablename__ = "itinerary_days"
+
+    id = Column(Integer, primary_key=True, index=True)
+    plan_id = Column(Integer)
+    day_number = Column(Integer)  # 第几天，从1开始
+    date = Column(Date, nullable=True)
+    title = Column(String, nullable=True)
+
+    __table_args__ = (
+        # 按计划读取行程并按天排序、按天替换
+        Index("ix_itinerary_days_plan_day", "plan_id", "day_number"),
+    )
+
+
+class ItineraryActivity(Base):
+    __tablename__ = "itinerary_activities"
+
+    id = Column(Integer, primary_key=True, index=True)
+    plan_id = Column(Integer)
+    day_id = Column(Integer, index=True)
+    position = Column(Integer)  # 当天内的顺序
+    time = Column(String, nullable=True)
+    title = Column(String)
+    location = Column(String, nullable=True)
+    description = Column(Text, nullable=True)
+    estimated_cost = Column(Float, nullable=True)
+
+    __table_args__ = (
+        # 按计划读取全部活动并按顺序排列
+        Index("ix_itinerary_activities_plan_position", "plan_id", "position"),
+    )
+
+
+class PlanBudgetRollup(Base):
+    __tablename__ = "plan_budget_rollup"
+
+    # 每个计划一行，写入开销时在同一事务中更新，读取预算状态只需一次主键查询
+    plan_id = Column(Integer, primary_key=True)
+    total_spent = Column(Float, default=0.0)
+    expense_count = Column(Integer, default=0)
+    category_totals = Column(Text)  # JSON: {类别: {"total": 金额, "count": 笔数}}
+    daily_totals = Column(Text)  # JSON: {"YYYY-MM-DD": {"total": 金额, "count": 笔数}}
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+# 计划的新增、修改、删除同步到全文检索表
+search_index.register(TravelPlan, Base.metadata)
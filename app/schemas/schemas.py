@@ -1,6 +1,7 @@
-from pydantic import BaseModel
-from typing import Optional
-from datetime import datetime
+import re
+from pydantic import BaseModel, field_validator
+from typing import Optional, List
+from datetime import datetime, date as date_type
 
 
 class UserBase(BaseModel):
@@ -51,10 +52,10 @@ class TravelPlanUpdate(TravelPlanBase):
     details: Optional[str] = None
 
 
-class TravelPlan(TravelPlanBase):
+class TravelPlanSummary(TravelPlanBase):
+    # 列表使用的精简结构，不包含体积较大的 details
     id: int
     user_id: int
-    details: Optional[str] = None
     created_at: datetime
     updated_at: Optional[datetime] = None
 
@@ -62,6 +63,25 @@ class TravelPlan(TravelPlanBase):
         from_attributes = True
 
 
+class TravelPlan(TravelPlanSummary):
+    details: Optional[str] = None
+
+
+class PlanSearchResult(BaseModel):
+    # 高亮字段已做HTML转义，检索词用 <mark> 标出
+    id: int
+    title: str
+    destination: str
+    start_date: datetime
+    end_date: datetime
+    budget: float
+    created_at: Optional[datetime] = None
+    score: float
+    title_highlight: str
+    destination_highlight: str
+    snippet: Optional[str] = None
+
+
 class ExpenseBase(BaseModel):
     category: str
     amount: float
@@ -84,4 +104,119 @@ class Expense(ExpenseBase):
     created_at: datetime
 
     class Config:
-        from_attributes = True
\ No newline at end of file
+        from_attributes = True
+
+
+class GenerationJob(BaseModel):
+    id: str
+    status: str
+    destination: str
+    plan_id: Optional[int] = None
+    error: Optional[str] = None
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
+
+class ItineraryActivityBase(BaseModel):
+    time: Optional[str] = None  # 如 "09:00-11:00"、"上午"
+    title: str
+    location: Optional[str] = None
+    description: Optional[str] = None
+    estimated_cost: Optional[float] = None
+
+    @field_validator("estimated_cost", mode="before")
+    @classmethod
+    def parse_cost(cls, value):
+        # AI可能返回 "约200元"、"¥150" 之类的字符串，取其中的数字
+        if isinstance(value, str):
+            match = re.search(r"\d+(?:\.\d+)?", value.replace(",", ""))
+            return float(match.group()) if match else None
+        return value
+
+
+class ItineraryActivity(ItineraryActivityBase):
+    id: int
+    position: int
+
+    class Config:
+        from_attributes = True
+
+
+class ItineraryDayBase(BaseModel):
+    day_number: int
+    date: Optional[date_type] = None
+    title: Optional[str] = None
+
+    @field_validator("date", mode="before")
+    @classmethod
+    def parse_date(cls, value):
+        # 日期格式不规范时忽略，不影响整个行程的解析
+        if isinstance(value, str):
+            try:
+                return datetime.strptime(value.strip()[:10], "%Y-%m-%d").date()
+            except ValueError:
+                return None
+        return value
+
+
+class ItineraryDayCreate(ItineraryDayBase):
+    activities: List[ItineraryActivityBase] = []
+
+
+class ItineraryCreate(BaseModel):
+    days: List[ItineraryDayCreate]
+
+
+class ItineraryDay(ItineraryDayBase):
+    id: int
+    activities: List[ItineraryActivity] = []
+
+    class Config:
+        from_attributes = True
+
+
+class Itinerary(BaseModel):
+    plan_id: int
+    days: List[ItineraryDay]
+
+
+class CategoryTotal(BaseModel):
+    category: str
+    total: float
+    count: int
+
+
+class DailyTotal(BaseModel):
+    date: Optional[date_type] = None
+    total: float
+    count: int = 0
+
+
+class ExpenseItem(BaseModel):
+    category: str
+    amount: float
+    description: Optional[str] = None
+    expense_date: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
+
+class BudgetStatus(BaseModel):
+    plan_id: int
+    budget: float
+    total_spent: float
+    remaining: float
+    usage_rate: float  # 百分比
+    expense_count: int
+    categories: List[CategoryTotal]
+    daily: List[DailyTotal]
+    updated_at: Optional[datetime] = None  # 汇总最后更新时间
+
+
+class BudgetSummary(BudgetStatus):
+    largest: List[ExpenseItem]  # 金额最大的几笔开销
@@ -0,0 +1,197 @@
+from datetime import datetime
+from sqlalchemy import select, delete
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import load_only, undefer
+from app.models.models import User, TravelPlan, Expense, ItineraryDay, ItineraryActivity, PlanBudgetRollup
+from app.schemas.schemas import UserCreate, TravelPlanCreate, TravelPlanUpdate, ExpenseCreate, ItineraryCreate, ItineraryDayCreate
+from app.core.security import get_password_hash_async, verify_password_async
+from app.services import auth_cache, budget_service, pagination
+from app.services.user_service import group_itinerary, plan_columns, PLAN_SUMMARY_COLUMNS
+from passlib.exc import MissingBackendError
+
+# user_service 的异步版本，配合 AsyncSession 使用（DATABASE_ASYNC=true）
+
+
+async def get_user(db: AsyncSession, user_id: int):
+    result = await db.execute(select(User).filter(User.id == user_id))
+    return result.scalars().first()
+
+
+async def get_user_by_username(db: AsyncSession, username: str):
+    result = await db.execute(select(User).filter(User.username == username))
+    return result.scalars().first()
+
+
+async def get_user_by_email(db: AsyncSession, email: str):
+    result = await db.execute(select(User).filter(User.email == email))
+    return result.scalars().first()
+
+
+async def get_users(db: AsyncSession, skip: int = 0, limit: int = 100):
+    result = await db.execute(select(User).offset(skip).limit(limit))
+    return result.scalars().all()
+
+
+async def create_user(db: AsyncSession, user: UserCreate):
+    try:
+        # 密码哈希是CPU密集操作，放到专用的密码哈希执行器中执行
+        hashed_password = await get_password_hash_async(user.password)
+    except MissingBackendError as e:
+        raise Exception(f"密码哈希处理失败: {str(e)}")
+
+    db_user = User(
+        username=user.username,
+        email=user.email,
+        hashed_password=hashed_password
+    )
+    db.add(db_user)
+    await db.commit()
+    await db.refresh(db_user)
+    # 同名用户的旧缓存不能再被使用
+    auth_cache.invalidate_user(db_user.username)
+    return db_user
+
+
+async def authenticate_user(db: AsyncSession, username: str, password: str):
+    user = await get_user_by_username(db, username)
+    if not user:
+        return False
+    if not await verify_password_async(password, user.hashed_password):
+        return False
+    return user
+
+
+async def get_travel_plans(db: AsyncSession, user_id: int, cursor: str = None, limit: int = 100, skip: int = 0):
+    query = select(TravelPlan).options(load_only(*PLAN_SUMMARY_COLUMNS)).filter(TravelPlan.user_id == user_id)
+    if cursor:
+        query = query.filter(pagination.after_cursor(TravelPlan.created_at, TravelPlan.id, cursor))
+    query = query.order_by(TravelPlan.created_at, TravelPlan.id)
+    if skip:
+        query = query.offset(skip)
+    result = await db.execute(query.limit(pagination.page_size(limit)))
+    return result.scalars().all()
+
+
+async def get_travel_plan(db: AsyncSession, plan_id: int):
+    # details 默认不加载，异步会话中不能按需读取，需要正文时使用 get_travel_plan_with_details
+    result = await db.execute(select(TravelPlan).filter(TravelPlan.id == plan_id))
+    return result.scalars().first()
+
+
+async def get_travel_plan_with_details(db: AsyncSession, plan_id: int):
+    result = await db.execute(select(TravelPlan).options(undefer(TravelPlan.details)).filter(TravelPlan.id == plan_id))
+    return result.scalars().first()
+
+
+async def refresh_travel_plan(db: AsyncSession, db_plan: TravelPlan) -> None:
+    await db.refresh(db_plan, attribute_names=plan_columns())
+
+
+async def create_travel_plan(db: AsyncSession, plan: TravelPlanCreate, user_id: int, details: str = None,
+                             itinerary: ItineraryCreate = None):
+    db_plan = TravelPlan(**plan.dict(), user_id=user_id)
+    if details is not None:
+        db_plan.details = details
+    db.add(db_plan)
+    if itinerary is not None:
+        # 计划和结构化行程在同一个事务中保存
+        await db.flush()
+        await replace_itinerary(db, db_plan.id, itinerary, commit=False)
+    await db.commit()
+    await refresh_travel_plan(db, db_plan)
+    return db_plan
+
+
+async def update_travel_plan(db: AsyncSession, plan_id: int, plan: TravelPlanUpdate):
+    db_plan = await get_travel_plan(db, plan_id)
+    if db_plan:
+        update_data = plan.dict(exclude_unset=True)
+        for key, value in update_data.items():
+            setattr(db_plan, key, value)
+        await db.commit()
+        await refresh_travel_plan(db, db_plan)
+    return db_plan
+
+
+async def delete_travel_plan(db: AsyncSession, plan_id: int):
+    db_plan = await get_travel_plan(db, plan_id)
+    if db_plan:
+        await delete_itinerary(db, plan_id)
+        await db.execute(delete(PlanBudgetRollup).where(PlanBudgetRollup.plan_id == plan_id))
+        await db.delete(db_plan)
+        await db.commit()
+    return db_plan
+
+
+async def delete_itinerary(db: AsyncSession, plan_id: int):
+    await db.execute(delete(ItineraryActivity).where(ItineraryActivity.plan_id == plan_id))
+    await db.execute(delete(ItineraryDay).where(ItineraryDay.plan_id == plan_id))
+
+
+async def get_itinerary(db: AsyncSession, plan_id: int):
+    days = (await db.execute(
+        select(ItineraryDay).filter(ItineraryDay.plan_id == plan_id).order_by(ItineraryDay.day_number)
+    )).scalars().all()
+    activities = (await db.execute(
+        select(ItineraryActivity).filter(ItineraryActivity.plan_id == plan_id).order_by(ItineraryActivity.position)
+    )).scalars().all()
+    return group_itinerary(days, activities)
+
+
+async def replace_itinerary(db: AsyncSession, plan_id: int, itinerary: ItineraryCreate, commit: bool = True):
+    await delete_itinerary(db, plan_id)
+    for day in itinerary.days:
+        await _add_itinerary_day(db, plan_id, day)
+    if commit:
+        await db.commit()
+
+
+async def replace_itinerary_day(db: AsyncSession, plan_id: int, day: ItineraryDayCreate, commit: bool = True):
+    day_ids = (await db.execute(
+        select(ItineraryDay.id).filter(ItineraryDay.plan_id == plan_id, ItineraryDay.day_number == day.day_number)
+    )).scalars().all()
+    if day_ids:
+        await db.execute(delete(ItineraryActivity).where(ItineraryActivity.day_id.in_(day_ids)))
+        await db.execute(delete(ItineraryDay).where(ItineraryDay.id.in_(day_ids)))
+    await _add_itinerary_day(db, plan_id, day)
+    if commit:
+        await db.commit()
+
+
+async def _add_itinerary_day(db: AsyncSession, plan_id: int, day: ItineraryDayCreate):
+    db_day = ItineraryDay(plan_id=plan_id, day_number=day.day_number, date=day.date, title=day.title)
+    db.add(db_day)
+    await db.flush()
+    db.add_all([
+        ItineraryActivity(plan_id=plan_id, day_id=db_day.id, position=position, **activity.model_dump())
+        for position, activity in enumerate(day.activities)
+    ])
+
+
+async def get_expenses(db: AsyncSession, user_id: int, plan_id: int = None, cursor: str = None, limit: int = 100,
+                       skip: int = 0):
+    query = select(Expense).filter(Expense.user_id == user_id)
+    if plan_id:
+        query = query.filter(Expense.plan_id == plan_id)
+    if cursor:
+        query = query.filter(pagination.after_cursor(Expense.created_at, Expense.id, cursor))
+    query = query.order_by(Expense.created_at, Expense.id)
+    if skip:
+        query = query.offset(skip)
+    result = await db.execute(query.limit(pagination.page_size(limit)))
+    return result.scalars().all()
+
+
+async def create_expense(db: AsyncSession, expense: ExpenseCreate, user_id: int):
+    # 如果没有提供expense_date，则使用当前时间
+    expense_dict = expense.dict()
+    if expense_dict.get('expense_date') is None:
+        expense_dict['expense_date'] = datetime.utcnow()
+
+    db_expense = Expense(**expense_dict, user_id=user_id)
+    db.add(db_expense)
+    # 与开销在同一事务中更新计划的预算汇总
+    await budget_service.apply_expense_async(db, db_expense)
+    await db.commit()
+    await db.refresh(db_expense)
+    return db_expense
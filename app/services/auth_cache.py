@@ -0,0 +1,82 @@
+import hashlib
+import itertools
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+from app.core.config import settings
+from app.schemas.schemas import User
+from app.services.cache_service import MemoryCache
+
+# 已验证令牌 -> 用户快照 的缓存，命中时无需解码JWT和查询数据库
+_cache = MemoryCache(max_entries=settings.AUTH_CACHE_MAX_ENTRIES)
+
+# 每个用户名的版本号，用户信息变化时取一个新的全局递增值，使该用户已缓存的令牌全部失效；
+# 与令牌缓存同样按 AUTH_CACHE_MAX_ENTRIES 限制条数，淘汰最久未失效的用户
+_generations: "OrderedDict[str, int]" = OrderedDict()
+# 已淘汰版本号的最大值，未记录的用户以此为当前版本号：
+# 淘汰后版本号只会变大，旧版本号缓存的令牌仍然失效
+_floor = 0
+_counter = itertools.count(1)
+_lock = threading.Lock()
+
+
+def _token_key(token: str) -> str:
+    # 不在内存中保存原始令牌
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+
+def generation(username: str) -> int:
+    """
+    获取用户当前的缓存版本号
+    """
+    return _generations.get(username, _floor)
+
+
+def get_user(token: str) -> Optional[User]:
+    """
+    按令牌获取缓存的用户快照，未命中或已失效时返回None
+    """
+    cached = _cache.get(_token_key(token))
+    if cached is None:
+        return None
+    user_generation, user = cached
+    if user_generation != generation(user.username):
+        return None
+    return user
+
+
+def put_user(token: str, user: User, expires_at: float, user_generation: int) -> None:
+    """
+    缓存令牌对应的用户快照
+
+    Args:
+        token: 访问令牌
+        user: 用户快照
+        expires_at: 令牌过期时间（UNIX时间戳），缓存不会晚于该时间过期
+        user_generation: 查询数据库之前读取的版本号，避免查询期间发生的失效被覆盖
+    """
+    ttl = min(settings.AUTH_CACHE_TTL_SECONDS, expires_at - time.time())
+    if ttl <= 0:
+        return
+    _cache.set(_token_key(token), (user_generation, user), ttl=ttl)
+
+
+def invalidate_user(username: str) -> None:
+    """
+    用户信息发生变化（修改、删除、更换密码等）时调用，使该用户的所有缓存失效
+    """
+    global _floor
+    with _lock:
+        _generations[username] = next(_counter)
+        _generations.move_to_end(username)
+        while len(_generations) > settings.AUTH_CACHE_MAX_ENTRIES:
+            _, evicted = _generations.popitem(last=False)
+            _floor = max(_floor, evicted)
+
+
+def clear() -> None:
+    """
+    清空全部缓存
+    """
+    _cache.clear()
@@ -1,20 +1,25 @@
 from fastapi import HTTPException, status, Depends
 from fastapi.security import HTTPBearer
-from sqlalchemy.orm import Session
 from jose import JWTError, jwt
-from app.database.database import get_db
-from app.schemas.schemas import TokenData
+from app.database import database
+from app.database.database import run_in_session
+from app.schemas.schemas import TokenData, User as UserSchema
 from app.core.config import settings
-from app.services import user_service
+from app.services import user_service, async_user_service, auth_cache
 
 security = HTTPBearer()
 
-async def get_current_user(db: Session = Depends(get_db), credentials = Depends(security)):
+async def get_current_user(credentials = Depends(security)):
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
+    # 已验证过的令牌直接返回缓存的用户快照，不解码JWT也不查询数据库
+    cached_user = auth_cache.get_user(credentials.credentials)
+    if cached_user is not None:
+        return cached_user
+    
     try:
         payload = jwt.decode(credentials.credentials, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
         username: str = payload.get("sub")
@@ -23,7 +28,18 @@ async def get_current_user(db: Session = Depends(get_db), credentials = Depends(
         token_data = TokenData(username=username)
     except JWTError:
         raise credentials_exception
-    user = user_service.get_user_by_username(db, username=token_data.username)
+    # 查询前记录版本号，查询期间发生的失效不会被覆盖
+    user_generation = auth_cache.generation(token_data.username)
+    if settings.DATABASE_ASYNC:
+        async with database.AsyncSessionLocal() as db:
+            user = await async_user_service.get_user_by_username(db, username=token_data.username)
+    else:
+        # 在工作线程中查询用户，查询结束后立即释放会话
+        user = await run_in_session(user_service.get_user_by_username, username=token_data.username)
     if user is None:
         raise credentials_exception
-    return user
+    
+    # 缓存用户快照，过期时间不晚于令牌的exp
+    user_snapshot = UserSchema.model_validate(user)
+    auth_cache.put_user(credentials.credentials, user_snapshot, payload.get("exp", 0), user_generation)
+    return user_snapshot
@@ -0,0 +1,359 @@
+import json
+from datetime import date, datetime
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy import select, func
+from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.models.models import Expense, PlanBudgetRollup
+from app.schemas.schemas import BudgetStatus, BudgetSummary, CategoryTotal, DailyTotal, ExpenseItem
+
+# 预算摘要中列出的大额开销笔数
+LARGEST_EXPENSES = 10
+
+# 未填写类别的开销归入此类
+DEFAULT_CATEGORY = "其他"
+
+# 预算摘要只按 plan_id 过滤：只有计划所有者能为计划添加开销，
+# 因此 (plan_id, category, amount) 覆盖索引即可完成分类汇总，无需回表
+
+
+def _category_query(plan_id: int):
+    return select(
+        Expense.category,
+        func.sum(Expense.amount),
+        func.count()
+    ).where(Expense.plan_id == plan_id).group_by(Expense.category).order_by(func.sum(Expense.amount).desc())
+
+
+def _daily_query(plan_id: int):
+    day = func.date(Expense.expense_date)
+    return select(
+        day, func.sum(Expense.amount), func.count()
+    ).where(Expense.plan_id == plan_id).group_by(day).order_by(day)
+
+
+def _largest_query(plan_id: int, limit: int):
+    return select(
+        Expense.category, Expense.amount, Expense.description, Expense.expense_date
+    ).where(Expense.plan_id == plan_id).order_by(Expense.amount.desc()).limit(limit)
+
+
+def _rollup_query(plan_id: int):
+    # PostgreSQL/MySQL 上锁定汇总行，避免并发写入开销时丢失更新；SQLite 的写事务本身是串行的
+    return select(PlanBudgetRollup).where(PlanBudgetRollup.plan_id == plan_id).with_for_update()
+
+
+def _build_status(plan, categories: List[CategoryTotal], daily: List[DailyTotal],
+                  updated_at: Optional[datetime] = None) -> BudgetStatus:
+    total_spent = round(sum(item.total for item in categories), 2)
+    budget = plan.budget or 0.0
+    return BudgetStatus(
+        plan_id=plan.id,
+        budget=budget,
+        total_spent=total_spent,
+        remaining=budget - total_spent,
+        usage_rate=total_spent / budget * 100 if budget else 0.0,
+        expense_count=sum(item.count for item in categories),
+        categories=categories,
+        daily=daily,
+        updated_at=updated_at
+    )
+
+
+def _build_summary(plan, category_rows, daily_rows, largest_rows) -> BudgetSummary:
+    status = _build_status(plan, _category_totals(category_rows), _daily_totals(daily_rows))
+    return BudgetSummary(
+        **status.model_dump(),
+        largest=[
+            ExpenseItem(category=category, amount=amount, description=description, expense_date=expense_date)
+            for category, amount, description, expense_date in largest_rows
+        ]
+    )
+
+
+def _category_totals(rows) -> List[CategoryTotal]:
+    return [
+        CategoryTotal(category=category or DEFAULT_CATEGORY, total=total or 0.0, count=count)
+        for category, total, count in rows
+    ]
+
+
+def _daily_totals(rows) -> List[DailyTotal]:
+    return [DailyTotal(date=_to_date(day), total=total or 0.0, count=count) for day, total, count in rows]
+
+
+def _to_date(value):
+    # SQLite 的 date() 返回字符串
+    if value is None or isinstance(value, date):
+        return value
+    try:
+        return datetime.strptime(str(value)[:10], "%Y-%m-%d").date()
+    except ValueError:
+        return None
+
+
+def _day_key(value) -> str:
+    day = _to_date(value.date() if isinstance(value, datetime) else value)
+    return day.isoformat() if day else ""
+
+
+def _rollup_values(category_rows, daily_rows) -> Dict:
+    """
+    把汇总查询的结果转换成 plan_budget_rollup 中存储的格式
+    """
+    categories: Dict[str, Dict] = {}
+    for category, total, count in category_rows:
+        item = categories.setdefault(category or DEFAULT_CATEGORY, {"total": 0.0, "count": 0})
+        item["total"] = round(item["total"] + (total or 0.0), 2)
+        item["count"] += count
+    daily: Dict[str, Dict] = {}
+    for day, total, count in daily_rows:
+        item = daily.setdefault(_day_key(day), {"total": 0.0, "count": 0})
+        item["total"] = round(item["total"] + (total or 0.0), 2)
+        item["count"] += count
+    return {
+        "total_spent": round(sum(item["total"] for item in categories.values()), 2),
+        "expense_count": sum(item["count"] for item in categories.values()),
+        "category_totals": categories,
+        "daily_totals": daily,
+    }
+
+
+def _set_rollup(rollup: PlanBudgetRollup, values: Dict) -> None:
+    rollup.total_spent = values["total_spent"]
+    rollup.expense_count = values["expense_count"]
+    rollup.category_totals = json.dumps(values["category_totals"], ensure_ascii=False)
+    rollup.daily_totals = json.dumps(values["daily_totals"], ensure_ascii=False)
+    rollup.updated_at = datetime.utcnow()
+
+
+def _rollup_dict(rollup: PlanBudgetRollup) -> Dict:
+    return {
+        "total_spent": round(rollup.total_spent or 0.0, 2),
+        "expense_count": rollup.expense_count or 0,
+        "category_totals": json.loads(rollup.category_totals or "{}"),
+        "daily_totals": json.loads(rollup.daily_totals or "{}"),
+    }
+
+
+def _add_to(totals: Dict[str, Dict], key: str, amount: float, sign: int) -> None:
+    item = totals.setdefault(key, {"total": 0.0, "count": 0})
+    item["total"] = round(item["total"] + amount, 2)
+    item["count"] += sign
+    if item["count"] <= 0:
+        del totals[key]
+
+
+def _apply(rollup: PlanBudgetRollup, expenses, sign: int) -> None:
+    """
+    把若干笔开销计入汇总行，expenses 中的元素可以是 Expense 或同名字段的字典
+    """
+    values = _rollup_dict(rollup)
+    for expense in expenses:
+        if isinstance(expense, dict):
+            category, amount, expense_date = expense.get("category"), expense.get("amount"), expense.get("expense_date")
+        else:
+            category, amount, expense_date = expense.category, expense.amount, expense.expense_date
+        amount = (amount or 0.0) * sign
+        _add_to(values["category_totals"], category or DEFAULT_CATEGORY, amount, sign)
+        _add_to(values["daily_totals"], _day_key(expense_date), amount, sign)
+        values["total_spent"] = round(values["total_spent"] + amount, 2)
+        values["expense_count"] += sign
+    _set_rollup(rollup, values)
+
+
+def _status_from_rollup(plan, rollup: PlanBudgetRollup) -> BudgetStatus:
+    values = _rollup_dict(rollup)
+    categories = sorted(
+        (CategoryTotal(category=category, total=item["total"], count=item["count"])
+         for category, item in values["category_totals"].items()),
+        key=lambda item: item.total, reverse=True
+    )
+    daily = [
+        DailyTotal(date=_to_date(day) if day else None, total=item["total"], count=item["count"])
+        for day, item in sorted(values["daily_totals"].items())
+    ]
+    return _build_status(plan, categories, daily, rollup.updated_at)
+
+
+def diff_rollup(stored: Optional[Dict], expected: Dict) -> List[str]:
+    """
+    比较存储的汇总和按开销重新计算的结果，返回不一致的字段名
+    """
+    if stored is None:
+        return ["missing"] if expected["expense_count"] else []
+    fields = []
+    if stored["expense_count"] != expected["expense_count"]:
+        fields.append("expense_count")
+    if abs(stored["total_spent"] - expected["total_spent"]) > 0.01:
+        fields.append("total_spent")
+    for name in ("category_totals", "daily_totals"):
+        left, right = stored[name], expected[name]
+        if set(left) != set(right) or any(
+            left[key]["count"] != right[key]["count"] or abs(left[key]["total"] - right[key]["total"]) > 0.01
+            for key in left
+        ):
+            fields.append(name)
+    return fields
+
+
+def get_budget_summary(db: Session, plan, largest: int = LARGEST_EXPENSES) -> BudgetSummary:
+    """
+    在数据库中汇总计划的开销：总额、按类别和按天的合计，以及金额最大的几笔开销
+
+    Args:
+        db: 数据库会话
+        plan: 旅行计划
+        largest: 列出的大额开销笔数
+
+    Returns:
+        预算摘要，内存占用只与类别数和天数有关，与开销笔数无关
+    """
+    return _build_summary(
+        plan,
+        db.execute(_category_query(plan.id)).all(),
+        db.execute(_daily_query(plan.id)).all(),
+        db.execute(_largest_query(plan.id, largest)).all()
+    )
+
+
+async def get_budget_summary_async(db: AsyncSession, plan, largest: int = LARGEST_EXPENSES) -> BudgetSummary:
+    """
+    get_budget_summary 的异步版本
+    """
+    return _build_summary(
+        plan,
+        (await db.execute(_category_query(plan.id))).all(),
+        (await db.execute(_daily_query(plan.id))).all(),
+        (await db.execute(_largest_query(plan.id, largest))).all()
+    )
+
+
+def get_budget_status(db: Session, plan) -> BudgetStatus:
+    """
+    读取计划的预算状态：总额、分类合计和每日合计
+
+    优先读取 plan_budget_rollup（一次主键查询）；还没有汇总行时（如尚未回填的历史数据）
+    退回到按开销实时汇总，不在读请求中写库
+    """
+    rollup = db.get(PlanBudgetRollup, plan.id)
+    if rollup is not None:
+        return _status_from_rollup(plan, rollup)
+    return _build_status(
+        plan,
+        _category_totals(db.execute(_category_query(plan.id)).all()),
+        _daily_totals(db.execute(_daily_query(plan.id)).all())
+    )
+
+
+async def get_budget_status_async(db: AsyncSession, plan) -> BudgetStatus:
+    """
+    get_budget_status 的异步版本
+    """
+    rollup = await db.get(PlanBudgetRollup, plan.id)
+    if rollup is not None:
+        return _status_from_rollup(plan, rollup)
+    return _build_status(
+        plan,
+        _category_totals((await db.execute(_category_query(plan.id))).all()),
+        _daily_totals((await db.execute(_daily_query(plan.id))).all())
+    )
+
+
+def compute_rollup(db: Session, plan_id: int) -> Dict:
+    """
+    按开销明细重新计算计划的汇总
+    """
+    return _rollup_values(
+        db.execute(_category_query(plan_id)).all(),
+        db.execute(_daily_query(plan_id)).all()
+    )
+
+
+def check_rollup(db: Session, plan_id: int) -> List[str]:
+    """
+    校验计划的汇总行与开销明细是否一致，返回不一致的字段名
+    """
+    rollup = db.get(PlanBudgetRollup, plan_id)
+    return diff_rollup(_rollup_dict(rollup) if rollup else None, compute_rollup(db, plan_id))
+
+
+def rebuild_rollup(db: Session, plan_id: int) -> Tuple[PlanBudgetRollup, List[str]]:
+    """
+    按开销明细重建计划的汇总行，不提交事务
+
+    Returns:
+        (汇总行, 重建前不一致的字段名)
+    """
+    expected = compute_rollup(db, plan_id)
+    rollup = db.execute(_rollup_query(plan_id)).scalar_one_or_none()
+    mismatched = diff_rollup(_rollup_dict(rollup) if rollup else None, expected)
+    if rollup is None:
+        rollup = PlanBudgetRollup(plan_id=plan_id)
+        db.add(rollup)
+    _set_rollup(rollup, expected)
+    return rollup, mismatched
+
+
+async def rebuild_rollup_async(db: AsyncSession, plan_id: int) -> PlanBudgetRollup:
+    """
+    rebuild_rollup 的异步版本，只返回汇总行
+    """
+    expected = _rollup_values(
+        (await db.execute(_category_query(plan_id))).all(),
+        (await db.execute(_daily_query(plan_id))).all()
+    )
+    rollup = (await db.execute(_rollup_query(plan_id))).scalar_one_or_none()
+    if rollup is None:
+        rollup = PlanBudgetRollup(plan_id=plan_id)
+        db.add(rollup)
+    _set_rollup(rollup, expected)
+    return rollup
+
+
+def apply_expense(db: Session, expense: Expense, sign: int = 1) -> None:
+    """
+    在当前事务中把一笔开销计入计划的汇总，由调用方提交
+
+    Args:
+        db: 数据库会话，开销的新增或删除需已在此会话中完成
+        expense: 开销
+        sign: 1 表示新增，-1 表示删除；修改开销时先以 -1 扣除旧值再以 1 计入新值
+    """
+    apply_expenses(db, expense.plan_id, [expense], sign)
+
+
+def apply_expenses(db: Session, plan_id: int, expenses, sign: int = 1) -> None:
+    """
+    把同一计划的多笔开销一次计入汇总（批量导入时使用），由调用方提交
+    """
+    db.flush()
+    rollup = db.execute(_rollup_query(plan_id)).scalar_one_or_none()
+    if rollup is None:
+        # 还没有汇总行时按明细重建，结果已包含本次变更
+        rebuild_rollup(db, plan_id)
+        return
+    _apply(rollup, expenses, sign)
+
+
+async def apply_expense_async(db: AsyncSession, expense: Expense, sign: int = 1) -> None:
+    """
+    apply_expense 的异步版本
+    """
+    await apply_expenses_async(db, expense.plan_id, [expense], sign)
+
+
+async def apply_expenses_async(db: AsyncSession, plan_id: int, expenses, sign: int = 1) -> None:
+    """
+    apply_expenses 的异步版本
+    """
+    await db.flush()
+    rollup = (await db.execute(_rollup_query(plan_id))).scalar_one_or_none()
+    if rollup is None:
+        await rebuild_rollup_async(db, plan_id)
+        return
+    _apply(rollup, expenses, sign)
+
+
+def delete_rollup(db: Session, plan_id: int) -> None:
+    db.query(PlanBudgetRollup).filter(PlanBudgetRollup.plan_id == plan_id).delete(synchronize_session=False)
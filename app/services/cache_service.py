@@ -0,0 +1,244 @@
+import hashlib
+import json
+from abc import ABC, abstractmethod
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Optional
+from fastapi.concurrency import run_in_threadpool
+from app.core import compression
+
+
+def build_cache_key(prompt: str, model: str, temperature: float, **extra: Any) -> str:
+    """
+    根据提示词、模型和温度生成内容寻址的缓存键
+
+    提示词中的空白会被归一化，避免缩进或换行差异导致缓存未命中
+
+    Args:
+        prompt: 提示词
+        model: 模型名称
+        temperature: 温度参数
+        extra: 其他参与计算的参数（如系统提示词）
+
+    Returns:
+        SHA-256 十六进制字符串
+    """
+    material = {
+        "prompt": re.sub(r"\s+", " ", prompt).strip(),
+        "model": model,
+        "temperature": temperature,
+    }
+    for name, value in extra.items():
+        material[name] = re.sub(r"\s+", " ", value).strip() if isinstance(value, str) else value
+
+    raw = json.dumps(material, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class BaseCache(ABC):
+    """
+    缓存后端基类
+    """
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[Any]:
+        ...
+
+    @abstractmethod
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        ...
+
+    @abstractmethod
+    def delete(self, key: str) -> None:
+        ...
+
+    @abstractmethod
+    def clear(self) -> None:
+        ...
+
+    async def aget(self, key: str) -> Optional[Any]:
+        """
+        供异步代码调用的 get；读写不涉及I/O的后端直接执行
+        """
+        return self.get(key)
+
+    async def aset(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        """
+        供异步代码调用的 set
+        """
+        self.set(key, value, ttl)
+
+
+class NullCache(BaseCache):
+    """
+    不缓存任何内容（关闭缓存时使用）
+    """
+
+    def get(self, key: str) -> Optional[Any]:
+        return None
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        pass
+
+    def delete(self, key: str) -> None:
+        pass
+
+    def clear(self) -> None:
+        pass
+
+
+class MemoryCache(BaseCache):
+    """
+    进程内缓存，支持TTL过期和按条目数的LRU淘汰
+    """
+
+    def __init__(self, max_entries: int = 1000, ttl: Optional[float] = None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at is not None and expires_at <= time.time():
+                del self._entries[key]
+                return None
+            # 命中后移到队尾，表示最近使用
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = time.time() + ttl if ttl is not None else None
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            # 超出容量时淘汰最久未使用的条目
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class SQLiteCache(BaseCache):
+    """
+    基于SQLite文件的缓存，服务重启后依然有效
+
+    值以JSON形式压缩存储（见 app.core.compression），支持TTL过期和按最近访问时间的LRU淘汰
+    """
+
+    def __init__(self, path: str, max_entries: int = 1000, ttl: Optional[float] = None):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=5.0)
+        with self._lock, self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache_entries ("
+                "key TEXT PRIMARY KEY, "
+                "value TEXT NOT NULL, "
+                "expires_at REAL, "
+                "accessed_at REAL NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS ix_cache_entries_accessed_at "
+                "ON cache_entries (accessed_at)"
+            )
+
+    def get(self, key: str) -> Optional[Any]:
+        now = time.time()
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                "SELECT value, expires_at FROM cache_entries WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            value, expires_at = row
+            if expires_at is not None and expires_at <= now:
+                self._conn.execute("DELETE FROM cache_entries WHERE key = ?", (key,))
+                return None
+            self._conn.execute(
+                "UPDATE cache_entries SET accessed_at = ? WHERE key = ?", (now, key)
+            )
+        # 启用压缩之前写入的条目为文本，同样可以读取
+        return json.loads(compression.decompress_text(value))
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        now = time.time()
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = now + ttl if ttl is not None else None
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO cache_entries (key, value, expires_at, accessed_at) "
+                "VALUES (?, ?, ?, ?)",
+                (key, compression.compress_text(json.dumps(value, ensure_ascii=False)), expires_at, now)
+            )
+            # 先清理过期条目，再按最近访问时间淘汰超出容量的部分
+            self._conn.execute(
+                "DELETE FROM cache_entries WHERE expires_at IS NOT NULL AND expires_at <= ?", (now,)
+            )
+            self._conn.execute(
+                "DELETE FROM cache_entries WHERE key IN ("
+                "SELECT key FROM cache_entries ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,)
+            )
+
+    def delete(self, key: str) -> None:
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM cache_entries WHERE key = ?", (key,))
+
+    def clear(self) -> None:
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM cache_entries")
+
+    async def aget(self, key: str) -> Optional[Any]:
+        # sqlite3 的调用会阻塞，遇到写锁时最多等待 timeout 秒，放到工作线程中执行以免阻塞事件循环
+        return await run_in_threadpool(self.get, key)
+
+    async def aset(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        await run_in_threadpool(self.set, key, value, ttl)
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+def create_cache(backend: str, max_entries: int = 1000, ttl: Optional[float] = None,
+                 path: Optional[str] = None) -> BaseCache:
+    """
+    根据配置创建缓存后端
+
+    Args:
+        backend: memory / sqlite / none
+        max_entries: 最大条目数
+        ttl: 默认过期时间（秒），None表示不过期
+        path: SQLite缓存文件路径
+
+    Returns:
+        缓存实例
+    """
+    backend = (backend or "none").lower()
+    if backend == "memory":
+        return MemoryCache(max_entries=max_entries, ttl=ttl)
+    if backend == "sqlite":
+        return SQLiteCache(path or "./llm_cache.db", max_entries=max_entries, ttl=ttl)
+    if backend == "none":
+        return NullCache()
+    raise ValueError(f"未知的缓存后端: {backend}")
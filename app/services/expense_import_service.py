@@ -0,0 +1,429 @@
+import codecs
+import csv
+import io
+import json
+import logging
+import re
+from collections import defaultdict
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, Iterable, List, Optional, Tuple
+from pydantic import ValidationError
+from sqlalchemy import insert, select
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.database import database
+from app.database.database import run_in_session
+from app.models.models import Expense, TravelPlan
+from app.schemas.schemas import ExpenseCreate
+from app.services import budget_service
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# CSV表头别名 -> 字段名
+CSV_COLUMNS = {
+    "plan_id": "plan_id", "计划id": "plan_id",
+    "category": "category", "类别": "category", "分类": "category",
+    "amount": "amount", "金额": "amount",
+    "description": "description", "描述": "description", "说明": "description", "备注": "description",
+    "expense_date": "expense_date", "date": "expense_date", "日期": "expense_date",
+}
+
+# 返回结果中最多列出的错误行数，失败总数仍完整统计
+MAX_REPORTED_ERRORS = 100
+
+_DATE_ONLY = re.compile(r"^\d{4}-\d{1,2}-\d{1,2}$")
+
+# JSON数组中单个元素的最大字符数，超出时不再缓冲，直接拒绝
+MAX_JSON_ITEM_CHARS = 64 * 1024
+
+_JSON_DECODER = json.JSONDecoder()
+_JSON_WHITESPACE = " \t\r\n"
+
+
+class ExpenseImporter:
+    """
+    批量导入开销：逐行校验，攒够一块后批量插入，每块一个事务
+
+    - 每个计划只查询一次归属，不属于当前用户或不存在的计划对应的行记为失败
+    - 同一块内每个计划的预算汇总只更新一次
+    - 某一块写入失败时回滚该块并把块内各行记为失败，继续导入后续的块
+    """
+
+    def __init__(self, user_id: int, plan_id: Optional[int] = None,
+                 chunk_size: Optional[int] = None, max_rows: Optional[int] = None):
+        """
+        Args:
+            user_id: 当前用户ID
+            plan_id: 默认计划ID，行中没有 plan_id 时使用
+            chunk_size: 每个事务插入的行数
+            max_rows: 单次导入的最大行数，超出部分不再读取
+        """
+        self.user_id = user_id
+        self.default_plan_id = plan_id
+        self.chunk_size = max(1, chunk_size or settings.EXPENSE_IMPORT_CHUNK_SIZE)
+        self.max_rows = max_rows or settings.EXPENSE_IMPORT_MAX_ROWS
+        # 计划ID -> 不可写入的原因，可写入时为None
+        self._plans: Dict[int, Optional[str]] = {}
+        self._pending: List[Tuple[int, Dict[str, Any]]] = []
+        self.rows = 0
+        self.imported = 0
+        self.failed = 0
+        self.errors: List[Dict[str, Any]] = []
+        self.truncated = False
+
+    def add(self, row: int, data: Any) -> bool:
+        """
+        校验一行数据并放入待插入队列
+
+        Args:
+            row: 行号，用于错误提示
+            data: 行数据字典
+
+        Returns:
+            False 表示已达到行数上限，调用方应停止读取
+        """
+        if self.rows >= self.max_rows:
+            self.truncated = True
+            return False
+        self.rows += 1
+
+        if not isinstance(data, dict):
+            self._fail(row, "每一行应为包含开销字段的对象")
+            return True
+        data = dict(data)
+        if data.get("plan_id") in (None, "") and self.default_plan_id is not None:
+            data["plan_id"] = self.default_plan_id
+        if data.get("expense_date") in (None, ""):
+            data.pop("expense_date", None)
+        elif isinstance(data["expense_date"], str):
+            data["expense_date"] = _normalize_date(data["expense_date"])
+        if data.get("description") is None:
+            data["description"] = ""
+
+        try:
+            expense = ExpenseCreate.model_validate(data)
+        except ValidationError as e:
+            self._fail(row, _format_validation_error(e))
+            return True
+
+        values = expense.model_dump()
+        values["category"] = values["category"].strip() or budget_service.DEFAULT_CATEGORY
+        if values.get("expense_date") is None:
+            values["expense_date"] = datetime.utcnow()
+        values["user_id"] = self.user_id
+        self._pending.append((row, values))
+        return True
+
+    @property
+    def chunk_ready(self) -> bool:
+        return len(self._pending) >= self.chunk_size
+
+    async def flush(self) -> None:
+        """
+        把待插入的行写入数据库
+        """
+        chunk, self._pending = self._pending, []
+        if not chunk:
+            return
+        if settings.DATABASE_ASYNC:
+            async with database.AsyncSessionLocal() as db:
+                await self._insert_chunk_async(db, chunk)
+            return
+        # 在工作线程中写入
+        await run_in_session(self._insert_chunk, chunk)
+
+    def result(self) -> Dict[str, Any]:
+        return {
+            "success": self.failed == 0 and not self.truncated,
+            "imported": self.imported,
+            "failed": self.failed,
+            "errors": self.errors,
+            "truncated": self.truncated,
+        }
+
+    def _insert_chunk(self, db: Session, chunk: List[Tuple[int, Dict[str, Any]]]) -> None:
+        unknown = {values["plan_id"] for _, values in chunk} - set(self._plans)
+        if unknown:
+            self._check_plans(unknown, db.execute(self._plans_query(unknown)).all())
+        rows = self._owned_rows(chunk)
+        if not rows:
+            return
+        try:
+            db.execute(insert(Expense), [values for _, values in rows])
+            for plan_id, expenses in _group_by_plan(rows).items():
+                budget_service.apply_expenses(db, plan_id, expenses)
+            db.commit()
+        except SQLAlchemyError as e:
+            db.rollback()
+            self._fail_chunk(rows, e)
+            return
+        self.imported += len(rows)
+
+    async def _insert_chunk_async(self, db: AsyncSession, chunk: List[Tuple[int, Dict[str, Any]]]) -> None:
+        unknown = {values["plan_id"] for _, values in chunk} - set(self._plans)
+        if unknown:
+            self._check_plans(unknown, (await db.execute(self._plans_query(unknown))).all())
+        rows = self._owned_rows(chunk)
+        if not rows:
+            return
+        try:
+            await db.execute(insert(Expense), [values for _, values in rows])
+            for plan_id, expenses in _group_by_plan(rows).items():
+                await budget_service.apply_expenses_async(db, plan_id, expenses)
+            await db.commit()
+        except SQLAlchemyError as e:
+            await db.rollback()
+            self._fail_chunk(rows, e)
+            return
+        self.imported += len(rows)
+
+    @staticmethod
+    def _plans_query(plan_ids):
+        return select(TravelPlan.id, TravelPlan.user_id).where(TravelPlan.id.in_(plan_ids))
+
+    def _check_plans(self, plan_ids, rows) -> None:
+        owners = {plan_id: user_id for plan_id, user_id in rows}
+        for plan_id in plan_ids:
+            if plan_id not in owners:
+                self._plans[plan_id] = "旅行计划不存在"
+            elif owners[plan_id] != self.user_id:
+                self._plans[plan_id] = "无权向该旅行计划添加开销"
+            else:
+                self._plans[plan_id] = None
+
+    def _owned_rows(self, chunk):
+        rows = []
+        for row, values in chunk:
+            error = self._plans.get(values["plan_id"])
+            if error:
+                self._fail(row, error)
+            else:
+                rows.append((row, values))
+        return rows
+
+    def _fail_chunk(self, rows, error: Exception) -> None:
+        logger.error(f"批量导入开销写入失败: {str(error)}")
+        for row, _ in rows:
+            self._fail(row, "写入数据库失败")
+
+    def _fail(self, row: int, error: str) -> None:
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({"row": row, "error": error})
+
+
+async def import_rows(importer: ExpenseImporter, rows: Iterable[Tuple[int, Any]]) -> Dict[str, Any]:
+    """
+    导入已解析好的行（如JSON数组）
+
+    Args:
+        importer: 导入器
+        rows: (行号, 行数据) 序列
+    """
+    for row, data in rows:
+        if not importer.add(row, data):
+            break
+        if importer.chunk_ready:
+            await importer.flush()
+    await importer.flush()
+    return importer.result()
+
+
+async def import_csv(importer: ExpenseImporter, chunks: AsyncIterator[bytes]) -> Dict[str, Any]:
+    """
+    流式导入CSV：边接收边解析，每攒够一块就写入，不把整个文件读入内存
+
+    第一行为表头，支持 plan_id、category、amount、description、expense_date 及中文别名；
+    行号按文件行计算，表头为第1行
+
+    Raises:
+        ValueError: 缺少必需的列或文件不是UTF-8编码
+    """
+    columns = None
+    async for row, record in iter_csv_records(chunks):
+        if columns is None:
+            columns = [CSV_COLUMNS.get(name.strip().lower()) for name in record]
+            if "amount" not in columns:
+                raise ValueError("CSV表头缺少金额列（amount）")
+            continue
+        if not any(value.strip() for value in record):
+            continue
+        data = {
+            name: value.strip()
+            for name, value in zip(columns, record)
+            if name is not None
+        }
+        if "amount" in data:
+            data["amount"] = re.sub(r"[,¥￥\s]", "", data["amount"])
+        if not importer.add(row, data):
+            break
+        if importer.chunk_ready:
+            await importer.flush()
+    await importer.flush()
+    return importer.result()
+
+
+async def import_json(importer: ExpenseImporter, chunks: AsyncIterator[bytes]) -> Dict[str, Any]:
+    """
+    流式导入JSON数组：边接收边解析数组元素，不把整个请求体读入内存
+
+    Raises:
+        ValueError: 请求体不是JSON数组
+    """
+    async for row, data in iter_json_array(chunks):
+        if not importer.add(row, data):
+            break
+        if importer.chunk_ready:
+            await importer.flush()
+    await importer.flush()
+    return importer.result()
+
+
+async def iter_json_array(chunks: AsyncIterator[bytes]) -> AsyncIterator[Tuple[int, Any]]:
+    """
+    把字节流解析为JSON数组的元素，每个元素接收完整后立即产出
+
+    Yields:
+        (从1开始的元素序号, 元素)
+    """
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    pending = ""
+    state = "start"
+    row = 1
+    try:
+        async for chunk in chunks:
+            items, pending, state = _split_json_items(pending + decoder.decode(chunk), state, final=False)
+            for item in items:
+                yield row, item
+                row += 1
+            if len(pending) > MAX_JSON_ITEM_CHARS:
+                raise ValueError(f"第{row}个开销超过 {MAX_JSON_ITEM_CHARS} 个字符")
+        items, _, state = _split_json_items(pending + decoder.decode(b"", final=True), state, final=True)
+    except UnicodeDecodeError:
+        raise ValueError("请求体不是有效的JSON")
+    for item in items:
+        yield row, item
+        row += 1
+    if state != "end":
+        raise ValueError("请求体不是有效的JSON")
+
+
+def _split_json_items(text: str, state: str, final: bool) -> Tuple[List[Any], str, str]:
+    """
+    从缓冲文本中切出完整的数组元素，返回 (元素列表, 剩余文本, 解析状态)
+
+    解析状态：start 等待 '['，first 等待第一个元素或 ']'，item 等待元素，comma 等待 ',' 或 ']'，end 数组已结束
+    """
+    items = []
+    pos = 0
+    while True:
+        while pos < len(text) and text[pos] in _JSON_WHITESPACE:
+            pos += 1
+        if pos == len(text):
+            break
+        char = text[pos]
+        if state == "start":
+            if char != "[":
+                raise ValueError("请求体应为开销数组")
+            state = "first"
+            pos += 1
+        elif state in ("first", "comma") and char == "]":
+            state = "end"
+            pos += 1
+        elif state == "comma" and char == ",":
+            state = "item"
+            pos += 1
+        elif state in ("first", "item") and char not in ",]":
+            try:
+                item, end = _JSON_DECODER.raw_decode(text, pos)
+            except json.JSONDecodeError:
+                if final:
+                    raise ValueError("请求体不是有效的JSON")
+                break
+            if end == len(text) and not final:
+                # 末尾的数字可能还没有接收完整，等待后续数据
+                break
+            items.append(item)
+            state = "comma"
+            pos = end
+        else:
+            raise ValueError("请求体不是有效的JSON")
+    return items, text[pos:], state
+
+
+async def iter_csv_records(chunks: AsyncIterator[bytes]) -> AsyncIterator[Tuple[int, List[str]]]:
+    """
+    把字节流解析为CSV记录，引号内的换行会合并到同一条记录
+
+    Yields:
+        (起始行号, 字段列表)
+    """
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    pending = ""
+    line = 1
+    try:
+        async for chunk in chunks:
+            pending += decoder.decode(chunk)
+            records, pending, line = _split_records(pending, line)
+            for record in records:
+                yield record
+        pending += decoder.decode(b"", final=True)
+    except UnicodeDecodeError:
+        raise ValueError("CSV文件需使用UTF-8编码")
+    if pending.strip():
+        records, _, _ = _split_records(pending + "\n", line)
+        for record in records:
+            yield record
+
+
+def _split_records(text: str, line: int) -> Tuple[List[Tuple[int, List[str]]], str, int]:
+    """
+    从缓冲文本中切出完整的记录，返回 (记录列表, 剩余文本, 下一条记录的行号)
+    """
+    records = []
+    start = 0
+    record_start = 0
+    quotes = 0
+    lines_in_record = 0
+    while True:
+        end = text.find("\n", start)
+        if end < 0:
+            break
+        quotes += text.count('"', start, end)
+        lines_in_record += 1
+        start = end + 1
+        if quotes % 2:
+            # 引号未闭合，记录跨行
+            continue
+        raw = text[record_start:start]
+        if raw.strip():
+            records.append((line, next(csv.reader(io.StringIO(raw)))))
+        line += lines_in_record
+        record_start = start
+        quotes = 0
+        lines_in_record = 0
+    return records, text[record_start:], line
+
+
+def _normalize_date(value: str) -> str:
+    value = value.strip().replace("/", "-")
+    if _DATE_ONLY.match(value):
+        year, month, day = value.split("-")
+        return f"{int(year):04d}-{int(month):02d}-{int(day):02d}T00:00:00"
+    return value
+
+
+def _format_validation_error(error: ValidationError) -> str:
+    return "; ".join(
+        f"{'.'.join(str(part) for part in item['loc'])}: {item['msg']}"
+        for item in error.errors()
+    )
+
+
+def _group_by_plan(rows) -> Dict[int, List[Dict[str, Any]]]:
+    groups = defaultdict(list)
+    for _, values in rows:
+        groups[values["plan_id"]].append(values)
+    return groups
@@ -0,0 +1,308 @@
+import json
+import logging
+import re
+from typing import List, Optional, Tuple
+from pydantic import ValidationError
+from app.schemas.schemas import ItineraryCreate, ItineraryDayCreate, ItineraryActivityBase
+
+logger = logging.getLogger(__name__)
+
+# AI在计划正文之后附带的结构化行程代码块
+ITINERARY_JSON_MARKER = "```json"
+
+ITINERARY_JSON_INSTRUCTION = """
+        最后，请在计划正文之后附上一个 ```json 代码块，按以下格式给出每日行程的结构化数据（只输出JSON，不要注释）：
+        {"days": [{"day_number": 1, "date": "YYYY-MM-DD", "title": "当天主题",
+                   "activities": [{"time": "09:00-11:00", "title": "活动名称", "location": "地点",
+                                   "description": "简要说明", "estimated_cost": 100}]}]}
+"""
+
+_CHINESE_DIGITS = {"零": 0, "一": 1, "二": 2, "两": 2, "三": 3, "四": 4, "五": 5,
+                   "六": 6, "七": 7, "八": 8, "九": 9}
+
+# 第一天 / 第1天 / Day 1
+_DAY_HEADING = re.compile(
+    r"(?:第\s*(?P<cn>[零一二两三四五六七八九十百\d]+)\s*[天日])|(?:\bday\s*(?P<en>\d+)\b)",
+    re.IGNORECASE
+)
+_HEADING = re.compile(r"^\s*(#{1,6}\s+|\*\*)")
+_BULLET = re.compile(r"^(?P<indent>\s*)(?:[-*•·]|\d+[.、)])\s+(?P<text>.+)$")
+_TIME = re.compile(
+    r"^(?P<time>(?:\d{1,2}[:：]\d{2}(?:\s*[-~至到]\s*\d{1,2}[:：]\d{2})?)"
+    r"|(?:清晨|早上|早晨|上午|中午|午间|下午|傍晚|晚上|夜间|全天|午餐|晚餐|早餐))\s*[:：\s]\s*"
+)
+_DATE = re.compile(r"(\d{4})[-/年](\d{1,2})[-/月](\d{1,2})日?")
+_COST = re.compile(r"(?:约|人均|费用|门票)?\s*[¥￥]?\s*(\d+(?:\.\d+)?)\s*(?:元|块|RMB)", re.IGNORECASE)
+_COST_PREFIX = re.compile(r"[¥￥]\s*(\d+(?:\.\d+)?)")
+_LOCATION = re.compile(r"(?:地点|位置|地址)\s*[:：]\s*([^，,；;。)）]+)")
+
+
+def split_structured_output(text: str) -> Tuple[str, Optional[str]]:
+    """
+    将AI输出拆分为展示用的计划正文和结构化行程JSON
+
+    Returns:
+        (计划正文, JSON字符串)；没有JSON代码块时第二项为None
+    """
+    index = text.rfind(ITINERARY_JSON_MARKER)
+    if index < 0:
+        return text, None
+    body = text[index + len(ITINERARY_JSON_MARKER):]
+    end = body.find("```")
+    if end >= 0:
+        body = body[:end]
+    return text[:index].rstrip() + "\n", body.strip()
+
+
+class StructuredOutputFilter:
+    """
+    流式输出时过滤掉结构化行程代码块，只转发计划正文
+
+    增量文本可能在标记中间断开，末尾疑似标记开头的部分会暂存到下一次再判断
+    """
+
+    def __init__(self):
+        self._pending = ""
+        self._hidden = False
+
+    def feed(self, delta: str) -> str:
+        """
+        输入一段增量文本，返回可以展示的部分
+        """
+        if self._hidden:
+            return ""
+        text = self._pending + delta
+        index = text.find(ITINERARY_JSON_MARKER)
+        if index >= 0:
+            self._hidden = True
+            self._pending = ""
+            return text[:index]
+
+        keep = 0
+        for size in range(min(len(ITINERARY_JSON_MARKER) - 1, len(text)), 0, -1):
+            if ITINERARY_JSON_MARKER.startswith(text[-size:]):
+                keep = size
+                break
+        self._pending = text[len(text) - keep:]
+        return text[:len(text) - keep]
+
+    def flush(self) -> str:
+        """
+        流结束时返回暂存的剩余正文
+        """
+        rest = "" if self._hidden else self._pending
+        self._pending = ""
+        return rest
+
+
+def parse_json_itinerary(json_text: str) -> Optional[ItineraryCreate]:
+    """
+    解析并校验结构化行程JSON，格式不符合时返回None
+    """
+    try:
+        data = json.loads(json_text)
+        if isinstance(data, list):
+            data = {"days": data}
+        elif isinstance(data, dict) and "days" not in data and "day_number" in data:
+            # 单日重新生成时只返回一天
+            data = {"days": [data]}
+        itinerary = ItineraryCreate.model_validate(data)
+    except (json.JSONDecodeError, ValidationError) as e:
+        logger.warning(f"结构化行程校验失败，改用Markdown解析: {str(e)}")
+        return None
+    return itinerary if itinerary.days else None
+
+
+def parse_markdown_itinerary(text: str) -> ItineraryCreate:
+    """
+    从Markdown计划正文中解析每日行程
+
+    识别 "第一天"/"第1天"/"Day 1" 形式的标题，标题下的列表项作为当天的活动；
+    遇到其他标题（如"住宿推荐"）时结束当天；缩进的子列表合并到上一个活动的说明中
+    """
+    days: List[ItineraryDayCreate] = []
+    current: Optional[ItineraryDayCreate] = None
+
+    for line in text.splitlines():
+        if not line.strip():
+            continue
+
+        bullet = _BULLET.match(line)
+        is_heading = _HEADING.match(line) is not None
+        # 标题行，或以"第N天"开头的单独一行
+        day_number = None
+        if is_heading or (not bullet and _DAY_HEADING.match(line.strip())):
+            day_number = _day_number(line)
+        if day_number is not None:
+            current = ItineraryDayCreate(
+                day_number=day_number,
+                date=_find_date(line),
+                title=_heading_title(line)
+            )
+            days.append(current)
+            continue
+
+        if is_heading:
+            # 其他章节标题，结束当前这一天
+            current = None
+            continue
+
+        if current is None or not bullet:
+            continue
+
+        content = bullet.group("text").strip()
+        if bullet.group("indent") and current.activities:
+            previous = current.activities[-1]
+            previous.description = f"{previous.description}；{content}" if previous.description else content
+            if previous.estimated_cost is None:
+                previous.estimated_cost = _find_cost(content)
+            continue
+        current.activities.append(_parse_activity(content))
+
+    # 同一天被重复列出时保留第一次出现的内容
+    unique = {}
+    for day in days:
+        unique.setdefault(day.day_number, day)
+    return ItineraryCreate(days=sorted(unique.values(), key=lambda d: d.day_number))
+
+
+def parse_itinerary(text: str) -> Tuple[str, ItineraryCreate, str]:
+    """
+    解析AI生成的计划：优先使用结构化JSON，失败时回退到Markdown解析
+
+    Returns:
+        (计划正文, 行程, 来源 "json" / "markdown")
+    """
+    body, json_text = split_structured_output(text)
+    if json_text:
+        itinerary = parse_json_itinerary(json_text)
+        if itinerary is not None:
+            return body, itinerary, "json"
+    return body, parse_markdown_itinerary(body), "markdown"
+
+
+def find_day_section(text: str, day_number: int) -> Optional[Tuple[int, int]]:
+    """
+    在计划正文中定位某一天的段落
+
+    段落从当天的标题开始，到下一天的标题或同级及更高级别的标题为止
+
+    Returns:
+        (起始位置, 结束位置)，找不到时返回None
+    """
+    start = None
+    start_level = 0
+    offset = 0
+    for line in text.splitlines(keepends=True):
+        level = _heading_level(line)
+        is_day = (level or (not _BULLET.match(line) and _DAY_HEADING.match(line.strip()))) \
+            and _day_number(line) is not None
+        if start is None:
+            if is_day and _day_number(line) == day_number:
+                start = offset
+                start_level = level or 7
+        elif is_day or (level and level <= start_level):
+            return start, offset
+        offset += len(line)
+    if start is None:
+        return None
+    return start, len(text)
+
+
+def replace_day_section(text: str, day_number: int, section: str) -> Optional[str]:
+    """
+    用新的段落替换计划正文中某一天的段落，找不到该天时返回None
+    """
+    span = find_day_section(text, day_number)
+    if span is None:
+        return None
+    start, end = span
+    section = section.strip("\n") + "\n"
+    if end < len(text):
+        section += "\n"
+    return text[:start] + section + text[end:]
+
+
+def _heading_level(line: str) -> int:
+    """
+    Markdown标题级别；加粗的单独一行视为最低一级（7），不是标题时返回0
+    """
+    match = _HEADING.match(line)
+    if not match:
+        return 0
+    marker = match.group(1).strip()
+    return len(marker) if marker.startswith("#") else 7
+
+
+def _day_number(line: str) -> Optional[int]:
+    match = _DAY_HEADING.search(line)
+    if not match:
+        return None
+    value = match.group("cn") or match.group("en")
+    number = int(value) if value.isdigit() else _chinese_to_int(value)
+    return number if number and number > 0 else None
+
+
+def _chinese_to_int(value: str) -> Optional[int]:
+    """
+    转换一百以内的中文数字，如 "三"、"十二"、"二十"
+    """
+    if value.isdigit():
+        return int(value)
+    if "百" in value:
+        return None
+    if "十" in value:
+        tens, _, ones = value.partition("十")
+        tens_value = _CHINESE_DIGITS.get(tens, 1) if tens else 1
+        ones_value = _CHINESE_DIGITS.get(ones, 0) if ones else 0
+        return tens_value * 10 + ones_value
+    return _CHINESE_DIGITS.get(value)
+
+
+def _heading_title(line: str) -> Optional[str]:
+    text = line.strip().lstrip("#").strip().strip("*").strip()
+    match = _DAY_HEADING.search(text)
+    if match:
+        text = text[match.end():]
+    text = _DATE.sub("", text)
+    text = text.strip(" :：-—()（）|*")
+    return text or None
+
+
+def _find_date(line: str):
+    match = _DATE.search(line)
+    if not match:
+        return None
+    return f"{int(match.group(1)):04d}-{int(match.group(2)):02d}-{int(match.group(3)):02d}"
+
+
+def _find_cost(text: str) -> Optional[float]:
+    match = _COST.search(text) or _COST_PREFIX.search(text)
+    return float(match.group(1)) if match else None
+
+
+def _parse_activity(content: str) -> ItineraryActivityBase:
+    content = content.replace("**", "")
+    time = None
+    match = _TIME.match(content)
+    if match:
+        time = match.group("time").replace("：", ":")
+        content = content[match.end():].strip()
+
+    location = None
+    location_match = _LOCATION.search(content)
+    if location_match:
+        location = location_match.group(1).strip()
+
+    # 第一个分句作为活动名称，其余作为说明
+    parts = re.split(r"[，,；;。]", content, maxsplit=1)
+    title = parts[0].strip() or content
+    description = parts[1].strip() if len(parts) > 1 and parts[1].strip() else None
+
+    return ItineraryActivityBase(
+        time=time,
+        title=title,
+        location=location,
+        description=description,
+        estimated_cost=_find_cost(content)
+    )
@@ -0,0 +1,292 @@
+import asyncio
+import logging
+import os
+import socket
+import uuid
+from datetime import datetime, timedelta
+from typing import Dict, Any, List, Optional
+from sqlalchemy import or_
+from sqlalchemy.orm import Session
+from app.core.config import settings
+from app.database.database import run_in_session
+from app.models.models import GenerationJob, User
+from app.services import travel_service
+
+logger = logging.getLogger(__name__)
+
+ACTIVE_STATUSES = ("queued", "running")
+
+
+class JobLimitExceeded(Exception):
+    """
+    用户排队和执行中的任务数已达上限
+    """
+
+
+def get_job(db: Session, job_id: str):
+    return db.query(GenerationJob).filter(GenerationJob.id == job_id).first()
+
+
+def create_job(db: Session, user_id: int, destination: str, start_date: datetime, end_date: datetime,
+               budget: float, preferences: str, travelers: int, max_active: int):
+    """
+    创建排队中的生成任务，超过用户并发上限时抛出 JobLimitExceeded
+
+    先写入新任务再在同一事务中统计，超出上限时回滚：
+    SQLite 的写事务互斥，写入之后的统计能看到其他已提交的任务；
+    PostgreSQL 上先锁定用户行，同一用户的提交依次执行（用户没有任务时无法锁定任务行，因此锁用户行）
+    """
+    db.query(User.id).filter(User.id == user_id).with_for_update().first()
+    db_job = GenerationJob(
+        id=uuid.uuid4().hex,
+        user_id=user_id,
+        status="queued",
+        destination=destination,
+        start_date=start_date,
+        end_date=end_date,
+        budget=budget,
+        preferences=preferences,
+        travelers=travelers
+    )
+    db.add(db_job)
+    db.flush()
+    active = db.query(GenerationJob).filter(
+        GenerationJob.user_id == user_id,
+        GenerationJob.status.in_(ACTIVE_STATUSES)
+    ).count()
+    if active > max_active:
+        db.rollback()
+        raise JobLimitExceeded(f"最多同时进行 {max_active} 个生成任务，请等待已有任务完成")
+    db.commit()
+    db.refresh(db_job)
+    return db_job
+
+
+def claim_job(db: Session, job_id: str, worker_id: str):
+    """
+    将排队中的任务标记为由 worker_id 执行；任务不存在或已被领取时返回None
+    """
+    now = datetime.utcnow()
+    claimed = db.query(GenerationJob).filter(
+        GenerationJob.id == job_id,
+        GenerationJob.status == "queued"
+    ).update(
+        {"status": "running", "worker_id": worker_id, "started_at": now, "heartbeat_at": now},
+        synchronize_session=False
+    )
+    db.commit()
+    if not claimed:
+        return None
+    return get_job(db, job_id)
+
+
+def heartbeat_job(db: Session, job_id: str, worker_id: str) -> bool:
+    """
+    续期执行中任务的租约
+
+    Returns:
+        任务仍由 worker_id 执行时返回True；租约已过期并被重新排队时返回False
+    """
+    renewed = db.query(GenerationJob).filter(
+        GenerationJob.id == job_id,
+        GenerationJob.status == "running",
+        GenerationJob.worker_id == worker_id
+    ).update({"heartbeat_at": datetime.utcnow()}, synchronize_session=False)
+    db.commit()
+    return bool(renewed)
+
+
+def finish_job(db: Session, job_id: str, worker_id: str, plan_id: Optional[int] = None,
+               error: Optional[str] = None) -> bool:
+    """
+    记录任务结果，只有仍持有租约的执行者可以写入
+
+    Returns:
+        是否写入了结果
+    """
+    finished = db.query(GenerationJob).filter(
+        GenerationJob.id == job_id,
+        GenerationJob.status == "running",
+        GenerationJob.worker_id == worker_id
+    ).update({
+        "status": "failed" if error else "done",
+        "plan_id": plan_id,
+        "error": error,
+        "finished_at": datetime.utcnow()
+    }, synchronize_session=False)
+    db.commit()
+    return bool(finished)
+
+
+def requeue_expired_jobs(db: Session, lease_seconds: float) -> List[str]:
+    """
+    把租约已过期的执行中任务重新排队（执行它的进程已退出或失去响应）
+
+    其他存活进程正在执行的任务会持续续期，不会被重新排队
+
+    Returns:
+        重新排队的任务ID
+    """
+    expired = or_(
+        GenerationJob.heartbeat_at.is_(None),
+        GenerationJob.heartbeat_at < datetime.utcnow() - timedelta(seconds=lease_seconds)
+    )
+    job_ids = [
+        job.id for job in db.query(GenerationJob.id).filter(GenerationJob.status == "running", expired)
+    ]
+    requeued = []
+    for job_id in job_ids:
+        # 带上过期条件再更新一次，读取之后刚续期的任务不会被重新排队
+        updated = db.query(GenerationJob).filter(
+            GenerationJob.id == job_id,
+            GenerationJob.status == "running",
+            expired
+        ).update(
+            {"status": "queued", "worker_id": None, "started_at": None, "heartbeat_at": None},
+            synchronize_session=False
+        )
+        if updated:
+            requeued.append(job_id)
+    db.commit()
+    return requeued
+
+
+def recover_jobs(db: Session, lease_seconds: float) -> List[str]:
+    """
+    服务启动时恢复任务：租约过期的执行中任务重新排队
+
+    Returns:
+        按创建时间排序的待执行任务ID
+    """
+    requeue_expired_jobs(db, lease_seconds)
+    jobs = db.query(GenerationJob.id).filter(
+        GenerationJob.status == "queued"
+    ).order_by(GenerationJob.created_at).all()
+    return [job.id for job in jobs]
+
+
+class GenerationJobQueue:
+    """
+    进程内的旅游计划生成任务队列
+
+    任务状态保存在数据库中，固定数量的后台工作协程依次执行排队的任务。
+    多个进程（多个 uvicorn worker 或滚动发布）共用同一张任务表：领取任务是原子操作，
+    执行中的任务记录执行者并定期续期租约，只有租约过期的任务才会被其他进程重新排队
+    """
+
+    def __init__(self, workers: int, lease_seconds: float):
+        self.workers = workers
+        self.lease_seconds = lease_seconds
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        # 启动之前提交的任务先在队列中等待，start() 之后由工作协程执行
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._tasks: List[asyncio.Task] = []
+
+    async def start(self):
+        """
+        启动工作协程和租约检查，并恢复租约已过期的任务
+        """
+        # 启动之前提交的任务也会被 recover_jobs 返回，重复排队的任务领取时会被跳过
+        for job_id in await run_in_session(recover_jobs, self.lease_seconds):
+            self._queue.put_nowait(job_id)
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        self._tasks.append(asyncio.create_task(self._reaper()))
+
+    async def stop(self):
+        """
+        停止工作协程；执行中的任务不再续期，租约过期后由其他进程或下次启动时重新排队
+        """
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def submit(self, user_id: int, destination: str, start_date: datetime, end_date: datetime,
+                     budget: float, preferences: str, travelers: int = 1):
+        """
+        提交生成任务
+
+        Raises:
+            JobLimitExceeded: 用户的进行中任务已达上限
+        """
+        db_job = await run_in_session(
+            create_job,
+            user_id=user_id,
+            destination=destination,
+            start_date=start_date,
+            end_date=end_date,
+            budget=budget,
+            preferences=preferences,
+            travelers=travelers,
+            max_active=settings.GENERATION_JOB_MAX_PER_USER
+        )
+        self._queue.put_nowait(db_job.id)
+        return db_job
+
+    async def _worker(self):
+        while True:
+            job_id = await self._queue.get()
+            try:
+                await self._run(job_id)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"生成任务 {job_id} 执行失败: {str(e)}")
+            finally:
+                self._queue.task_done()
+
+    async def _reaper(self):
+        # 定期把其他进程遗留的过期任务领回本进程执行
+        while True:
+            await asyncio.sleep(self.lease_seconds)
+            try:
+                for job_id in await run_in_session(requeue_expired_jobs, self.lease_seconds):
+                    logger.warning(f"生成任务 {job_id} 的租约已过期，重新排队")
+                    self._queue.put_nowait(job_id)
+            except Exception as e:
+                logger.error(f"检查生成任务租约失败: {str(e)}")
+
+    async def _heartbeat(self, job_id: str):
+        while True:
+            await asyncio.sleep(self.lease_seconds / 3)
+            try:
+                if not await run_in_session(heartbeat_job, job_id, self.worker_id):
+                    logger.warning(f"生成任务 {job_id} 的租约已失效")
+                    return
+            except Exception as e:
+                logger.error(f"生成任务 {job_id} 续期失败: {str(e)}")
+
+    async def _run(self, job_id: str):
+        db_job = await run_in_session(claim_job, job_id, self.worker_id)
+        if db_job is None:
+            return
+
+        heartbeat = asyncio.create_task(self._heartbeat(job_id))
+        try:
+            result: Dict[str, Any] = await travel_service.travel_service.generate_and_save_travel_plan(
+                user_id=db_job.user_id,
+                destination=db_job.destination,
+                start_date=db_job.start_date,
+                end_date=db_job.end_date,
+                budget=db_job.budget,
+                preferences=db_job.preferences,
+                travelers=db_job.travelers
+            )
+        except Exception as e:
+            result = {"success": False, "error": f"生成旅游计划时发生错误: {str(e)}"}
+        finally:
+            heartbeat.cancel()
+
+        if result["success"]:
+            finished = await run_in_session(finish_job, job_id, self.worker_id, plan_id=result["plan"].id)
+        else:
+            finished = await run_in_session(finish_job, job_id, self.worker_id, error=result.get("error", "未知错误"))
+        if not finished:
+            logger.warning(f"生成任务 {job_id} 的租约已失效，未记录本次结果")
+
+
+# 创建全局实例
+generation_job_queue = GenerationJobQueue(
+    workers=settings.GENERATION_JOB_WORKERS,
+    lease_seconds=settings.GENERATION_JOB_LEASE_SECONDS
+)
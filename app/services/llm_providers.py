@@ -0,0 +1,190 @@
+import importlib.util
+import logging
+from abc import ABC, abstractmethod
+from typing import Any, Dict, List, Optional, Type
+import httpx
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+def _build_client() -> httpx.AsyncClient:
+    """
+    创建按配置调优的HTTP客户端：连接池大小、keep-alive、HTTP/2和分阶段超时
+    """
+    http2 = settings.LLM_HTTP2
+    if http2 and importlib.util.find_spec("h2") is None:
+        # HTTP/2 需要安装 h2，缺失时退回 HTTP/1.1
+        logger.warning("未安装h2，LLM客户端使用HTTP/1.1")
+        http2 = False
+
+    return httpx.AsyncClient(
+        http2=http2,
+        limits=httpx.Limits(
+            max_connections=settings.LLM_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.LLM_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=settings.LLM_KEEPALIVE_EXPIRY
+        ),
+        timeout=httpx.Timeout(
+            connect=settings.LLM_CONNECT_TIMEOUT,
+            read=settings.LLM_READ_TIMEOUT,
+            write=settings.LLM_WRITE_TIMEOUT,
+            pool=settings.LLM_POOL_TIMEOUT
+        )
+    )
+
+
+class LLMProvider(ABC):
+    """
+    大语言模型服务提供方的基类
+
+    每个提供方持有自己的HTTP客户端，并负责请求体构建和响应解析
+    """
+
+    name = ""
+    default_model = ""
+
+    def __init__(self, api_key: str, endpoint: str, model: Optional[str] = None):
+        self.api_key = api_key
+        self.endpoint = endpoint
+        self.model = model or self.default_model
+        self.client = _build_client()
+
+    def headers(self, stream: bool = False) -> Dict[str, str]:
+        return {
+            "Authorization": f"Bearer {self.api_key}",
+            "Content-Type": "application/json"
+        }
+
+    @abstractmethod
+    def build_payload(self, messages: List[Dict[str, str]], temperature: float,
+                      max_tokens: int, stream: bool = False) -> Dict[str, Any]:
+        """
+        构建请求体
+        """
+
+    @abstractmethod
+    def parse_response(self, result: Dict[str, Any]) -> str:
+        """
+        从完整响应中取出生成的文本
+        """
+
+    @abstractmethod
+    def parse_stream_chunk(self, chunk: Dict[str, Any]) -> str:
+        """
+        从一条SSE事件中取出增量文本
+        """
+
+    def parse_usage(self, result: Dict[str, Any]) -> Optional[int]:
+        """
+        从完整响应或流式事件中取出实际消耗的token数，没有用量信息时返回None
+        """
+        usage = result.get("usage") or {}
+        if "total_tokens" in usage:
+            return usage["total_tokens"]
+        if "input_tokens" in usage or "output_tokens" in usage:
+            return usage.get("input_tokens", 0) + usage.get("output_tokens", 0)
+        return None
+
+    async def close(self):
+        await self.client.aclose()
+
+
+class OpenAIProvider(LLMProvider):
+    """
+    OpenAI 及兼容 OpenAI Chat Completions 格式的服务
+    """
+
+    name = "openai"
+    default_model = "gpt-3.5-turbo"
+
+    def build_payload(self, messages, temperature, max_tokens, stream=False):
+        payload = {
+            "model": self.model,
+            "messages": messages,
+            "temperature": temperature,
+            "max_tokens": max_tokens
+        }
+        if stream:
+            payload["stream"] = True
+            # 最后一条事件带上本次请求的用量，用于修正配额
+            payload["stream_options"] = {"include_usage": True}
+        return payload
+
+    def parse_response(self, result):
+        return result["choices"][0]["message"]["content"]
+
+    def parse_stream_chunk(self, chunk):
+        # 带用量的最后一条事件 choices 为空
+        if not chunk["choices"]:
+            return ""
+        return chunk["choices"][0].get("delta", {}).get("content") or ""
+
+
+class DashScopeProvider(LLMProvider):
+    """
+    阿里云百炼平台
+    """
+
+    name = "dashscope"
+    default_model = "qwen-turbo"
+
+    def headers(self, stream=False):
+        headers = super().headers(stream)
+        if stream:
+            # 开启SSE流式输出
+            headers["X-DashScope-SSE"] = "enable"
+        return headers
+
+    def build_payload(self, messages, temperature, max_tokens, stream=False):
+        parameters = {
+            "temperature": temperature,
+            "max_tokens": max_tokens
+        }
+        if stream:
+            # 只返回增量内容
+            parameters["incremental_output"] = True
+        return {
+            "model": self.model,
+            "input": {"messages": messages},
+            "parameters": parameters
+        }
+
+    def parse_response(self, result):
+        return result["output"]["text"]
+
+    def parse_stream_chunk(self, chunk):
+        return chunk["output"].get("text") or ""
+
+
+# 提供方注册表
+PROVIDERS: Dict[str, Type[LLMProvider]] = {
+    OpenAIProvider.name: OpenAIProvider,
+    DashScopeProvider.name: DashScopeProvider,
+}
+
+
+def detect_provider_name(endpoint: str) -> str:
+    """
+    根据API端点推断提供方
+    """
+    if "dashscope" in endpoint or "aliyuncs" in endpoint:
+        return DashScopeProvider.name
+    return OpenAIProvider.name
+
+
+def create_provider(api_key: str, endpoint: str, name: Optional[str] = None,
+                    model: Optional[str] = None) -> LLMProvider:
+    """
+    创建提供方实例
+
+    Args:
+        api_key: API密钥
+        endpoint: API端点
+        name: 提供方名称，为空时根据端点推断
+        model: 模型名称，为空时使用提供方默认模型
+    """
+    name = (name or detect_provider_name(endpoint)).lower()
+    if name not in PROVIDERS:
+        raise ValueError(f"未知的LLM提供方: {name}")
+    return PROVIDERS[name](api_key, endpoint, model)
@@ -0,0 +1,240 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Awaitable, Callable, List, Optional
+from app.services.llm_providers import LLMProvider
+from app.services.resilience import (
+    AdaptiveConcurrencyLimiter,
+    CircuitBreaker,
+    CircuitOpenError,
+    ConcurrencyLimitExceeded,
+    is_provider_failure,
+    status_code_of,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class ProviderHealth:
+    """
+    单个提供方的熔断器、并发限制和延迟统计
+    """
+
+    def __init__(self, breaker: CircuitBreaker, limiter: AdaptiveConcurrencyLimiter, window: int = 100):
+        self.breaker = breaker
+        self.limiter = limiter
+        self.latencies = deque(maxlen=window)
+
+    def is_healthy(self) -> bool:
+        return self.breaker.state != CircuitBreaker.OPEN
+
+    def record_success(self, latency: float) -> None:
+        self.breaker.record_success()
+        self.latencies.append(latency)
+
+    def record_failure(self) -> None:
+        self.breaker.record_failure()
+
+    def percentile(self, q: float, min_samples: int = 20) -> Optional[float]:
+        """
+        最近请求延迟的分位数，样本不足时返回None
+        """
+        if len(self.latencies) < min_samples:
+            return None
+        ordered = sorted(self.latencies)
+        index = min(len(ordered) - 1, int(q * len(ordered)))
+        return ordered[index]
+
+    def stats(self) -> dict:
+        return {"circuit": self.breaker.state, **self.limiter.stats()}
+
+
+class LLMRouter:
+    """
+    多提供方路由：按配置顺序故障转移，可选对冲请求
+
+    - 熔断与并发限制：每个提供方有独立的熔断器和AIMD并发上限，
+      熔断或并发已满时立即失败，不再等待上游超时；只有网络错误、超时和5xx计入熔断
+    - 故障转移：当前提供方出错时依次尝试下一个，熔断中的提供方排在最后
+    - 对冲请求：首选提供方在其延迟分位数（默认p95）内没有返回时，
+      向备用提供方再发一次请求，先成功的结果胜出，另一个请求被取消
+    """
+
+    def __init__(self,
+                 providers: List[LLMProvider],
+                 failure_threshold: int = 3,
+                 cooldown: float = 30.0,
+                 half_open_max_calls: int = 1,
+                 concurrency_initial: int = 10,
+                 concurrency_min: int = 1,
+                 concurrency_max: int = 50,
+                 latency_target: float = 30.0,
+                 queue_timeout: float = 5.0,
+                 hedge_enabled: bool = False,
+                 hedge_percentile: float = 0.95,
+                 hedge_default_delay: float = 10.0,
+                 hedge_min_delay: float = 1.0):
+        self.providers = providers
+        self.health = {
+            id(provider): ProviderHealth(
+                CircuitBreaker(failure_threshold, cooldown, half_open_max_calls),
+                AdaptiveConcurrencyLimiter(
+                    initial_limit=concurrency_initial,
+                    min_limit=concurrency_min,
+                    max_limit=concurrency_max,
+                    latency_target=latency_target,
+                    queue_timeout=queue_timeout
+                )
+            )
+            for provider in providers
+        }
+        self.hedge_enabled = hedge_enabled
+        self.hedge_percentile = hedge_percentile
+        self.hedge_default_delay = hedge_default_delay
+        self.hedge_min_delay = hedge_min_delay
+
+    def ordered_providers(self) -> List[LLMProvider]:
+        """
+        未熔断的提供方按配置顺序在前，熔断中的排在最后（通常会立即失败）
+        """
+        healthy = [p for p in self.providers if self.health[id(p)].is_healthy()]
+        unhealthy = [p for p in self.providers if not self.health[id(p)].is_healthy()]
+        return healthy + unhealthy
+
+    def stats(self) -> dict:
+        return {provider.name: self.health[id(provider)].stats() for provider in self.providers}
+
+    @asynccontextmanager
+    async def guard(self, provider: LLMProvider) -> AsyncIterator[None]:
+        """
+        包裹一次上游请求：检查熔断器、占用并发名额，结束后记录结果并调整并发上限
+
+        Raises:
+            CircuitOpenError: 该提供方处于熔断状态
+            ConcurrencyLimitExceeded: 该提供方并发已满
+        """
+        health = self.health[id(provider)]
+        health.breaker.before_call()
+        try:
+            await health.limiter.acquire()
+        except ConcurrencyLimitExceeded:
+            health.breaker.record_cancelled()
+            raise
+
+        started = time.monotonic()
+        try:
+            yield
+        except (asyncio.CancelledError, GeneratorExit):
+            # 被取消（对冲落败或客户端断开）不代表上游故障
+            health.breaker.record_cancelled()
+            await health.limiter.release(time.monotonic() - started, dropped=True)
+            raise
+        except Exception as e:
+            latency = time.monotonic() - started
+            if is_provider_failure(e):
+                health.record_failure()
+                await health.limiter.release(latency, success=False)
+            else:
+                # 上游正常响应了限流或请求错误，提供方可用，不计入熔断；
+                # 限流说明并发偏高，缩小并发上限，其他错误不参与调整
+                health.breaker.record_success()
+                await health.limiter.release(latency, success=False, dropped=status_code_of(e) != 429)
+            raise
+        latency = time.monotonic() - started
+        health.record_success(latency)
+        await health.limiter.release(latency, success=True)
+
+    def hedge_delay(self, provider: LLMProvider) -> float:
+        """
+        对冲等待时间：取该提供方的延迟分位数，样本不足时使用默认值
+        """
+        delay = self.health[id(provider)].percentile(self.hedge_percentile)
+        if delay is None:
+            delay = self.hedge_default_delay
+        return max(self.hedge_min_delay, delay)
+
+    async def call(self, attempt: Callable[[LLMProvider], Awaitable[Any]]) -> Any:
+        """
+        通过可用的提供方执行一次请求
+
+        Args:
+            attempt: 接收提供方并发起请求的协程函数，失败时抛出异常
+
+        Returns:
+            第一个成功的结果
+
+        Raises:
+            所有提供方都失败时抛出最后一个上游异常；
+            全部熔断或并发已满时抛出 CircuitOpenError / ConcurrencyLimitExceeded
+        """
+        candidates = self.ordered_providers()
+        if self.hedge_enabled and len(candidates) > 1:
+            return await self._call_hedged(attempt, candidates)
+
+        last_error = None
+        for provider in candidates:
+            try:
+                return await self._timed(attempt, provider)
+            except Exception as e:
+                last_error = self._pick_error(last_error, e)
+                logger.warning(f"LLM提供方 {provider.name} 请求失败，尝试下一个: {str(e)}")
+        raise last_error
+
+    async def _timed(self, attempt, provider: LLMProvider) -> Any:
+        async with self.guard(provider):
+            return await attempt(provider)
+
+    @staticmethod
+    def _pick_error(previous: Optional[Exception], current: Exception) -> Exception:
+        """
+        优先保留真实的上游错误，熔断或限流造成的快速失败只在没有其他错误时上报
+        """
+        if previous is not None and isinstance(current, (CircuitOpenError, ConcurrencyLimitExceeded)):
+            return previous
+        return current
+
+    async def _call_hedged(self, attempt, candidates: List[LLMProvider]) -> Any:
+        remaining = list(candidates)
+        running = {}
+        last_error = None
+
+        def launch():
+            provider = remaining.pop(0)
+            running[asyncio.ensure_future(self._timed(attempt, provider))] = provider
+            return provider
+
+        try:
+            primary = launch()
+            hedge_timeout = self.hedge_delay(primary)
+            while running:
+                done, _ = await asyncio.wait(
+                    running,
+                    timeout=hedge_timeout if remaining else None,
+                    return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    # 首选提供方太慢，向下一个提供方发起对冲请求
+                    hedged = launch()
+                    logger.info(f"LLM请求超过 {hedge_timeout:.1f}s 未返回，对冲到 {hedged.name}")
+                    hedge_timeout = self.hedge_delay(hedged)
+                    continue
+                for task in done:
+                    provider = running.pop(task)
+                    try:
+                        return task.result()
+                    except Exception as e:
+                        last_error = self._pick_error(last_error, e)
+                        logger.warning(f"LLM提供方 {provider.name} 请求失败: {str(e)}")
+                # 失败后如果没有其他进行中的请求，立即尝试下一个提供方
+                if not running and remaining:
+                    launch()
+            raise last_error
+        finally:
+            # 取消落败的请求
+            for task in running:
+                if task.done() and not task.cancelled():
+                    task.exception()
+                else:
+                    task.cancel()
@@ -1,7 +1,32 @@
 import httpx
 import json
-from typing import Dict, Any, Optional
+import time
+from contextlib import aclosing
+from typing import Dict, Any, Optional, AsyncIterator, List
 from app.core.config import settings
+from app.schemas.schemas import BudgetSummary
+from app.services.cache_service import build_cache_key, create_cache
+from app.services.itinerary_parser import ITINERARY_JSON_INSTRUCTION
+from app.services.llm_providers import LLMProvider, create_provider
+from app.services.llm_router import LLMRouter
+from app.services.rate_limiter import (
+    PRIORITY_BACKGROUND,
+    PRIORITY_INTERACTIVE,
+    QuotaScheduler,
+    RateLimitExceeded,
+    estimate_tokens,
+)
+from app.services.resilience import (
+    RETRYABLE_STATUS_CODES,
+    CircuitOpenError,
+    ConcurrencyLimitExceeded,
+    RetryPolicy,
+)
+from app.services.singleflight import SingleFlight
+
+TRAVEL_PLANNER_PROMPT = "你是一个专业的旅游规划师，能够根据用户需求生成详细的旅游计划。请用中文回复，提供结构化和易读的旅游计划。"
+DAY_PLANNER_PROMPT = "你是一个专业的旅游规划师，负责修改已有旅游计划中的某一天。请用中文回复，只输出这一天的安排，与前后几天的行程保持衔接。"
+BUDGET_ANALYST_PROMPT = "你是一个专业的财务分析师，专门分析旅行预算。请用中文回复，提供结构化和易读的预算分析报告。"
 
 
 class LLMService:
@@ -12,7 +37,52 @@ class LLMService:
     def __init__(self):
         self.api_key = settings.AI_API_KEY
         self.api_endpoint = settings.AI_API_ENDPOINT
-        self.client = httpx.AsyncClient()
+        # 启动时选定提供方，之后的调用不再按端点分支；备用提供方按配置顺序用于故障转移
+        self.providers: List[LLMProvider] = []
+        if not self._use_mock():
+            self.providers.append(create_provider(
+                self.api_key, self.api_endpoint, name=settings.LLM_PROVIDER, model=settings.LLM_MODEL
+            ))
+            for fallback in settings.LLM_FALLBACK_PROVIDERS:
+                self.providers.append(create_provider(
+                    fallback["api_key"],
+                    fallback["endpoint"],
+                    name=fallback.get("provider"),
+                    model=fallback.get("model")
+                ))
+        self.provider: Optional[LLMProvider] = self.providers[0] if self.providers else None
+        self.router = LLMRouter(
+            self.providers,
+            failure_threshold=settings.LLM_PROVIDER_FAILURE_THRESHOLD,
+            cooldown=settings.LLM_PROVIDER_COOLDOWN_SECONDS,
+            half_open_max_calls=settings.LLM_CIRCUIT_HALF_OPEN_MAX_CALLS,
+            concurrency_initial=settings.LLM_CONCURRENCY_INITIAL,
+            concurrency_min=settings.LLM_CONCURRENCY_MIN,
+            concurrency_max=settings.LLM_CONCURRENCY_MAX,
+            latency_target=settings.LLM_CONCURRENCY_LATENCY_TARGET,
+            queue_timeout=settings.LLM_CONCURRENCY_QUEUE_TIMEOUT,
+            hedge_enabled=settings.LLM_HEDGE_ENABLED,
+            hedge_percentile=settings.LLM_HEDGE_PERCENTILE,
+            hedge_default_delay=settings.LLM_HEDGE_DEFAULT_DELAY,
+            hedge_min_delay=settings.LLM_HEDGE_MIN_DELAY
+        )
+        self.retry_policy = RetryPolicy(
+            max_attempts=settings.LLM_RETRY_MAX_ATTEMPTS,
+            base_delay=settings.LLM_RETRY_BASE_DELAY,
+            max_delay=settings.LLM_RETRY_MAX_DELAY
+        )
+        self.scheduler = QuotaScheduler(
+            rpm=settings.LLM_RATE_LIMIT_RPM,
+            tpm=settings.LLM_RATE_LIMIT_TPM,
+            max_wait=settings.LLM_RATE_LIMIT_MAX_WAIT
+        )
+        self.inflight = SingleFlight()
+        self.cache = create_cache(
+            settings.LLM_CACHE_BACKEND,
+            max_entries=settings.LLM_CACHE_MAX_ENTRIES,
+            ttl=settings.LLM_CACHE_TTL_SECONDS,
+            path=settings.LLM_CACHE_PATH
+        )
     
     async def generate_travel_plan(self, 
                                  destination: str, 
@@ -20,7 +90,8 @@ class LLMService:
                                  end_date: str, 
                                  budget: float, 
                                  preferences: str,
-                                 travelers: int = 1) -> Dict[str, Any]:
+                                 travelers: int = 1,
+                                 user_id: Optional[int] = None) -> Dict[str, Any]:
         """
         生成旅游计划
         
@@ -31,12 +102,13 @@ class LLMService:
             budget: 预算
             preferences: 偏好
             travelers: 旅行人数
+            user_id: 发起请求的用户ID，用于配额的公平调度
             
         Returns:
             包含旅游计划详细信息的字典
         """
         # 如果没有配置API密钥，返回模拟数据
-        if not self.api_key or not self.api_endpoint or "example.com" in self.api_endpoint:
+        if self._use_mock():
             return self._generate_mock_plan(destination, start_date, end_date, budget, preferences, travelers)
         
         # 构建提示词
@@ -44,72 +116,16 @@ class LLMService:
             destination, start_date, end_date, budget, preferences, travelers
         )
         
-        # 构建API请求
-        headers = {
-            "Authorization": f"Bearer {self.api_key}",
-            "Content-Type": "application/json"
-        }
-        
-        payload = {
-            "model": "gpt-3.5-turbo",  # 可根据实际API调整
-            "messages": [
-                {
-                    "role": "system",
-                    "content": "你是一个专业的旅游规划师，能够根据用户需求生成详细的旅游计划。请用中文回复，提供结构化和易读的旅游计划。"
-                },
-                {
-                    "role": "user",
-                    "content": prompt
-                }
-            ],
-            "temperature": 0.7,
-            "max_tokens": 2000
-        }
-        
-        try:
-            # 发送请求到AI API
-            response = await self.client.post(
-                self.api_endpoint,
-                headers=headers,
-                json=payload,
-                timeout=60.0
-            )
-            response.raise_for_status()
-            
-            # 解析响应
-            result = response.json()
-            plan_content = result["choices"][0]["message"]["content"]
-            
-            return {
-                "success": True,
-                "plan": plan_content,
-                "raw_response": result
-            }
-            
-        except httpx.TimeoutException:
-            return {
-                "success": False,
-                "error": "请求AI服务超时，请稍后重试",
-                "plan": None
-            }
-        except httpx.RequestError as e:
-            return {
-                "success": False,
-                "error": f"网络请求错误: {str(e)}",
-                "plan": None
-            }
-        except KeyError as e:
-            return {
-                "success": False,
-                "error": f"AI服务返回格式错误: {str(e)}",
-                "plan": None
-            }
-        except Exception as e:
-            return {
-                "success": False,
-                "error": f"生成旅游计划时发生未知错误: {str(e)}",
-                "plan": None
-            }
+        return await self._complete(
+            TRAVEL_PLANNER_PROMPT,
+            prompt,
+            temperature=0.7,
+            max_tokens=2000,
+            result_key="plan",
+            action="生成旅游计划",
+            user_id=user_id,
+            priority=PRIORITY_INTERACTIVE
+        )
     
     async def generate_travel_plan_with_dashscope(self,
                                                 destination: str,
@@ -121,6 +137,68 @@ class LLMService:
         """
         针对阿里云百炼平台的旅游计划生成方法
         
+        提供方已在启动时根据配置选定，此方法仅为兼容保留，等同于 generate_travel_plan
+        """
+        return await self.generate_travel_plan(
+            destination, start_date, end_date, budget, preferences, travelers
+        )
+    
+    async def regenerate_day(self,
+                             plan_summary: str,
+                             day_number: int,
+                             day_date: Optional[str],
+                             current_day: str,
+                             neighbour_days: str,
+                             instructions: str = "",
+                             user_id: Optional[int] = None) -> Dict[str, Any]:
+        """
+        只重新生成已有计划中的某一天
+        
+        只发送计划摘要、当天原有安排和前后相邻几天的概要，而不是整份计划，
+        生成长度也限制在单日范围内
+        
+        Args:
+            plan_summary: 计划摘要（目的地、日期、预算、偏好）
+            day_number: 第几天
+            day_date: 当天日期 (YYYY-MM-DD)，未知时为None
+            current_day: 当天原有的安排
+            neighbour_days: 相邻几天的概要
+            instructions: 用户的修改要求
+            user_id: 发起请求的用户ID
+            
+        Returns:
+            {"success": True, "day": 当天的新安排（Markdown，可能附带JSON代码块）} 或
+            {"success": False, "error": 错误信息, "day": None}
+        """
+        if self._use_mock():
+            return self._generate_mock_day(day_number, instructions)
+        
+        prompt = self._build_day_prompt(
+            plan_summary, day_number, day_date, current_day, neighbour_days, instructions
+        )
+        return await self._complete(
+            DAY_PLANNER_PROMPT,
+            prompt,
+            temperature=0.8,
+            max_tokens=600,
+            result_key="day",
+            action="重新生成行程",
+            user_id=user_id,
+            priority=PRIORITY_INTERACTIVE,
+            use_cache=False
+        )
+    
+    async def stream_travel_plan(self,
+                                 destination: str,
+                                 start_date: str,
+                                 end_date: str,
+                                 budget: float,
+                                 preferences: str,
+                                 travelers: int = 1,
+                                 user_id: Optional[int] = None) -> AsyncIterator[Dict[str, Any]]:
+        """
+        流式生成旅游计划，逐块转发AI服务返回的增量内容
+
         Args:
             destination: 目的地
             start_date: 开始日期
@@ -128,91 +206,127 @@ class LLMService:
             budget: 预算
             preferences: 偏好
             travelers: 旅行人数
-            
-        Returns:
-            包含旅游计划详细信息的字典
+            user_id: 发起请求的用户ID，用于配额的公平调度
+
+        Yields:
+            {"success": True, "delta": 增量文本}；出错时最后一项为
+            {"success": False, "error": 错误信息}
         """
-        # 如果没有配置API密钥，返回模拟数据
-        if not self.api_key or not self.api_endpoint or "example.com" in self.api_endpoint:
-            return self._generate_mock_plan(destination, start_date, end_date, budget, preferences, travelers)
-        
+        # 如果没有配置API密钥，按行输出模拟数据
+        if self._use_mock():
+            mock_result = self._generate_mock_plan(destination, start_date, end_date, budget, preferences, travelers)
+            for line in mock_result["plan"].splitlines(keepends=True):
+                yield {"success": True, "delta": line}
+            return
+
         # 构建提示词
         prompt = self._build_travel_prompt(
             destination, start_date, end_date, budget, preferences, travelers
         )
-        
-        # 构建API请求（阿里云百炼平台格式）
-        headers = {
-            "Authorization": f"Bearer {self.api_key}",
-            "Content-Type": "application/json"
-        }
-        
-        payload = {
-            "model": "qwen-turbo",  # 阿里云百炼平台模型
-            "input": {
-                "messages": [
-                    {
-                        "role": "system",
-                        "content": "你是一个专业的旅游规划师，能够根据用户需求生成详细的旅游计划。请用中文回复，提供结构化和易读的旅游计划。"
-                    },
-                    {
-                        "role": "user",
-                        "content": prompt
-                    }
-                ]
-            },
-            "parameters": {
-                "temperature": 0.7,
-                "max_tokens": 2000
-            }
-        }
-        
+        messages = self._build_messages(TRAVEL_PLANNER_PROMPT, prompt)
+
+        # 与非流式生成共用缓存，命中时一次性返回完整内容
+        cache_key = self._cache_key(self.provider.model, 0.7, messages)
+        cached_plan = await self.cache.aget(cache_key)
+        if cached_plan is not None:
+            yield {"success": True, "delta": cached_plan}
+            return
+
+        # 流式请求不经过重试，只等待一次配额
+        estimated_tokens = estimate_tokens(messages, 2000)
         try:
-            # 发送请求到阿里云百炼平台
-            response = await self.client.post(
-                self.api_endpoint,
-                headers=headers,
-                json=payload,
-                timeout=60.0
-            )
+            await self.scheduler.acquire(estimated_tokens, user_id=user_id, priority=PRIORITY_INTERACTIVE)
+        except RateLimitExceeded as e:
+            yield {"success": False, "error": str(e)}
+            return
+
+        chunks = []
+        usage: Dict[str, int] = {}
+        sent = False
+        answered_by = None
+        error = None
+        try:
+            # 在输出第一个增量之前出错时，依次故障转移到下一个提供方
+            for provider in self.router.ordered_providers():
+                try:
+                    # 客户端断开时显式关闭内层生成器，立即释放上游连接
+                    async with self.router.guard(provider), \
+                            aclosing(self._stream_from(provider, messages, usage)) as deltas:
+                        sent = True
+                        async for delta in deltas:
+                            chunks.append(delta)
+                            yield {"success": True, "delta": delta}
+                    answered_by = provider
+                    error = None
+                    break
+                except (CircuitOpenError, ConcurrencyLimitExceeded) as e:
+                    # 熔断或并发已满时立即跳过，不等待上游超时
+                    if error is None:
+                        error = str(e)
+                    continue
+                except httpx.HTTPStatusError as e:
+                    error = self._status_error_message(e, "生成旅游计划")
+                except httpx.TimeoutException:
+                    error = "请求AI服务超时，请稍后重试"
+                except httpx.RequestError as e:
+                    error = f"网络请求错误: {str(e)}"
+                except (KeyError, IndexError, json.JSONDecodeError) as e:
+                    error = f"AI服务返回格式错误: {str(e)}"
+                except Exception as e:
+                    error = f"生成旅游计划时发生未知错误: {str(e)}"
+                if chunks:
+                    # 已经输出了部分内容，无法再切换提供方
+                    break
+        finally:
+            # 流结束、出错或客户端断开时按实际用量修正配额，与非流式请求一致：
+            # 优先使用上游报告的用量，没有时按已输出的内容估算
+            if not sent:
+                self.scheduler.refund(estimated_tokens, request=True)
+            else:
+                used_tokens = usage.get("tokens")
+                if used_tokens is None:
+                    used_tokens = estimate_tokens(messages, len("".join(chunks)))
+                self.scheduler.refund(estimated_tokens - used_tokens)
+
+        if error:
+            yield {"success": False, "error": error}
+        elif chunks and answered_by is self.provider:
+            await self.cache.aset(cache_key, "".join(chunks))
+
+    async def _stream_from(self, provider: LLMProvider, messages: List[Dict[str, str]],
+                           usage: Optional[Dict[str, int]] = None) -> AsyncIterator[str]:
+        """
+        从指定提供方读取SSE流，逐个返回增量文本
+
+        Args:
+            usage: 上游在流中报告用量时，把最新的总token数写入 usage["tokens"]
+        """
+        async with provider.client.stream(
+            "POST",
+            provider.endpoint,
+            headers=provider.headers(stream=True),
+            json=provider.build_payload(messages, 0.7, 2000, stream=True)
+        ) as response:
             response.raise_for_status()
-            
-            # 解析响应
-            result = response.json()
-            plan_content = result["output"]["text"]
-            
-            return {
-                "success": True,
-                "plan": plan_content,
-                "raw_response": result
-            }
-            
-        except httpx.TimeoutException:
-            return {
-                "success": False,
-                "error": "请求AI服务超时，请稍后重试",
-                "plan": None
-            }
-        except httpx.RequestError as e:
-            return {
-                "success": False,
-                "error": f"网络请求错误: {str(e)}",
-                "plan": None
-            }
-        except KeyError as e:
-            return {
-                "success": False,
-                "error": f"AI服务返回格式错误: {str(e)}",
-                "plan": None
-            }
-        except Exception as e:
-            return {
-                "success": False,
-                "error": f"生成旅游计划时发生未知错误: {str(e)}",
-                "plan": None
-            }
+
+            # 逐行解析SSE事件，只关心 data: 行
+            async for line in response.aiter_lines():
+                if not line.startswith("data:"):
+                    continue
+                data = line[len("data:"):].strip()
+                if not data or data == "[DONE]":
+                    continue
+
+                chunk = json.loads(data)
+                if usage is not None:
+                    used_tokens = provider.parse_usage(chunk)
+                    if used_tokens is not None:
+                        usage["tokens"] = used_tokens
+                delta = provider.parse_stream_chunk(chunk)
+                if delta:
+                    yield delta
     
-    def _generate_mock_plan(self, 
+    def _generate_mock_plan(self,
                          destination: str, 
                          start_date: str,
                          end_date: str, 
@@ -314,189 +428,308 @@ class LLMService:
         - 请提供结构化和易读的旅游计划
         - 请确保内容实用且符合预算
         - 如有日期信息，请具体到日期
+        """ + ITINERARY_JSON_INSTRUCTION
+        
+        return prompt
+    
+    def _build_day_prompt(self,
+                          plan_summary: str,
+                          day_number: int,
+                          day_date: Optional[str],
+                          current_day: str,
+                          neighbour_days: str,
+                          instructions: str) -> str:
+        """
+        构建单日重新生成的提示词
+        """
+        prompt = f"""
+        以下是一份已有的旅游计划的摘要：
+        {plan_summary}
+        
+        相邻几天的安排：
+        {neighbour_days or "无"}
+        
+        第{day_number}天{f"（{day_date}）" if day_date else ""}原来的安排：
+        {current_day or "无"}
+        
+        修改要求：{instructions or "换一种安排，避免与相邻几天重复"}
+        
+        请重新安排第{day_number}天的行程：
+        - 以 "### 第{day_number}天: 当天主题" 作为标题，下面用列表列出各时段的活动
+        - 只输出这一天的内容，不要重复其他天
+        - 最后附上一个 ```json 代码块，格式为：
+          {{"day_number": {day_number}, "date": "YYYY-MM-DD", "title": "当天主题",
+            "activities": [{{"time": "09:00-11:00", "title": "活动名称", "location": "地点",
+                            "description": "简要说明", "estimated_cost": 100}}]}}
         """
         
         return prompt
     
-    async def close(self):
+    def _generate_mock_day(self, day_number: int, instructions: str) -> Dict[str, Any]:
         """
-        关闭HTTP客户端
+        生成模拟的单日行程（用于测试）
         """
-        await self.client.aclose()
-
-    async def analyze_budget(self, plan, expenses) -> Dict[str, Any]:
+        mock_day = f"""### 第{day_number}天: 重新安排的行程
+- 上午: 参观新的景点{f"（{instructions}）" if instructions else ""}
+- 下午: 城市漫步
+- 晚上: 品尝当地夜市小吃
+"""
+        return {
+            "success": True,
+            "day": mock_day,
+            "raw_response": {"mock": True}
+        }
+    
+    async def _complete(self,
+                        system_prompt: str,
+                        prompt: str,
+                        temperature: float,
+                        max_tokens: int,
+                        result_key: str,
+                        action: str,
+                        timeout: Optional[float] = None,
+                        user_id: Optional[int] = None,
+                        priority: int = PRIORITY_INTERACTIVE,
+                        use_cache: bool = True) -> Dict[str, Any]:
         """
-        分析旅行预算和开销
+        调用AI服务完成一次对话，带缓存和并发请求合并
         
         Args:
-            plan: 旅行计划对象
-            expenses: 开销列表
+            system_prompt: 系统提示词
+            prompt: 用户提示词
+            temperature: 温度参数
+            max_tokens: 最大生成长度
+            result_key: 结果字典中存放生成内容的键（plan / day / analysis）
+            action: 出错时错误信息中的操作描述
+            timeout: 包括重试在内的整体时限（秒），为空时使用 LLM_REQUEST_DEADLINE
+            user_id: 发起请求的用户ID，同优先级内按用户轮流分配配额
+            priority: 配额调度优先级
+            use_cache: 是否读写结果缓存；用户要求"重新生成"时不应返回上一次的结果
             
         Returns:
-            包含预算分析结果的字典
+            {"success": True, result_key: 内容, "raw_response": 原始响应, "retries": 重试次数} 或
+            {"success": False, "error": 错误信息, "retries": 重试次数, result_key: None}；
+            熔断、并发已满、本地配额不足或上游限流时额外带有 "unavailable": True
         """
-        # 如果没有配置API密钥，返回模拟数据
-        if not self.api_key or not self.api_endpoint or "example.com" in self.api_endpoint:
-            return self._generate_mock_budget_analysis(plan, expenses)
+        messages = self._build_messages(system_prompt, prompt)
         
-        # 构建预算分析提示词
-        prompt = self._build_budget_analysis_prompt(plan, expenses)
+        # 相同的提示词直接返回缓存结果
+        cache_key = self._cache_key(self.provider.model, temperature, messages)
+        cached_content = await self.cache.aget(cache_key) if use_cache else None
+        if cached_content is not None:
+            return {
+                "success": True,
+                result_key: cached_content,
+                "raw_response": {"cached": True}
+            }
         
-        # 根据API端点判断使用哪种服务
-        api_endpoint = self.api_endpoint or ""  # 确保不是None
-        if "dashscope" in api_endpoint or "aliyuncs" in api_endpoint:
-            # 使用阿里云百炼平台
-            return await self._analyze_budget_with_dashscope(prompt)
-        else:
-            # 默认使用OpenAI格式
-            return await self._analyze_budget_with_openai(prompt)
-    
-    async def _analyze_budget_with_openai(self, prompt: str) -> Dict[str, Any]:
-        """
-        使用OpenAI格式API进行预算分析
-        """
-        headers = {
-            "Authorization": f"Bearer {self.api_key}",
-            "Content-Type": "application/json"
-        }
+        # 整体截止时间：重试等待和每次请求的读超时都不能超过它
+        deadline = time.monotonic() + (timeout or settings.LLM_REQUEST_DEADLINE)
         
-        payload = {
-            "model": "gpt-3.5-turbo",
-            "messages": [
-                {
-                    "role": "system",
-                    "content": "你是一个专业的财务分析师，专门分析旅行预算。请用中文回复，提供结构化和易读的预算分析报告。"
-                },
-                {
-                    "role": "user",
-                    "content": prompt
-                }
-            ],
-            "temperature": 0.3,
-            "max_tokens": 1500
-        }
+        estimated_tokens = estimate_tokens(messages, max_tokens)
+        
+        async def attempt(provider: LLMProvider):
+            # 各提供方的请求格式不同，在选定提供方后再构建请求并解析响应
+            payload = provider.build_payload(messages, temperature, max_tokens)
+            result = await self._post_json(provider, payload, deadline)
+            return provider.parse_response(result), provider.parse_usage(result), result, provider
         
+        async def call():
+            # 每次（包括重试）发出请求前先等待本地配额，配额等待不超过截止时间
+            await self.scheduler.acquire(
+                estimated_tokens,
+                user_id=user_id,
+                priority=priority,
+                timeout=min(self.scheduler.max_wait, max(0.0, deadline - time.monotonic()))
+            )
+            try:
+                content, used_tokens, result, provider = await self.router.call(attempt)
+            except (CircuitOpenError, ConcurrencyLimitExceeded):
+                # 请求没有发到上游，归还配额
+                self.scheduler.refund(estimated_tokens, request=True)
+                raise
+            if used_tokens is not None:
+                # 按实际用量修正估算的token
+                self.scheduler.refund(estimated_tokens - used_tokens)
+            return content, result, provider
+        
+        retries = 0
         try:
-            response = await self.client.post(
-                self.api_endpoint,
-                headers=headers,
-                json=payload,
-                timeout=60.0
+            # 相同请求的并发调用共享同一次上游请求，由路由器负责故障转移和对冲，
+            # 所有提供方都遇到限流或临时故障时按退避策略整体重试
+            (content, result, provider), retries = await self.inflight.do(
+                cache_key, self.retry_policy.run, call, deadline=deadline
             )
-            response.raise_for_status()
-            
-            result = response.json()
-            analysis_content = result["choices"][0]["message"]["content"]
+            if use_cache and provider is self.provider:
+                await self.cache.aset(cache_key, content)
             
             return {
                 "success": True,
-                "analysis": analysis_content,
-                "raw_response": result
+                result_key: content,
+                "raw_response": result,
+                "retries": retries
             }
             
-        except httpx.TimeoutException:
+        except (CircuitOpenError, ConcurrencyLimitExceeded, RateLimitExceeded) as e:
+            # 熔断、并发已满或配额不足，快速失败，调用方可据此返回503
+            return {
+                "success": False,
+                "error": str(e),
+                "unavailable": True,
+                "retries": getattr(e, "retries", 0),
+                result_key: None
+            }
+        except httpx.HTTPStatusError as e:
+            return {
+                "success": False,
+                "error": self._status_error_message(e, action),
+                "unavailable": e.response.status_code in RETRYABLE_STATUS_CODES,
+                "retries": getattr(e, "retries", 0),
+                result_key: None
+            }
+        except httpx.TimeoutException as e:
             return {
                 "success": False,
                 "error": "请求AI服务超时，请稍后重试",
-                "analysis": None
+                "retries": getattr(e, "retries", 0),
+                result_key: None
             }
         except httpx.RequestError as e:
             return {
                 "success": False,
                 "error": f"网络请求错误: {str(e)}",
-                "analysis": None
+                "retries": getattr(e, "retries", 0),
+                result_key: None
             }
         except KeyError as e:
             return {
                 "success": False,
                 "error": f"AI服务返回格式错误: {str(e)}",
-                "analysis": None
+                "retries": getattr(e, "retries", 0),
+                result_key: None
             }
         except Exception as e:
             return {
                 "success": False,
-                "error": f"预算分析时发生未知错误: {str(e)}",
-                "analysis": None
+                "error": f"{action}时发生未知错误: {str(e)}",
+                "retries": getattr(e, "retries", 0),
+                result_key: None
             }
     
-    async def _analyze_budget_with_dashscope(self, prompt: str) -> Dict[str, Any]:
+    async def _post_json(self, provider: LLMProvider, payload: Dict[str, Any],
+                         deadline: Optional[float] = None) -> Dict[str, Any]:
         """
-        使用阿里云百炼平台进行预算分析
-        """
-        headers = {
-            "Authorization": f"Bearer {self.api_key}",
-            "Content-Type": "application/json"
-        }
+        向AI服务发送请求并返回解析后的JSON
         
-        payload = {
-            "model": "qwen-turbo",
-            "input": {
-                "messages": [
-                    {
-                        "role": "system",
-                        "content": "你是一个专业的财务分析师，专门分析旅行预算。请用中文回复，提供结构化和易读的预算分析报告。"
-                    },
-                    {
-                        "role": "user",
-                        "content": prompt
-                    }
-                ]
+        Args:
+            provider: 提供方
+            payload: 请求体
+            deadline: 整体截止时间（time.monotonic() 时间点），读超时不超过剩余时间
+        """
+        timeout = httpx.USE_CLIENT_DEFAULT
+        if deadline is not None:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise httpx.ReadTimeout("已超过请求截止时间")
+            timeout = httpx.Timeout(
+                connect=min(settings.LLM_CONNECT_TIMEOUT, remaining),
+                read=min(settings.LLM_READ_TIMEOUT, remaining),
+                write=min(settings.LLM_WRITE_TIMEOUT, remaining),
+                pool=min(settings.LLM_POOL_TIMEOUT, remaining)
+            )
+        response = await provider.client.post(
+            provider.endpoint,
+            headers=provider.headers(),
+            json=payload,
+            timeout=timeout
+        )
+        response.raise_for_status()
+        return response.json()
+    
+    @staticmethod
+    def _status_error_message(error: httpx.HTTPStatusError, action: str) -> str:
+        """
+        上游返回错误状态码时给用户的提示：限流和5xx提示稍后重试，其他状态码按未知错误处理
+        """
+        status_code = error.response.status_code
+        if status_code == 429:
+            return "AI服务请求过于频繁，请稍后重试"
+        if status_code >= 500:
+            return f"AI服务暂时不可用（HTTP {status_code}），请稍后重试"
+        return f"{action}时发生未知错误: {str(error)}"
+    
+    def _use_mock(self) -> bool:
+        """
+        未配置API密钥或端点时使用模拟数据
+        """
+        return not self.api_key or not self.api_endpoint or "example.com" in self.api_endpoint
+    
+    @staticmethod
+    def _build_messages(system_prompt: str, prompt: str) -> List[Dict[str, str]]:
+        return [
+            {
+                "role": "system",
+                "content": system_prompt
             },
-            "parameters": {
-                "temperature": 0.3,
-                "max_tokens": 1500
+            {
+                "role": "user",
+                "content": prompt
             }
-        }
+        ]
+    
+    def _cache_key(self, model: str, temperature: float, messages: list) -> str:
+        """
+        根据消息内容、模型和温度生成缓存键
+
+        缓存键使用首选提供方的模型，只有首选提供方生成的结果会写入缓存；
+        故障转移到备用提供方（可能是另一个模型）的结果不缓存，避免之后被当作首选模型的结果返回
+        """
+        system_prompt = "".join(m["content"] for m in messages if m["role"] == "system")
+        user_prompt = "".join(m["content"] for m in messages if m["role"] == "user")
+        return build_cache_key(user_prompt, model, temperature, system=system_prompt)
+    
+    async def close(self):
+        """
+        关闭HTTP客户端
+        """
+        for provider in self.providers:
+            await provider.close()
+
+    async def analyze_budget(self, plan, summary: BudgetSummary) -> Dict[str, Any]:
+        """
+        分析旅行预算和开销
         
-        try:
-            response = await self.client.post(
-                self.api_endpoint,
-                headers=headers,
-                json=payload,
-                timeout=60.0
-            )
-            response.raise_for_status()
-            
-            result = response.json()
-            analysis_content = result["output"]["text"]
-            
-            return {
-                "success": True,
-                "analysis": analysis_content,
-                "raw_response": result
-            }
+        Args:
+            plan: 旅行计划对象
+            summary: 数据库中汇总好的预算摘要
             
-        except httpx.TimeoutException:
-            return {
-                "success": False,
-                "error": "请求AI服务超时，请稍后重试",
-                "analysis": None
-            }
-        except httpx.RequestError as e:
-            return {
-                "success": False,
-                "error": f"网络请求错误: {str(e)}",
-                "analysis": None
-            }
-        except KeyError as e:
-            return {
-                "success": False,
-                "error": f"AI服务返回格式错误: {str(e)}",
-                "analysis": None
-            }
-        except Exception as e:
-            return {
-                "success": False,
-                "error": f"预算分析时发生未知错误: {str(e)}",
-                "analysis": None
-            }
+        Returns:
+            包含预算分析结果的字典
+        """
+        # 如果没有配置API密钥，返回模拟数据
+        if self._use_mock():
+            return self._generate_mock_budget_analysis(plan, summary)
+        
+        # 构建预算分析提示词
+        prompt = self._build_budget_analysis_prompt(plan, summary)
+        
+        return await self._complete(
+            BUDGET_ANALYST_PROMPT,
+            prompt,
+            temperature=0.3,
+            max_tokens=1500,
+            result_key="analysis",
+            action="预算分析",
+            user_id=plan.user_id,
+            priority=PRIORITY_BACKGROUND
+        )
     
-    def _generate_mock_budget_analysis(self, plan, expenses) -> Dict[str, Any]:
+    def _generate_mock_budget_analysis(self, plan, summary: BudgetSummary) -> Dict[str, Any]:
         """
         生成模拟预算分析（用于测试）
         """
-        total_expenses = sum(expense.amount for expense in expenses)
-        remaining_budget = plan.budget - total_expenses
+        total_expenses = summary.total_spent
+        remaining_budget = summary.remaining
         
         mock_analysis = f"""
 # 旅行预算分析报告
@@ -505,18 +738,13 @@ class LLMService:
 - 计划总预算: {plan.budget:.2f}元
 - 已花费金额: {total_expenses:.2f}元
 - 剩余预算: {remaining_budget:.2f}元
-- 预算使用率: {(total_expenses / plan.budget * 100):.1f}%
+- 预算使用率: {summary.usage_rate:.1f}%
 
 ## 开销分类分析
 """
         
         # 按类别统计开销
-        category_totals = {}
-        for expense in expenses:
-            if expense.category in category_totals:
-                category_totals[expense.category] += expense.amount
-            else:
-                category_totals[expense.category] = expense.amount
+        category_totals = {item.category: item.total for item in summary.categories}
         
         for category, amount in category_totals.items():
             percentage = (amount / plan.budget * 100)
@@ -553,9 +781,11 @@ class LLMService:
             "raw_response": {"mock": True}
         }
     
-    def _build_budget_analysis_prompt(self, plan, expenses) -> str:
+    def _build_budget_analysis_prompt(self, plan, summary: BudgetSummary) -> str:
         """
         构建预算分析提示词
+        
+        只包含分类合计、每日合计和几笔大额开销，提示词长度不随开销笔数增长
         """
         prompt = f"""
         请为以下旅行计划和开销记录生成一份详细的预算分析报告：
@@ -565,22 +795,24 @@ class LLMService:
         - 总预算：{plan.budget}元
         - 旅行日期：{plan.start_date} 至 {plan.end_date}
         
-        开销记录：
+        开销分类合计（共{summary.expense_count}笔）：
         """
         
-        total_expenses = 0
-        category_totals = {}
+        for item in summary.categories:
+            prompt += f"- {item.category}: {item.total:.2f}元（{item.count}笔）\n"
         
-        for expense in expenses:
-            prompt += f"- {expense.category}: {expense.amount}元 ({expense.description})\n"
-            total_expenses += expense.amount
-            if expense.category in category_totals:
-                category_totals[expense.category] += expense.amount
-            else:
-                category_totals[expense.category] = expense.amount
+        if summary.daily:
+            prompt += "\n每日开销：\n"
+            for item in summary.daily:
+                prompt += f"- {item.date or '未知日期'}: {item.total:.2f}元\n"
+        
+        if summary.largest:
+            prompt += "\n金额最大的几笔开销：\n"
+            for expense in summary.largest:
+                prompt += f"- {expense.category}: {expense.amount}元 ({expense.description})\n"
         
-        prompt += f"\n总计开销：{total_expenses}元\n"
-        prompt += f"剩余预算：{plan.budget - total_expenses}元\n\n"
+        prompt += f"\n总计开销：{summary.total_spent}元\n"
+        prompt += f"剩余预算：{summary.remaining}元\n\n"
         
         prompt += """
         请提供以下信息：
@@ -0,0 +1,78 @@
+import base64
+import json
+from datetime import datetime
+from typing import Optional, Tuple
+from sqlalchemy import String, and_, literal, or_
+from app.core.config import settings
+
+# 单页最大条数
+MAX_PAGE_SIZE = 500
+
+# 返回下一页游标的响应头，没有下一页时不返回
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+class InvalidCursor(ValueError):
+    """
+    游标无法解析
+    """
+
+
+def page_size(limit: int) -> int:
+    return max(1, min(limit, MAX_PAGE_SIZE))
+
+
+def encode_cursor(created_at: Optional[datetime], row_id: int) -> str:
+    """
+    把一页最后一行的 (created_at, id) 编码为不透明的游标
+    """
+    value = [created_at.isoformat() if created_at else None, row_id]
+    return base64.urlsafe_b64encode(json.dumps(value).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[Optional[datetime], int]:
+    """
+    解析游标
+
+    Raises:
+        InvalidCursor: 游标格式错误
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        created_at, row_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return (datetime.fromisoformat(created_at) if created_at else None), int(row_id)
+    except (ValueError, TypeError) as e:
+        raise InvalidCursor("无效的分页游标") from e
+
+
+def next_cursor(rows, limit: int) -> Optional[str]:
+    """
+    本页已满时返回指向最后一行之后的游标，否则说明没有下一页，返回None
+    """
+    if len(rows) < limit:
+        return None
+    last = rows[-1]
+    return encode_cursor(last.created_at, last.id)
+
+
+def after_cursor(created_column, id_column, cursor: str):
+    """
+    生成按 (created_at, id) 升序取游标之后各行的条件，可以直接使用 (…, created_at, id) 复合索引
+    """
+    created_at, row_id = decode_cursor(cursor)
+    if created_at is None:
+        # created_at 由数据库默认值填充，正常不会为空
+        return id_column > row_id
+    value = _bind_datetime(created_at)
+    return or_(created_column > value, and_(created_column == value, id_column > row_id))
+
+
+def _bind_datetime(value: datetime):
+    if settings.DATABASE_URL.startswith("sqlite"):
+        # SQLite 以文本保存时间，server_default 写入的是不带微秒的 "YYYY-MM-DD HH:MM:SS"，
+        # 而 SQLAlchemy 绑定参数时总是带微秒，按相同格式比较才能正确处理同一秒内的多行
+        text = value.strftime("%Y-%m-%d %H:%M:%S")
+        if value.microsecond:
+            text += f".{value.microsecond:06d}"
+        return literal(text, String)
+    return value
@@ -0,0 +1,213 @@
+import asyncio
+import time
+from collections import OrderedDict, deque
+from typing import Any, Deque, Dict, Hashable, Optional
+
+# 调度优先级，数值越小越优先
+PRIORITY_INTERACTIVE = 0  # 用户正在等待的旅游计划生成
+PRIORITY_BACKGROUND = 1  # 预算分析等可以稍后返回的请求
+
+
+class RateLimitExceeded(Exception):
+    """
+    在最长等待时间内无法获得上游配额
+    """
+
+
+class TokenBucket:
+    """
+    令牌桶：容量为每分钟配额，按秒匀速补充
+    """
+
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.tokens = float(per_minute)
+        self.updated_at = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def wait_time(self, amount: float) -> float:
+        """
+        还需要等待多久才有足够的令牌；超过容量的请求按装满计算
+        """
+        self._refill()
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def consume(self, amount: float) -> None:
+        self._refill()
+        self.tokens -= min(amount, self.capacity)
+
+    def refund(self, amount: float) -> None:
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens + amount)
+
+
+class _Waiter:
+    def __init__(self, tokens: int, future: asyncio.Future):
+        self.tokens = tokens
+        self.future = future
+
+
+class QuotaScheduler:
+    """
+    上游配额调度器：同时跟踪每分钟请求数（RPM）和估算的每分钟token数（TPM）
+
+    - 高优先级的请求先于低优先级
+    - 同一优先级内按用户轮转，单个用户的大量请求不会挤占其他用户
+    - 队首请求配额不足时整体等待，避免大请求被小请求持续插队而饿死
+    - rpm / tpm 为0表示不限制
+    """
+
+    def __init__(self, rpm: int = 0, tpm: int = 0, max_wait: float = 30.0):
+        self.requests = TokenBucket(rpm) if rpm > 0 else None
+        self.tokens = TokenBucket(tpm) if tpm > 0 else None
+        self.max_wait = max_wait
+        # 优先级 -> 用户 -> 等待队列
+        self._queues: Dict[int, "OrderedDict[Hashable, Deque[_Waiter]]"] = {}
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self.waited = 0
+        self.rejected = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.requests is not None or self.tokens is not None
+
+    async def acquire(self, tokens: int, user_id: Optional[Hashable] = None,
+                      priority: int = PRIORITY_INTERACTIVE, timeout: Optional[float] = None) -> None:
+        """
+        等待一次请求的配额
+
+        Args:
+            tokens: 估算的token数（提示词 + max_tokens）
+            user_id: 用户ID，用于同优先级内的公平调度
+            priority: 优先级
+            timeout: 最长等待时间，为空时使用 max_wait
+
+        Raises:
+            RateLimitExceeded: 等待超时
+        """
+        if not self.enabled:
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        waiter = _Waiter(tokens, future)
+        users = self._queues.setdefault(priority, OrderedDict())
+        users.setdefault(user_id, deque()).append(waiter)
+        self._dispatch()
+
+        if future.done():
+            return
+        self.waited += 1
+        try:
+            await asyncio.wait_for(asyncio.shield(future), timeout=self.max_wait if timeout is None else timeout)
+        except asyncio.TimeoutError:
+            self._discard(priority, user_id, waiter)
+            if future.done() and not future.cancelled():
+                # 超时的同时刚好被调度，配额已经扣除，直接使用
+                return
+            future.cancel()
+            self.rejected += 1
+            raise RateLimitExceeded("AI服务调用额度已用尽，请稍后重试")
+        except asyncio.CancelledError:
+            self._discard(priority, user_id, waiter)
+            if future.done() and not future.cancelled():
+                self.refund(tokens, request=True)
+            future.cancel()
+            raise
+
+    def refund(self, tokens: int, request: bool = False) -> None:
+        """
+        按实际用量修正配额：tokens 为正表示归还多扣的部分，为负表示补扣超出估算的部分
+
+        Args:
+            tokens: 需要修正的token数
+            request: 请求没有真正发出，同时归还请求数配额
+        """
+        if self.tokens is not None:
+            if tokens > 0:
+                self.tokens.refund(tokens)
+            elif tokens < 0:
+                self.tokens.consume(-tokens)
+        if request and self.requests is not None:
+            self.requests.refund(1)
+        self._dispatch()
+
+    def _discard(self, priority: int, user_id: Hashable, waiter: _Waiter) -> None:
+        users = self._queues.get(priority)
+        if not users or user_id not in users:
+            return
+        queue = users[user_id]
+        if waiter in queue:
+            queue.remove(waiter)
+        if not queue:
+            del users[user_id]
+        self._dispatch()
+
+    def _next_waiter(self):
+        for priority in sorted(self._queues):
+            users = self._queues[priority]
+            while users:
+                user_id, queue = next(iter(users.items()))
+                while queue and queue[0].future.done():
+                    queue.popleft()
+                if queue:
+                    return priority, user_id, queue[0]
+                del users[user_id]
+        return None
+
+    def _dispatch(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        while True:
+            head = self._next_waiter()
+            if head is None:
+                return
+            priority, user_id, waiter = head
+
+            wait = max(
+                self.requests.wait_time(1) if self.requests else 0.0,
+                self.tokens.wait_time(waiter.tokens) if self.tokens else 0.0
+            )
+            if wait > 0:
+                # 配额不足，等补充后再调度队首请求
+                self._timer = asyncio.get_running_loop().call_later(wait, self._dispatch)
+                return
+
+            if self.requests:
+                self.requests.consume(1)
+            if self.tokens:
+                self.tokens.consume(waiter.tokens)
+            waiter.future.set_result(None)
+
+            # 该用户出队一个请求后移到队尾，轮到下一个用户
+            users = self._queues[priority]
+            queue = users.pop(user_id)
+            queue.popleft()
+            if queue:
+                users[user_id] = queue
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "queued": sum(len(queue) for users in self._queues.values() for queue in users.values()),
+            "waited": self.waited,
+            "rejected": self.rejected,
+        }
+
+
+def estimate_tokens(messages, max_tokens: int) -> int:
+    """
+    估算一次请求消耗的token数：提示词字符数 + 最大生成长度
+
+    中文大约每个字一个token，按字符数估算偏保守
+    """
+    return sum(len(message.get("content", "")) for message in messages) + max_tokens
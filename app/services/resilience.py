@@ -0,0 +1,304 @@
+import asyncio
+import random
+import re
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Any, Awaitable, Callable, Optional
+import httpx
+
+
+class CircuitOpenError(Exception):
+    """
+    熔断器处于打开状态，请求被快速拒绝
+    """
+
+
+class ConcurrencyLimitExceeded(Exception):
+    """
+    并发请求数已达上限，且在等待时间内没有空闲名额
+    """
+
+
+class CircuitBreaker:
+    """
+    熔断器：closed（正常）/ open（快速失败）/ half_open（放行少量探测请求）
+
+    - closed 状态下连续失败达到阈值后打开
+    - open 状态持续 recovery_timeout 秒后进入 half_open
+    - half_open 状态下探测成功则关闭，失败则重新打开
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 5, recovery_timeout: float = 30.0, half_open_max_calls: int = 1):
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.half_open_max_calls = half_open_max_calls
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._half_open_calls = 0
+
+    @property
+    def state(self) -> str:
+        if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.recovery_timeout:
+            self._state = self.HALF_OPEN
+            self._half_open_calls = 0
+        return self._state
+
+    def before_call(self) -> None:
+        """
+        请求前检查，熔断时抛出 CircuitOpenError
+        """
+        state = self.state
+        if state == self.OPEN:
+            raise CircuitOpenError("AI服务暂时不可用，请稍后重试")
+        if state == self.HALF_OPEN:
+            if self._half_open_calls >= self.half_open_max_calls:
+                raise CircuitOpenError("AI服务正在恢复中，请稍后重试")
+            self._half_open_calls += 1
+
+    def record_success(self) -> None:
+        self._state = self.CLOSED
+        self._failures = 0
+        self._half_open_calls = 0
+
+    def record_failure(self) -> None:
+        if self._state == self.HALF_OPEN:
+            self._open()
+            return
+        self._failures += 1
+        if self._failures >= self.failure_threshold:
+            self._open()
+
+    def record_cancelled(self) -> None:
+        """
+        请求被取消，不计入成功或失败，只归还探测名额
+        """
+        if self._state == self.HALF_OPEN and self._half_open_calls > 0:
+            self._half_open_calls -= 1
+
+    def _open(self) -> None:
+        self._state = self.OPEN
+        self._opened_at = time.monotonic()
+        self._failures = 0
+        self._half_open_calls = 0
+
+
+class AdaptiveConcurrencyLimiter:
+    """
+    基于AIMD的自适应并发限制
+
+    请求成功且延迟低于目标时加性增大上限（每轮约+1），
+    失败或延迟超过目标时乘性减小上限；超过上限的请求最多等待 queue_timeout 秒
+    """
+
+    def __init__(self, initial_limit: int = 10, min_limit: int = 1, max_limit: int = 100,
+                 latency_target: float = 30.0, backoff_ratio: float = 0.7, queue_timeout: float = 5.0):
+        self.limit = float(initial_limit)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.latency_target = latency_target
+        self.backoff_ratio = backoff_ratio
+        self.queue_timeout = queue_timeout
+        self.in_flight = 0
+        self.rejected = 0
+        self._condition = None
+
+    @property
+    def current_limit(self) -> int:
+        return max(self.min_limit, int(self.limit))
+
+    async def acquire(self) -> None:
+        """
+        获取一个并发名额
+
+        Raises:
+            ConcurrencyLimitExceeded: 等待 queue_timeout 秒后仍没有名额
+        """
+        if self._condition is None:
+            self._condition = asyncio.Condition()
+        async with self._condition:
+            try:
+                await asyncio.wait_for(
+                    self._condition.wait_for(lambda: self.in_flight < self.current_limit),
+                    timeout=self.queue_timeout
+                )
+            except asyncio.TimeoutError:
+                self.rejected += 1
+                raise ConcurrencyLimitExceeded("AI服务繁忙，请稍后重试")
+            self.in_flight += 1
+
+    async def release(self, latency: float, success: bool = True, dropped: bool = False) -> None:
+        """
+        归还名额并根据结果调整上限
+
+        Args:
+            latency: 本次请求耗时（秒）
+            success: 请求是否成功
+            dropped: 请求被取消，不参与上限调整
+        """
+        async with self._condition:
+            self.in_flight -= 1
+            if not dropped:
+                if success and latency <= self.latency_target:
+                    self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)
+                else:
+                    self.limit = max(self.min_limit, self.limit * self.backoff_ratio)
+            self._condition.notify_all()
+
+    def stats(self) -> dict:
+        return {
+            "limit": self.current_limit,
+            "in_flight": self.in_flight,
+            "rejected": self.rejected,
+        }
+
+
+# 可重试的HTTP状态码：限流和上游临时故障
+RETRYABLE_STATUS_CODES = {408, 409, 425, 429, 500, 502, 503, 504}
+
+_DURATION_PATTERN = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+_DURATION_UNITS = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+
+
+def status_code_of(error: Exception) -> Optional[int]:
+    """
+    上游返回错误状态码时取出状态码，其他异常返回None
+    """
+    if isinstance(error, httpx.HTTPStatusError):
+        return error.response.status_code
+    return None
+
+
+def is_provider_failure(error: Exception) -> bool:
+    """
+    是否说明提供方本身不可用，只有这类错误计入熔断：网络错误、超时和5xx
+
+    限流（429）和其他4xx说明上游仍在正常响应，由重试和并发限制处理
+    """
+    status_code = status_code_of(error)
+    if status_code is not None:
+        return status_code >= 500
+    return isinstance(error, (httpx.TransportError, asyncio.TimeoutError))
+
+
+def parse_duration(value: Optional[str]) -> Optional[float]:
+    """
+    解析限流头中的时长，支持 "2"、"1.5"、"20ms"、"6m0s"、"1h2m3s" 等格式
+
+    Returns:
+        秒数，无法解析时返回None
+    """
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+
+    matches = _DURATION_PATTERN.findall(value)
+    if not matches or "".join(number + unit for number, unit in matches) != value:
+        return None
+    return sum(float(number) * _DURATION_UNITS[unit] for number, unit in matches)
+
+
+def retry_after_from_headers(headers) -> Optional[float]:
+    """
+    根据响应头计算服务端要求的等待时间
+
+    依次参考 Retry-After（秒数或HTTP日期）、retry-after-ms，
+    以及剩余配额为0时的 x-ratelimit-reset-requests / x-ratelimit-reset-tokens
+    """
+    retry_after = headers.get("retry-after")
+    if retry_after:
+        seconds = parse_duration(retry_after)
+        if seconds is not None:
+            return seconds
+        try:
+            retry_at = parsedate_to_datetime(retry_after)
+            return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+        except (TypeError, ValueError):
+            pass
+
+    retry_after_ms = headers.get("retry-after-ms")
+    if retry_after_ms:
+        seconds = parse_duration(retry_after_ms)
+        if seconds is not None:
+            return seconds / 1000
+
+    resets = []
+    for kind in ("requests", "tokens"):
+        if headers.get(f"x-ratelimit-remaining-{kind}") == "0":
+            reset = parse_duration(headers.get(f"x-ratelimit-reset-{kind}"))
+            if reset is not None:
+                resets.append(reset)
+    return max(resets) if resets else None
+
+
+class RetryPolicy:
+    """
+    幂等请求的重试策略：去相关抖动（decorrelated jitter）的指数退避
+
+    - 只重试限流（429）、上游5xx和网络错误；熔断、并发已满和格式错误不重试
+    - 服务端给出 Retry-After 或限流重置时间时以其为准
+    - 所有重试都在整体截止时间内完成，等待时间超出截止时间时直接放弃
+    """
+
+    def __init__(self, max_attempts: int = 3, base_delay: float = 0.5, max_delay: float = 20.0):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def is_retryable(self, error: Exception) -> bool:
+        if isinstance(error, httpx.HTTPStatusError):
+            return error.response.status_code in RETRYABLE_STATUS_CODES
+        return isinstance(error, httpx.TransportError)
+
+    def backoff(self, previous: float) -> float:
+        """
+        去相关抖动：在 [base, previous * 3] 之间随机取值，不超过 max_delay
+        """
+        return min(self.max_delay, random.uniform(self.base_delay, max(self.base_delay, previous * 3)))
+
+    def delay_for(self, error: Exception, previous: float) -> float:
+        if isinstance(error, httpx.HTTPStatusError):
+            server_delay = retry_after_from_headers(error.response.headers)
+            if server_delay is not None:
+                return server_delay
+        return self.backoff(previous)
+
+    async def run(self, func: Callable[..., Awaitable[Any]], *args, deadline: Optional[float] = None):
+        """
+        执行并在可重试的错误上重试
+
+        Args:
+            func: 协程函数
+            deadline: 整体截止时间（time.monotonic() 时间点），为空时不限制
+
+        Returns:
+            (结果, 重试次数)
+
+        Raises:
+            最后一次的异常，其 retries 属性记录已重试次数
+        """
+        retries = 0
+        delay = self.base_delay
+        while True:
+            try:
+                return await func(*args), retries
+            except Exception as e:
+                if retries + 1 >= self.max_attempts or not self.is_retryable(e):
+                    e.retries = retries
+                    raise
+                delay = self.delay_for(e, delay)
+                if deadline is not None and time.monotonic() + delay >= deadline:
+                    # 等待之后已经来不及完成请求
+                    e.retries = retries
+                    raise
+            retries += 1
+            await asyncio.sleep(delay)
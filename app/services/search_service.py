@@ -0,0 +1,171 @@
+import html
+import re
+from typing import Any, Dict, List, Optional
+from sqlalchemy import text
+from sqlalchemy.orm import Session, undefer
+from app.database import search_index
+from app.models.models import TravelPlan
+
+# 单页最大条数
+MAX_RESULTS = 50
+
+# 摘要片段的长度（字符数）
+SNIPPET_LENGTH = 80
+
+# 各列的 bm25 权重，依次为 owner、title、destination、details、chars
+_SQLITE_WEIGHTS = "0.0, 10.0, 4.0, 1.0, 0.5"
+
+# 摘要中去掉的 Markdown 标记
+_MARKDOWN = re.compile(r"[#*_>`|]+")
+
+
+def build_match(user_id: int, terms: List[str]) -> str:
+    """
+    生成 SQLite FTS5 的 MATCH 表达式：限定用户，所有检索词都需要命中
+    """
+    clauses = [f'owner : "{search_index.owner_token(user_id)}"']
+    for term in terms:
+        if search_index.is_single_char(term):
+            clauses.append(f'chars : "{term}"')
+        else:
+            # 同一检索词的词元按短语匹配，要求在原文中相邻
+            clauses.append(f'{{title destination details}} : "{" ".join(search_index.tokenize(term))}"')
+    return " AND ".join(clauses)
+
+
+def build_tsquery(terms: List[str]) -> str:
+    """
+    生成 PostgreSQL 的 to_tsquery 表达式
+    """
+    clauses = []
+    for term in terms:
+        if search_index.is_single_char(term):
+            clauses.append(f"'{term}':D")
+        else:
+            clauses.append("(" + " <-> ".join(f"'{token}'" for token in search_index.tokenize(term)) + ")")
+    return " & ".join(clauses)
+
+
+def highlight(value: Optional[str], terms: List[str]) -> str:
+    """
+    转义HTML并用 <mark> 标出检索词（不区分大小写）
+    """
+    value = value or ""
+    pattern = _terms_pattern(terms)
+    if pattern is None:
+        return html.escape(value)
+    parts = []
+    position = 0
+    for match in pattern.finditer(value):
+        parts.append(html.escape(value[position:match.start()]))
+        parts.append(f"<mark>{html.escape(match.group(0))}</mark>")
+        position = match.end()
+    parts.append(html.escape(value[position:]))
+    return "".join(parts)
+
+
+def snippet(value: Optional[str], terms: List[str], length: int = SNIPPET_LENGTH) -> Optional[str]:
+    """
+    截取第一个命中检索词附近的一段文字并高亮，没有命中时返回None
+    """
+    pattern = _terms_pattern(terms)
+    if not value or pattern is None:
+        return None
+    value = " ".join(_MARKDOWN.sub(" ", value).split())
+    match = pattern.search(value)
+    if match is None:
+        return None
+    start = max(0, match.start() - length // 3)
+    end = min(len(value), start + length)
+    fragment = highlight(value[start:end], terms)
+    return ("…" if start > 0 else "") + fragment + ("…" if end < len(value) else "")
+
+
+def search_plans(db: Session, user_id: int, query: str, limit: int = 20, offset: int = 0) -> List[Dict[str, Any]]:
+    """
+    在用户的计划中检索标题、目的地和详情，按相关度排序
+
+    Args:
+        query: 检索输入，多个词之间为"且"的关系
+        limit: 每页条数
+        offset: 跳过的条数
+
+    Returns:
+        检索结果列表，包含计划摘要字段、相关度得分、高亮的标题/目的地和详情摘要
+    """
+    terms = search_index.query_terms(query)
+    if not terms:
+        return []
+    limit = max(1, min(limit, MAX_RESULTS))
+    offset = max(0, offset)
+    ranked = _rank(db, user_id, terms, limit, offset)
+    if not ranked:
+        return []
+
+    # 索引与计划在同一事务中写入，这里再按用户过滤一次作为防护
+    plans = {
+        plan.id: plan
+        for plan in db.query(TravelPlan).options(undefer(TravelPlan.details)).filter(
+            TravelPlan.id.in_(list(ranked)), TravelPlan.user_id == user_id
+        )
+    }
+    results = []
+    for plan_id, score in ranked.items():
+        plan = plans.get(plan_id)
+        if plan is None:
+            continue
+        results.append({
+            "id": plan.id,
+            "title": plan.title,
+            "destination": plan.destination,
+            "start_date": plan.start_date,
+            "end_date": plan.end_date,
+            "budget": plan.budget,
+            "created_at": plan.created_at,
+            "score": score,
+            "title_highlight": highlight(plan.title, terms),
+            "destination_highlight": highlight(plan.destination, terms),
+            "snippet": snippet(plan.details, terms),
+        })
+    return results
+
+
+def _rank(db: Session, user_id: int, terms: List[str], limit: int, offset: int) -> Dict[int, float]:
+    """
+    在检索表中按相关度取一页计划ID
+
+    Returns:
+        {计划ID: 得分}，按得分从高到低排列
+    """
+    dialect = db.get_bind().dialect.name
+    if dialect == "sqlite":
+        # bm25 越小越相关，取负值使得分越大越相关
+        rows = db.execute(
+            text(
+                f"SELECT rowid, -bm25({search_index.SEARCH_TABLE}, {_SQLITE_WEIGHTS}) AS score "
+                f"FROM {search_index.SEARCH_TABLE} WHERE {search_index.SEARCH_TABLE} MATCH :match "
+                "ORDER BY score DESC, rowid DESC LIMIT :limit OFFSET :offset"
+            ),
+            {"match": build_match(user_id, terms), "limit": limit, "offset": offset}
+        ).all()
+    elif dialect == "postgresql":
+        rows = db.execute(
+            text(
+                "SELECT plan_id, ts_rank(document, query) AS score "
+                f"FROM {search_index.SEARCH_TABLE}, to_tsquery('simple', :query) AS query "
+                "WHERE user_id = :user_id AND document @@ query "
+                "ORDER BY score DESC, plan_id DESC LIMIT :limit OFFSET :offset"
+            ),
+            {"query": build_tsquery(terms), "user_id": user_id, "limit": limit, "offset": offset}
+        ).all()
+    else:
+        raise RuntimeError(f"{dialect} 数据库不支持计划全文检索")
+    return {plan_id: float(score) for plan_id, score in rows}
+
+
+def _terms_pattern(terms: List[str]):
+    if not terms:
+        return None
+    # 较长的词优先匹配，避免被其中包含的短词截断
+    alternatives = sorted({term for term in terms if term}, key=len, reverse=True)
+    return re.compile("|".join(re.escape(term) for term in alternatives), re.IGNORECASE)
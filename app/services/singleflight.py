@@ -0,0 +1,64 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict
+
+
+class _Call:
+    """
+    一次正在进行中的共享调用
+    """
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    并发请求合并：相同键的并发调用只向上游发起一次请求，所有调用方共享结果
+
+    - 上游调用在独立的任务中运行，发起者被取消不会影响其他等待者
+    - 所有等待者都取消后，上游任务才会被取消
+    - 上游失败时异常会传递给所有等待者，且不会缓存失败，下一次调用重新发起
+    """
+
+    def __init__(self):
+        self._calls: Dict[str, _Call] = {}
+
+    async def do(self, key: str, func: Callable[..., Awaitable[Any]], *args, **kwargs) -> Any:
+        """
+        执行或加入键对应的调用
+
+        Args:
+            key: 请求键，相同键的并发调用会被合并
+            func: 实际发起请求的协程函数
+            args, kwargs: 传给 func 的参数
+
+        Returns:
+            func 的返回值（所有等待者共享同一个对象）
+        """
+        call = self._calls.get(key)
+        if call is None:
+            call = _Call(asyncio.ensure_future(func(*args, **kwargs)))
+            self._calls[key] = call
+            call.task.add_done_callback(lambda _task: self._forget(key, call))
+
+        call.waiters += 1
+        try:
+            # shield 保证单个等待者被取消时不会取消共享任务
+            return await asyncio.shield(call.task)
+        finally:
+            call.waiters -= 1
+            if call.waiters == 0 and not call.task.done():
+                # 没有人再等待结果，取消上游请求并让后续调用重新发起
+                self._forget(key, call)
+                call.task.cancel()
+
+    def in_flight(self) -> int:
+        """
+        当前进行中的上游调用数
+        """
+        return len(self._calls)
+
+    def _forget(self, key: str, call: _Call) -> None:
+        if self._calls.get(key) is call:
+            del self._calls[key]
@@ -3,7 +3,7 @@ import hashlib
 import hmac
 import json
 import time
-import requests
+import httpx
 from urllib.parse import urlencode
 from app.core.config import settings
 
@@ -17,6 +17,14 @@ class SpeechService:
         self.api_key = settings.SPEECH_API_KEY
         self.api_secret = settings.SPEECH_API_SECRET
         self.app_id = ""  # 需要从科大讯飞获取
+        # 复用连接池的异步客户端，避免阻塞事件循环
+        self.client = httpx.AsyncClient(
+            timeout=httpx.Timeout(
+                settings.SPEECH_READ_TIMEOUT,
+                connect=settings.SPEECH_CONNECT_TIMEOUT
+            ),
+            limits=httpx.Limits(max_connections=settings.SPEECH_MAX_CONNECTIONS)
+        )
         
     def _get_auth_url(self):
         """
@@ -62,7 +70,7 @@ class SpeechService:
         
         return url, headers
     
-    def recognize_speech(self, audio_data):
+    async def recognize_speech(self, audio_data):
         """
         语音识别
         
@@ -89,7 +97,7 @@ class SpeechService:
             }
             
             # 发送请求
-            response = requests.post(url, headers=headers, data=data)
+            response = await self.client.post(url, headers=headers, data=data)
             result = response.json()
             
             if result['code'] == 0:
@@ -105,12 +113,24 @@ class SpeechService:
                     "text": None
                 }
                 
+        except httpx.TimeoutException:
+            return {
+                "success": False,
+                "error": "语音识别服务超时，请稍后重试",
+                "text": None
+            }
         except Exception as e:
             return {
                 "success": False,
                 "error": f"语音识别过程中发生错误: {str(e)}",
                 "text": None
             }
+    
+    async def close(self):
+        """
+        关闭HTTP客户端
+        """
+        await self.client.aclose()
 
 
 # 创建全局实例
@@ -1,10 +1,17 @@
-from typing import Dict, Any, Optional
+import json
+import logging
+from contextlib import aclosing
+from typing import Dict, Any, List, Optional, AsyncIterator
 from sqlalchemy.orm import Session
-from datetime import datetime
-from app.services import llm_service, user_service
-from app.schemas.schemas import TravelPlanCreate
+from datetime import datetime, timedelta
+from app.database import database
+from app.database.database import run_in_session
+from app.services import llm_service, user_service, async_user_service, itinerary_parser
+from app.schemas.schemas import TravelPlanCreate, TravelPlan, ItineraryCreate, ItineraryDayCreate
 from app.core.config import settings
 
+logger = logging.getLogger(__name__)
+
 
 class TravelService:
     """
@@ -13,7 +20,6 @@ class TravelService:
     
     async def generate_and_save_travel_plan(
         self, 
-        db: Session,
         user_id: int,
         destination: str, 
         start_date: datetime,
@@ -25,8 +31,9 @@ class TravelService:
         """
         生成并保存旅游计划
         
+        等待AI服务期间不占用数据库会话，只在保存时短暂获取连接
+        
         Args:
-            db: 数据库会话
             user_id: 用户ID
             destination: 目的地
             start_date: 开始日期 (datetime对象)
@@ -46,14 +53,16 @@ class TravelService:
             end_date.strftime("%Y-%m-%d"), 
             budget, 
             preferences, 
-            travelers
+            travelers,
+            user_id
         )
         
         # 检查LLM服务是否成功返回结果
         if not llm_result.get("success", False):
             return {
                 "success": False,
-                "error": llm_result.get("error", "未知错误")
+                "error": llm_result.get("error", "未知错误"),
+                "unavailable": llm_result.get("unavailable", False)
             }
         
         # 获取生成的计划内容
@@ -64,40 +73,332 @@ class TravelService:
                 "error": "未能生成有效的旅行计划内容"
             }
         
-        # 创建旅行计划对象
-        plan_title = f"{destination}旅行计划 ({start_date.strftime('%Y-%m-%d')} - {end_date.strftime('%Y-%m-%d')})"
-        plan_data = TravelPlanCreate(
-            title=plan_title,
-            destination=destination,
-            start_date=start_date,
-            end_date=end_date,
-            budget=budget,
-            preferences=preferences,
-            details=plan_content  # 使用正确的字段
+        # 保存到数据库
+        db_plan = await self._persist_plan(
+            user_id, destination, start_date, end_date, budget, preferences, plan_content
         )
         
-        # 保存到数据库
-        db_plan = user_service.create_travel_plan(db=db, plan=plan_data, user_id=user_id)
+        return {
+            "success": True,
+            "plan": db_plan,
+            "ai_response": plan_content
+        }
+    
+    async def stream_and_save_travel_plan(
+        self,
+        user_id: int,
+        destination: str,
+        start_date: datetime,
+        end_date: datetime,
+        budget: float,
+        preferences: str,
+        travelers: int = 1
+    ) -> AsyncIterator[str]:
+        """
+        流式生成旅游计划，生成完成后保存到数据库
+        
+        以NDJSON格式逐行输出事件：
+        - {"event": "delta", "content": 增量文本}
+        - {"event": "done", "plan": 保存后的旅行计划}
+        - {"event": "error", "error": 错误信息}
+        
+        Args:
+            user_id: 用户ID
+            destination: 目的地
+            start_date: 开始日期 (datetime对象)
+            end_date: 结束日期 (datetime对象)
+            budget: 预算
+            preferences: 偏好
+            travelers: 旅行人数
+            
+        Yields:
+            每行一个JSON事件的字符串
+        """
+        chunks = []
+        # 结构化行程的JSON代码块只用于保存，不转发给客户端
+        visible = itinerary_parser.StructuredOutputFilter()
+        stream = llm_service.llm_service.stream_travel_plan(
+            destination,
+            start_date.strftime("%Y-%m-%d"),
+            end_date.strftime("%Y-%m-%d"),
+            budget,
+            preferences,
+            travelers,
+            user_id=user_id
+        )
+        # 客户端断开时一并关闭上游流
+        async with aclosing(stream):
+            async for chunk in stream:
+                if not chunk.get("success", False):
+                    yield self._ndjson({"event": "error", "error": chunk.get("error", "未知错误")})
+                    return
+                chunks.append(chunk["delta"])
+                content = visible.feed(chunk["delta"])
+                if content:
+                    yield self._ndjson({"event": "delta", "content": content})
+        
+        rest = visible.flush()
+        if rest:
+            yield self._ndjson({"event": "delta", "content": rest})
         
-        # 确保计划内容被正确保存
-        if db_plan:
-            db_plan.details = plan_content
-            db.commit()
-            db.refresh(db_plan)
+        plan_content = "".join(chunks)
+        if not plan_content.strip():
+            yield self._ndjson({"event": "error", "error": "未能生成有效的旅行计划内容"})
+            return
+        
+        # 流结束后再保存完整的计划内容；保存失败时也要以错误事件结束，客户端不再等待 done
+        try:
+            db_plan = await self._persist_plan(
+                user_id, destination, start_date, end_date, budget, preferences, plan_content
+            )
+            plan = TravelPlan.model_validate(db_plan).model_dump(mode="json")
+        except Exception as e:
+            logger.exception("保存流式生成的旅行计划失败")
+            yield self._ndjson({"event": "error", "error": f"保存旅行计划失败: {str(e)}"})
+            return
+        yield self._ndjson({"event": "done", "plan": plan})
+    
+    async def _persist_plan(
+        self,
+        user_id: int,
+        destination: str,
+        start_date: datetime,
+        end_date: datetime,
+        budget: float,
+        preferences: str,
+        plan_content: str
+    ):
+        """
+        使用短生命周期的会话保存计划：启用异步数据库时使用AsyncSession，否则在工作线程中执行
+
+        计划正文和解析出的结构化行程一起保存
+        """
+        parsed = self.parse_ai_response(plan_content)
+        if settings.DATABASE_ASYNC:
+            plan_data = self._build_plan_create(destination, start_date, end_date, budget, preferences)
+            async with database.AsyncSessionLocal() as db:
+                return await async_user_service.create_travel_plan(
+                    db, plan=plan_data, user_id=user_id, details=parsed["raw_plan"], itinerary=parsed["itinerary"]
+                )
+        return await run_in_session(
+            self._save_plan, user_id, destination, start_date, end_date, budget, preferences,
+            parsed["raw_plan"], parsed["itinerary"]
+        )
+    
+    def _save_plan(
+        self,
+        db: Session,
+        user_id: int,
+        destination: str,
+        start_date: datetime,
+        end_date: datetime,
+        budget: float,
+        preferences: str,
+        plan_content: str,
+        itinerary: Optional[ItineraryCreate] = None
+    ):
+        """
+        将AI生成的计划内容和结构化行程保存为旅行计划
+        """
+        plan_data = self._build_plan_create(destination, start_date, end_date, budget, preferences)
+        return user_service.create_travel_plan(
+            db=db, plan=plan_data, user_id=user_id, details=plan_content, itinerary=itinerary
+        )
+    
+    async def load_plan_itinerary(self, plan_id: int):
+        """
+        获取旅行计划及其结构化行程，查询结束后即释放会话
         
+        Returns:
+            (计划, 按天排序的行程)；计划不存在时为 (None, [])
+        """
+        if settings.DATABASE_ASYNC:
+            async with database.AsyncSessionLocal() as db:
+                db_plan = await async_user_service.get_travel_plan_with_details(db, plan_id=plan_id)
+                if db_plan is None:
+                    return None, []
+                return db_plan, await async_user_service.get_itinerary(db, plan_id=plan_id)
+        return await run_in_session(self._load_plan_itinerary, plan_id)
+    
+    @staticmethod
+    def _load_plan_itinerary(db: Session, plan_id: int):
+        db_plan = user_service.get_travel_plan_with_details(db, plan_id=plan_id)
+        if db_plan is None:
+            return None, []
+        return db_plan, user_service.get_itinerary(db, plan_id=plan_id)
+    
+    async def regenerate_day(
+        self,
+        user_id: int,
+        db_plan,
+        days: List[Any],
+        day_number: int,
+        instructions: str = ""
+    ) -> Dict[str, Any]:
+        """
+        重新生成计划中的某一天，并替换正文中对应的段落和结构化行程
+        
+        只把计划摘要、当天原有安排和相邻两天的概要发给AI，不再重新生成整份计划
+        
+        Args:
+            user_id: 用户ID
+            db_plan: 旅行计划
+            days: 计划现有的结构化行程
+            day_number: 第几天
+            instructions: 用户的修改要求
+            
+        Returns:
+            {"success": True, "plan": 更新后的计划, "day": 新的当天行程} 或
+            {"success": False, "error": 错误信息}
+        """
+        details = db_plan.details or ""
+        by_number = {day.day_number: day for day in days}
+        span = itinerary_parser.find_day_section(details, day_number)
+        current_day = details[span[0]:span[1]].strip() if span else self._summarize_day(by_number.get(day_number))
+        neighbour_days = "\n".join(
+            self._summarize_day(by_number[number]) if number in by_number
+            else self._day_excerpt(details, number)
+            for number in (day_number - 1, day_number + 1)
+            if number in by_number or itinerary_parser.find_day_section(details, number)
+        )
+        day_date = None
+        if db_plan.start_date:
+            day_date = (db_plan.start_date + timedelta(days=day_number - 1)).strftime("%Y-%m-%d")
+        # 手动创建的计划可能没有填写日期
+        start_date = db_plan.start_date.strftime("%Y-%m-%d") if db_plan.start_date else "未定"
+        end_date = db_plan.end_date.strftime("%Y-%m-%d") if db_plan.end_date else "未定"
+        plan_summary = (
+            f"目的地：{db_plan.destination}；"
+            f"日期：{start_date} 至 {end_date}；"
+            f"预算：{db_plan.budget}元；偏好：{db_plan.preferences or '无'}"
+        )
+        
+        llm_result = await llm_service.llm_service.regenerate_day(
+            plan_summary, day_number, day_date, current_day, neighbour_days, instructions, user_id=user_id
+        )
+        if not llm_result.get("success", False):
+            return {
+                "success": False,
+                "error": llm_result.get("error", "未知错误"),
+                "unavailable": llm_result.get("unavailable", False)
+            }
+        if not (llm_result.get("day") or "").strip():
+            return {
+                "success": False,
+                "error": "未能生成有效的行程内容"
+            }
+        
+        section, itinerary, _ = itinerary_parser.parse_itinerary(llm_result["day"])
+        if itinerary_parser.find_day_section(section, day_number) is None:
+            section = f"### 第{day_number}天\n{section.strip()}\n"
+        day = itinerary.days[0] if itinerary.days else ItineraryDayCreate(day_number=day_number)
+        day.day_number = day_number
+        if day.date is None and day_date:
+            day.date = datetime.strptime(day_date, "%Y-%m-%d").date()
+        
+        db_plan = await self._splice_day(db_plan.id, day_number, section, day)
+        if db_plan is None:
+            return {
+                "success": False,
+                "error": "旅行计划已被删除"
+            }
         return {
             "success": True,
             "plan": db_plan,
-            "ai_response": plan_content
+            "day": day
         }
     
+    async def _splice_day(self, plan_id: int, day_number: int, section: str, day: ItineraryDayCreate):
+        """
+        把新的当天段落拼接进最新的计划正文并替换该天的结构化行程
+        
+        在保存时重新读取正文，避免并发修改其他天时互相覆盖
+        """
+        if settings.DATABASE_ASYNC:
+            async with database.AsyncSessionLocal() as db:
+                db_plan = await async_user_service.get_travel_plan_with_details(db, plan_id=plan_id)
+                if db_plan is None:
+                    return None
+                db_plan.details = self._splice_section(db_plan.details, day_number, section)
+                await async_user_service.replace_itinerary_day(db, plan_id, day, commit=False)
+                await db.commit()
+                await async_user_service.refresh_travel_plan(db, db_plan)
+                return db_plan
+        return await run_in_session(self._save_day, plan_id, day_number, section, day)
+    
+    def _save_day(self, db: Session, plan_id: int, day_number: int, section: str, day: ItineraryDayCreate):
+        db_plan = user_service.get_travel_plan_with_details(db, plan_id=plan_id)
+        if db_plan is None:
+            return None
+        db_plan.details = self._splice_section(db_plan.details, day_number, section)
+        user_service.replace_itinerary_day(db, plan_id, day, commit=False)
+        db.commit()
+        user_service.refresh_travel_plan(db, db_plan)
+        return db_plan
+    
+    @staticmethod
+    def _splice_section(details: Optional[str], day_number: int, section: str) -> str:
+        details = details or ""
+        spliced = itinerary_parser.replace_day_section(details, day_number, section)
+        if spliced is None:
+            # 正文中没有这一天（例如被手动编辑过），追加到末尾
+            spliced = details.rstrip("\n") + "\n\n" + section
+        return spliced
+    
+    @staticmethod
+    def _summarize_day(day) -> str:
+        """
+        用一行文字概括某一天：标题和各项活动名称
+        """
+        if day is None:
+            return ""
+        activities = "、".join(
+            f"{activity.time} {activity.title}" if activity.time else activity.title
+            for activity in day.activities
+        )
+        return f"第{day.day_number}天 {day.title or ''}: {activities}"
+    
+    @staticmethod
+    def _day_excerpt(details: str, day_number: int, limit: int = 300) -> str:
+        span = itinerary_parser.find_day_section(details, day_number)
+        return details[span[0]:span[1]].strip()[:limit] if span else ""
+    
+    @staticmethod
+    def _build_plan_create(
+        destination: str,
+        start_date: datetime,
+        end_date: datetime,
+        budget: float,
+        preferences: str
+    ) -> TravelPlanCreate:
+        """
+        创建旅行计划对象
+        """
+        plan_title = f"{destination}旅行计划 ({start_date.strftime('%Y-%m-%d')} - {end_date.strftime('%Y-%m-%d')})"
+        return TravelPlanCreate(
+            title=plan_title,
+            destination=destination,
+            start_date=start_date,
+            end_date=end_date,
+            budget=budget,
+            preferences=preferences
+        )
+    
+    @staticmethod
+    def _ndjson(event: Dict[str, Any]) -> str:
+        """
+        将事件序列化为一行NDJSON
+        """
+        return json.dumps(event, ensure_ascii=False) + "\n"
+    
     async def _call_llm_service(self,
                              destination: str,
                              start_date: str,
                              end_date: str,
                              budget: float,
                              preferences: str,
-                             travelers: int) -> Dict[str, Any]:
+                             travelers: int,
+                             user_id: Optional[int] = None) -> Dict[str, Any]:
         """
         调用适当的LLM服务
         
@@ -108,44 +409,33 @@ class TravelService:
             budget: 预算
             preferences: 偏好
             travelers: 旅行人数
+            user_id: 用户ID
             
         Returns:
             LLM服务返回的结果
         """
-        # 检查是否配置了AI API
-        if not settings.AI_API_KEY or not settings.AI_API_ENDPOINT:
-            # 如果没有配置API密钥，使用模拟模式
-            return await llm_service.llm_service.generate_travel_plan(
-                destination, start_date, end_date, budget, preferences, travelers
-            )
-        
-        # 根据API端点判断使用哪种服务
-        api_endpoint = settings.AI_API_ENDPOINT or ""  # 确保不是None
-        if "dashscope" in api_endpoint or "aliyuncs" in api_endpoint:
-            # 使用阿里云百炼平台
-            return await llm_service.llm_service.generate_travel_plan_with_dashscope(
-                destination, start_date, end_date, budget, preferences, travelers
-            )
-        else:
-            # 默认使用OpenAI格式
-            return await llm_service.llm_service.generate_travel_plan(
-                destination, start_date, end_date, budget, preferences, travelers
-            )
+        # 提供方已在LLM服务启动时选定，这里无需再按端点分支
+        return await llm_service.llm_service.generate_travel_plan(
+            destination, start_date, end_date, budget, preferences, travelers, user_id=user_id
+        )
     
     def parse_ai_response(self, ai_response: str) -> Dict[str, Any]:
         """
         解析AI响应为结构化数据
         
+        优先使用AI附带的JSON行程（经Pydantic校验），没有或校验失败时从Markdown正文中解析
+        
         Args:
             ai_response: AI生成的文本响应
             
         Returns:
-            结构化的旅游计划数据
+            {"raw_plan": 去掉JSON代码块后的计划正文, "itinerary": ItineraryCreate, "source": "json" / "markdown"}
         """
-        # 这里可以实现更复杂的解析逻辑
-        # 目前我们直接返回原始响应
+        raw_plan, itinerary, source = itinerary_parser.parse_itinerary(ai_response)
         return {
-            "raw_plan": ai_response
+            "raw_plan": raw_plan,
+            "itinerary": itinerary,
+            "source": source
         }
 
 
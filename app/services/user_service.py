@@ -1,7 +1,10 @@
-from sqlalchemy.orm import Session
-from app.models.models import User, TravelPlan, Expense
-from app.schemas.schemas import UserCreate, TravelPlanCreate, TravelPlanUpdate, ExpenseCreate
+from datetime import datetime
+from sqlalchemy import inspect
+from sqlalchemy.orm import Session, load_only, undefer
+from app.models.models import User, TravelPlan, Expense, ItineraryDay, ItineraryActivity
+from app.schemas.schemas import UserCreate, TravelPlanCreate, TravelPlanUpdate, ExpenseCreate, ItineraryCreate, ItineraryDayCreate
 from app.core.security import get_password_hash, verify_password
+from app.services import auth_cache, budget_service, pagination
 from passlib.exc import MissingBackendError
 
 
@@ -21,11 +24,13 @@ def get_users(db: Session, skip: int = 0, limit: int = 100):
     return db.query(User).offset(skip).limit(limit).all()
 
 
-def create_user(db: Session, user: UserCreate):
-    try:
-        hashed_password = get_password_hash(user.password)
-    except MissingBackendError as e:
-        raise Exception(f"密码哈希处理失败: {str(e)}")
+def create_user(db: Session, user: UserCreate, hashed_password: str = None):
+    # 调用方可以预先在专用执行器中计算好哈希
+    if hashed_password is None:
+        try:
+            hashed_password = get_password_hash(user.password)
+        except MissingBackendError as e:
+            raise Exception(f"密码哈希处理失败: {str(e)}")
     
     db_user = User(
         username=user.username,
@@ -35,6 +40,8 @@ def create_user(db: Session, user: UserCreate):
     db.add(db_user)
     db.commit()
     db.refresh(db_user)
+    # 同名用户的旧缓存不能再被使用
+    auth_cache.invalidate_user(db_user.username)
     return db_user
 
 
@@ -47,46 +54,176 @@ def authenticate_user(db: Session, username: str, password: str):
     return user
 
 
-def get_travel_plans(db: Session, user_id: int, skip: int = 0, limit: int = 100):
-    return db.query(TravelPlan).filter(TravelPlan.user_id == user_id).offset(skip).limit(limit).all()
+# 计划列表只加载这些列，不加载 details
+PLAN_SUMMARY_COLUMNS = (
+    TravelPlan.id, TravelPlan.user_id, TravelPlan.title, TravelPlan.destination, TravelPlan.start_date,
+    TravelPlan.end_date, TravelPlan.budget, TravelPlan.preferences, TravelPlan.created_at, TravelPlan.updated_at
+)
+
+
+def get_travel_plans(db: Session, user_id: int, cursor: str = None, limit: int = 100, skip: int = 0):
+    """
+    按 (created_at, id) 分页获取用户的计划列表，只加载摘要字段
+
+    Args:
+        cursor: 上一页返回的游标，为空时从第一页开始
+        limit: 每页条数
+        skip: 已弃用的偏移分页，按相同顺序跳过的条数，只为兼容旧客户端保留
+
+    Raises:
+        pagination.InvalidCursor: 游标格式错误
+    """
+    query = db.query(TravelPlan).options(load_only(*PLAN_SUMMARY_COLUMNS)).filter(TravelPlan.user_id == user_id)
+    if cursor:
+        query = query.filter(pagination.after_cursor(TravelPlan.created_at, TravelPlan.id, cursor))
+    query = query.order_by(TravelPlan.created_at, TravelPlan.id)
+    if skip:
+        query = query.offset(skip)
+    return query.limit(pagination.page_size(limit)).all()
 
 
 def get_travel_plan(db: Session, plan_id: int):
+    """
+    获取计划，details 在首次访问时才读取和解压
+    """
     return db.query(TravelPlan).filter(TravelPlan.id == plan_id).first()
 
 
-def create_travel_plan(db: Session, plan: TravelPlanCreate, user_id: int):
+def get_travel_plan_with_details(db: Session, plan_id: int):
+    """
+    获取计划并在同一次查询中读取 details，返回的计划在会话关闭后仍可读取正文
+    """
+    return db.query(TravelPlan).options(undefer(TravelPlan.details)).filter(TravelPlan.id == plan_id).first()
+
+
+def plan_columns():
+    """
+    计划的全部列名（包括默认不加载的 details）
+    """
+    return [attr.key for attr in inspect(TravelPlan).column_attrs]
+
+
+def refresh_travel_plan(db: Session, db_plan: TravelPlan) -> None:
+    # refresh 默认不读取延迟加载的列，显式列出全部列，写入后返回的计划带有完整正文
+    db.refresh(db_plan, attribute_names=plan_columns())
+
+
+def create_travel_plan(db: Session, plan: TravelPlanCreate, user_id: int, details: str = None,
+                       itinerary: ItineraryCreate = None):
     db_plan = TravelPlan(**plan.dict(), user_id=user_id)
+    if details is not None:
+        db_plan.details = details
     db.add(db_plan)
+    if itinerary is not None:
+        # 计划和结构化行程在同一个事务中保存
+        db.flush()
+        replace_itinerary(db, db_plan.id, itinerary, commit=False)
     db.commit()
-    db.refresh(db_plan)
+    refresh_travel_plan(db, db_plan)
     return db_plan
 
 
-def update_travel_plan(db: Session, plan_id: int, plan: TravelPlanUpdate):
-    db_plan = db.query(TravelPlan).filter(TravelPlan.id == plan_id).first()
+def update_travel_plan(db: Session, plan_id: int, plan: TravelPlanUpdate, itinerary: ItineraryCreate = None):
+    db_plan = get_travel_plan(db, plan_id)
     if db_plan:
         update_data = plan.dict(exclude_unset=True)
         for key, value in update_data.items():
             setattr(db_plan, key, value)
+        if itinerary is not None:
+            # 修改计划和替换结构化行程在同一个事务中提交
+            replace_itinerary(db, plan_id, itinerary, commit=False)
         db.commit()
-        db.refresh(db_plan)
+        refresh_travel_plan(db, db_plan)
     return db_plan
 
 
 def delete_travel_plan(db: Session, plan_id: int):
-    db_plan = db.query(TravelPlan).filter(TravelPlan.id == plan_id).first()
+    db_plan = get_travel_plan(db, plan_id)
     if db_plan:
+        delete_itinerary(db, plan_id)
+        budget_service.delete_rollup(db, plan_id)
         db.delete(db_plan)
         db.commit()
     return db_plan
 
 
-def get_expenses(db: Session, user_id: int, plan_id: int = None, skip: int = 0, limit: int = 100):
+def get_itinerary(db: Session, plan_id: int):
+    """
+    获取计划的结构化行程，返回按天排序的日程列表，每天的活动放在 activities 属性中
+    """
+    days = db.query(ItineraryDay).filter(ItineraryDay.plan_id == plan_id).order_by(ItineraryDay.day_number).all()
+    activities = db.query(ItineraryActivity).filter(
+        ItineraryActivity.plan_id == plan_id
+    ).order_by(ItineraryActivity.position).all()
+    return group_itinerary(days, activities)
+
+
+def group_itinerary(days, activities):
+    by_day = {}
+    for activity in activities:
+        by_day.setdefault(activity.day_id, []).append(activity)
+    for day in days:
+        day.activities = by_day.get(day.id, [])
+    return days
+
+
+def delete_itinerary(db: Session, plan_id: int):
+    db.query(ItineraryActivity).filter(ItineraryActivity.plan_id == plan_id).delete(synchronize_session=False)
+    db.query(ItineraryDay).filter(ItineraryDay.plan_id == plan_id).delete(synchronize_session=False)
+
+
+def replace_itinerary(db: Session, plan_id: int, itinerary: ItineraryCreate, commit: bool = True):
+    """
+    用新的结构化行程替换计划原有的行程
+    """
+    delete_itinerary(db, plan_id)
+    for day in itinerary.days:
+        _add_itinerary_day(db, plan_id, day)
+    if commit:
+        db.commit()
+
+
+def replace_itinerary_day(db: Session, plan_id: int, day: ItineraryDayCreate, commit: bool = True):
+    """
+    只替换行程中的某一天，其他天不受影响
+    """
+    day_ids = [
+        row.id for row in db.query(ItineraryDay.id).filter(
+            ItineraryDay.plan_id == plan_id, ItineraryDay.day_number == day.day_number
+        )
+    ]
+    if day_ids:
+        db.query(ItineraryActivity).filter(ItineraryActivity.day_id.in_(day_ids)).delete(synchronize_session=False)
+        db.query(ItineraryDay).filter(ItineraryDay.id.in_(day_ids)).delete(synchronize_session=False)
+    _add_itinerary_day(db, plan_id, day)
+    if commit:
+        db.commit()
+
+
+def _add_itinerary_day(db: Session, plan_id: int, day: ItineraryDayCreate):
+    db_day = ItineraryDay(plan_id=plan_id, day_number=day.day_number, date=day.date, title=day.title)
+    db.add(db_day)
+    db.flush()
+    db.add_all([
+        ItineraryActivity(plan_id=plan_id, day_id=db_day.id, position=position, **activity.model_dump())
+        for position, activity in enumerate(day.activities)
+    ])
+
+
+def get_expenses(db: Session, user_id: int, plan_id: int = None, cursor: str = None, limit: int = 100,
+                 skip: int = 0):
+    """
+    按 (created_at, id) 分页获取用户的开销，cursor 和 skip 含义同 get_travel_plans
+    """
     query = db.query(Expense).filter(Expense.user_id == user_id)
     if plan_id:
         query = query.filter(Expense.plan_id == plan_id)
-    return query.offset(skip).limit(limit).all()
+    if cursor:
+        query = query.filter(pagination.after_cursor(Expense.created_at, Expense.id, cursor))
+    query = query.order_by(Expense.created_at, Expense.id)
+    if skip:
+        query = query.offset(skip)
+    return query.limit(pagination.page_size(limit)).all()
 
 
 def create_expense(db: Session, expense: ExpenseCreate, user_id: int):
@@ -97,6 +234,8 @@ def create_expense(db: Session, expense: ExpenseCreate, user_id: int):
     
     db_expense = Expense(**expense_dict, user_id=user_id)
     db.add(db_expense)
+    # 与开销在同一事务中更新计划的预算汇总
+    budget_service.apply_expense(db, db_expense)
     db.commit()
     db.refresh(db_expense)
     return db_expense
\ No newline at end of file
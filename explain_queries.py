@@ -0,0 +1,231 @@
+import argparse
+import asyncio
+import os
+import re
+import shutil
+import sys
+import tempfile
+from contextlib import contextmanager
+from datetime import datetime
+from typing import List, Optional
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+from app.core.config import settings
+from app.database import database
+from app.database.database import Base
+from app.database.migrations import migrate
+from app.schemas.schemas import (
+    UserCreate, TravelPlanCreate, TravelPlanUpdate, ExpenseCreate,
+    ItineraryCreate, ItineraryDayCreate, ItineraryActivityBase
+)
+from app.services import (
+    user_service, budget_service, job_service, pagination, expense_import_service, search_service
+)
+
+_SQLITE_SCAN = re.compile(r"^SCAN (?:TABLE )?(\w+)(?: AS \w+)?$")
+_POSTGRES_SCAN = re.compile(r"Seq Scan on (\w+)")
+
+
+class QueryRecorder:
+    """
+    记录执行过的查询语句，同一条SQL只保留第一次出现时的参数
+    """
+
+    def __init__(self):
+        self.step = None
+        self.queries = {}
+
+    def __call__(self, conn, cursor, statement, parameters, context, executemany):
+        if self.step is None or executemany:
+            return
+        verb = statement.lstrip().split(None, 1)[0].upper()
+        if verb in ("SELECT", "UPDATE", "DELETE"):
+            self.queries.setdefault(statement, (self.step, parameters))
+
+    @contextmanager
+    def recording(self, step: str):
+        self.step = step
+        try:
+            yield
+        finally:
+            self.step = None
+
+
+def run_workload(recorder: QueryRecorder):
+    """
+    依次调用服务层的读写函数，覆盖接口用到的各类查询
+    """
+    db = database.SessionLocal()
+    try:
+        with recorder.recording("user_service.users"):
+            user = user_service.create_user(
+                db, UserCreate(username="explain", email="explain@example.com", password="x"), hashed_password="x"
+            )
+            user_service.get_user(db, user.id)
+            user_service.get_user_by_username(db, user.username)
+            user_service.get_user_by_email(db, user.email)
+
+        plan_data = TravelPlanCreate(
+            title="explain", destination="北京", start_date=datetime(2025, 12, 1), end_date=datetime(2025, 12, 3),
+            budget=1000, preferences=""
+        )
+        with recorder.recording("user_service.plans"):
+            plans = [user_service.create_travel_plan(db, plan_data, user.id) for _ in range(3)]
+            plan = plans[0]
+            page = user_service.get_travel_plans(db, user.id, limit=2)
+            user_service.get_travel_plans(db, user.id, cursor=pagination.next_cursor(page, 2), limit=2)
+            user_service.get_travel_plan(db, plan.id)
+            user_service.update_travel_plan(db, plan.id, TravelPlanUpdate(**plan_data.model_dump(), details="x"))
+
+        with recorder.recording("search_service"):
+            search_service.search_plans(db, user.id, "北京 explain")
+            search_service.search_plans(db, user.id, "京", offset=2)
+
+        with recorder.recording("user_service.itinerary"):
+            day = ItineraryDayCreate(day_number=1, activities=[ItineraryActivityBase(title="故宫")])
+            user_service.replace_itinerary(db, plan.id, ItineraryCreate(days=[day]))
+            user_service.replace_itinerary_day(db, plan.id, day)
+            user_service.get_itinerary(db, plan.id)
+
+        with recorder.recording("user_service.expenses"):
+            for amount in (10, 20, 30):
+                user_service.create_expense(
+                    db, ExpenseCreate(plan_id=plan.id, category="餐饮", amount=amount, description=""), user.id
+                )
+            page = user_service.get_expenses(db, user.id, limit=2)
+            user_service.get_expenses(db, user.id, cursor=pagination.next_cursor(page, 2), limit=2)
+            page = user_service.get_expenses(db, user.id, plan_id=plan.id, limit=2)
+            user_service.get_expenses(db, user.id, plan_id=plan.id, cursor=pagination.next_cursor(page, 2), limit=2)
+
+        with recorder.recording("expense_import_service"):
+            importer = expense_import_service.ExpenseImporter(user.id, plan_id=plans[1].id)
+            rows = [{"category": "交通", "amount": 5, "description": ""}] * 3
+            asyncio.run(expense_import_service.import_rows(importer, enumerate(rows, start=1)))
+
+        with recorder.recording("budget_service"):
+            budget_service.get_budget_summary(db, plan)
+            budget_service.get_budget_status(db, plan)
+            budget_service.get_budget_status(db, plans[2])
+            budget_service.check_rollup(db, plan.id)
+            budget_service.rebuild_rollup(db, plan.id)
+            db.commit()
+
+        with recorder.recording("job_service"):
+            job = job_service.create_job(
+                db, user.id, "北京", datetime(2025, 12, 1), datetime(2025, 12, 3), 1000, "", 1, max_active=3
+            )
+            job_service.get_job(db, job.id)
+            job_service.claim_job(db, job.id, "explain")
+            job_service.heartbeat_job(db, job.id, "explain")
+            job_service.finish_job(db, job.id, "explain", plan_id=plan.id)
+            job_service.recover_jobs(db, lease_seconds=60)
+
+        with recorder.recording("user_service.delete"):
+            user_service.delete_travel_plan(db, plan.id)
+    finally:
+        db.close()
+
+
+def explain(connection, statement, parameters):
+    """
+    Returns:
+        (执行计划各行, 全表扫描的表名列表, 提示信息列表)
+    """
+    tables = set(Base.metadata.tables)
+    if connection.dialect.name == "sqlite":
+        rows = connection.exec_driver_sql("EXPLAIN QUERY PLAN " + statement, parameters).fetchall()
+        lines = [row[-1] for row in rows]
+        scans = [m.group(1) for m in map(_SQLITE_SCAN.match, lines) if m and m.group(1) in tables]
+        notes = [line for line in lines if line.startswith("USE TEMP B-TREE")]
+        return lines, scans, notes
+
+    # 关闭顺序扫描后仍出现 Seq Scan，说明没有可用的索引
+    connection.exec_driver_sql("SET enable_seqscan = off")
+    lines = [row[0] for row in connection.exec_driver_sql("EXPLAIN " + statement, parameters).fetchall()]
+    scans = [m.group(1) for m in map(_POSTGRES_SCAN.search, lines) if m and m.group(1) in tables]
+    notes = [line.strip() for line in lines if line.strip().startswith("->  Sort") or line.startswith("Sort")]
+    return lines, scans, notes
+
+
+@contextmanager
+def use_database(url: str):
+    """
+    临时把应用切换到指定的数据库：服务层按配置的数据库生成查询，并通过 database.SessionLocal 打开会话
+    """
+    is_sqlite = url.startswith("sqlite")
+    engine = create_engine(
+        url, connect_args={"check_same_thread": False} if is_sqlite else {}, **database._engine_options(url)
+    )
+    if is_sqlite:
+        event.listen(engine, "connect", database._apply_sqlite_pragmas)
+    saved = (settings.DATABASE_URL, settings.DATABASE_ASYNC, database.engine, database.SessionLocal)
+    settings.DATABASE_URL = url
+    settings.DATABASE_ASYNC = False
+    database.engine = engine
+    database.SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    try:
+        yield engine
+    finally:
+        settings.DATABASE_URL, settings.DATABASE_ASYNC, database.engine, database.SessionLocal = saved
+        engine.dispose()
+
+
+def check_queries(url: str, verbose: bool = False) -> int:
+    """
+    在指定的空数据库上执行迁移和服务层查询，逐条输出执行计划检查结果
+
+    Returns:
+        存在全表扫描的查询数
+    """
+    with use_database(url) as engine:
+        migrate(engine)
+        recorder = QueryRecorder()
+        event.listen(engine, "before_cursor_execute", recorder)
+        try:
+            run_workload(recorder)
+        finally:
+            event.remove(engine, "before_cursor_execute", recorder)
+
+        failures = 0
+        with engine.connect() as connection:
+            for statement, (step, parameters) in recorder.queries.items():
+                lines, scans, notes = explain(connection, statement, parameters)
+                status = "FULL SCAN" if scans else "ok"
+                failures += bool(scans)
+                summary = " ".join(statement.split())
+                print(f"[{status}] {step}: {summary[:160]}")
+                for table in scans:
+                    print(f"    全表扫描: {table}")
+                for note in notes:
+                    print(f"    提示: {note}")
+                if verbose:
+                    for line in lines:
+                        print(f"    {line}")
+
+    print(f"共检查 {len(recorder.queries)} 条查询，{failures} 条存在全表扫描")
+    return failures
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        description="对服务层的数据库查询逐一执行 EXPLAIN，发现全表扫描时以非零状态退出（开发用）"
+    )
+    parser.add_argument(
+        "--url",
+        help="用于检查的空数据库（会写入测试数据），默认使用临时SQLite文件；支持 sqlite 和 postgresql"
+    )
+    parser.add_argument("--verbose", action="store_true", help="输出每条查询的完整执行计划")
+    args = parser.parse_args(argv)
+
+    if args.url:
+        return 1 if check_queries(args.url, args.verbose) else 0
+    scratch = tempfile.mkdtemp(prefix="explain_queries_")
+    try:
+        url = f"sqlite:///{os.path.join(scratch, 'explain.db')}"
+        return 1 if check_queries(url, args.verbose) else 0
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
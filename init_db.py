@@ -1,14 +1,22 @@
-import os
-import sys
-from sqlalchemy import create_engine
-from app.models.models import Base
-from app.core.config import settings
+import argparse
+import logging
+from app.database.migrations import migrate, get_schema_version, latest_version
+
 
 def init_db():
-    """初始化数据库"""
-    engine = create_engine(settings.DATABASE_URL, echo=True)
-    Base.metadata.create_all(bind=engine)
-    print("Database tables created successfully!")
+    """初始化数据库：执行尚未执行的迁移"""
+    applied = migrate()
+    if applied:
+        print(f"Applied migrations: {', '.join(str(version) for version in applied)}")
+    print(f"Database schema is at version {get_schema_version()}")
+
 
 if __name__ == "__main__":
-    init_db()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="执行数据库迁移")
+    parser.add_argument("--status", action="store_true", help="只显示当前结构版本，不执行迁移")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    if args.status:
+        print(f"Database schema version: {get_schema_version()} (latest: {latest_version()})")
+    else:
+        init_db()
@@ -0,0 +1,62 @@
+import argparse
+import sys
+from sqlalchemy import select
+from app.database.database import SessionLocal
+from app.database.migrations import SchemaVersionError, verify_schema
+from app.models.models import TravelPlan
+from app.services import budget_service
+
+
+def rebuild_budget_rollup(check_only: bool = False, plan_id: int = None) -> int:
+    """
+    按开销明细回填或校验每个计划的预算汇总（plan_budget_rollup）
+
+    Args:
+        check_only: 只校验不写入
+        plan_id: 只处理指定计划，为空时处理全部计划
+
+    Returns:
+        汇总不一致的计划数
+
+    Raises:
+        SchemaVersionError: 数据库还没有迁移到当前版本，汇总表由迁移创建
+    """
+    verify_schema()
+    db = SessionLocal()
+    mismatched = 0
+    try:
+        query = select(TravelPlan.id).order_by(TravelPlan.id)
+        if plan_id is not None:
+            query = query.where(TravelPlan.id == plan_id)
+        plan_ids = db.execute(query).scalars().all()
+
+        for current_id in plan_ids:
+            if check_only:
+                fields = budget_service.check_rollup(db, current_id)
+            else:
+                _, fields = budget_service.rebuild_rollup(db, current_id)
+                # 每个计划单独提交，避免长时间持有写锁
+                db.commit()
+            if fields:
+                mismatched += 1
+                print(f"plan {current_id}: 汇总不一致 ({', '.join(fields)})")
+
+        action = "校验" if check_only else "重建"
+        print(f"已{action} {len(plan_ids)} 个计划的预算汇总，其中 {mismatched} 个不一致")
+    finally:
+        db.close()
+    return mismatched
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="回填或校验计划的预算汇总")
+    parser.add_argument("--check", action="store_true", help="只校验汇总与开销明细是否一致，不写入")
+    parser.add_argument("--plan-id", type=int, help="只处理指定的计划")
+    args = parser.parse_args()
+    try:
+        count = rebuild_budget_rollup(check_only=args.check, plan_id=args.plan_id)
+    except SchemaVersionError as e:
+        print(e)
+        sys.exit(2)
+    # 校验模式下发现不一致时返回非零退出码，便于在定时任务中告警
+    sys.exit(1 if args.check and count else 0)
@@ -0,0 +1,113 @@
+import argparse
+import sys
+import time
+from sqlalchemy import text
+from app.core import compression
+from app.core.config import settings
+from app.database.database import engine
+
+# 每批读取的计划数，每批单独提交
+BATCH_SIZE = 200
+
+
+def recompress_details(batch_size: int = BATCH_SIZE, pause: float = 0.0, dry_run: bool = False) -> dict:
+    """
+    按计划ID逐批把计划详情改写为当前配置的压缩格式
+
+    只改写与当前配置不一致的行（压缩之前写入的文本、更换编码或zstd字典之前写入的值），可以重复运行；
+    改写时以原值为条件，期间被用户修改过的行会跳过，留给下一次运行
+
+    Args:
+        batch_size: 每批处理的行数
+        pause: 每批之间暂停的秒数，降低对在线请求的影响
+        dry_run: 只统计不写入
+
+    Returns:
+        {"scanned": 扫描行数, "pending": 需要改写的行数, "rewritten": 实际改写的行数,
+         "bytes_before": 需要改写的行原来的字节数, "bytes_after": 改写后的字节数}
+    """
+    stats = {"scanned": 0, "pending": 0, "rewritten": 0, "bytes_before": 0, "bytes_after": 0}
+    after = 0
+    while True:
+        with engine.connect() as connection:
+            # 读取存储的原始值，不经过 CompressedText 解压
+            rows = connection.execute(
+                text("SELECT id, details_compressed FROM travel_plans WHERE id > :after ORDER BY id LIMIT :limit"),
+                {"after": after, "limit": batch_size}
+            ).all()
+        if not rows:
+            break
+        after = rows[-1][0]
+
+        updates = []
+        for plan_id, stored in rows:
+            stats["scanned"] += 1
+            if not compression.needs_recompress(stored):
+                continue
+            stored = bytes(stored) if isinstance(stored, memoryview) else stored
+            value = compression.compress_text(compression.decompress_text(stored))
+            stats["pending"] += 1
+            stats["bytes_before"] += len(stored.encode("utf-8") if isinstance(stored, str) else stored)
+            stats["bytes_after"] += len(value)
+            updates.append({"id": plan_id, "old": stored, "new": value})
+
+        if updates and not dry_run:
+            with engine.begin() as connection:
+                for item in updates:
+                    result = connection.execute(
+                        text(
+                            "UPDATE travel_plans SET details_compressed = :new "
+                            "WHERE id = :id AND details_compressed = :old"
+                        ),
+                        item
+                    )
+                    stats["rewritten"] += result.rowcount
+        if pause:
+            time.sleep(pause)
+    return stats
+
+
+def train_dictionary(samples: int) -> int:
+    """
+    用最近的计划详情训练 zstd 字典
+
+    Returns:
+        字典ID
+    """
+    with engine.connect() as connection:
+        rows = connection.execute(
+            text(
+                "SELECT details_compressed FROM travel_plans WHERE details_compressed IS NOT NULL "
+                "ORDER BY id DESC LIMIT :limit"
+            ),
+            {"limit": samples}
+        ).scalars().all()
+    return compression.train_dictionary(compression.decompress_text(value) for value in rows)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="把计划详情改写为当前配置的压缩格式（可在服务运行时执行）")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="每批处理的行数")
+    parser.add_argument("--pause", type=float, default=0.0, help="每批之间暂停的秒数")
+    parser.add_argument("--dry-run", action="store_true", help="只统计需要改写的行和压缩效果，不写入")
+    parser.add_argument("--vacuum", action="store_true", help="完成后执行 VACUUM 归还空闲页（仅SQLite，期间会锁库）")
+    parser.add_argument(
+        "--train-dictionary", type=int, metavar="SAMPLES",
+        help="用最近的若干条计划详情训练zstd字典后退出，需安装zstandard"
+    )
+    args = parser.parse_args()
+
+    if args.train_dictionary:
+        dict_id = train_dictionary(args.train_dictionary)
+        print(f"已生成字典 {dict_id}，设置 COMPRESSION_CODEC=zstd、COMPRESSION_ZSTD_DICT_ID={dict_id} "
+              f"并重启服务后，再运行本命令改写已有数据")
+        sys.exit(0)
+
+    stats = recompress_details(batch_size=args.batch_size, pause=args.pause, dry_run=args.dry_run)
+    ratio = stats["bytes_before"] / stats["bytes_after"] if stats["bytes_after"] else 0
+    print(f"扫描 {stats['scanned']} 个计划，需要改写 {stats['pending']} 个，已改写 {stats['rewritten']} 个")
+    print(f"改写部分 {stats['bytes_before']} -> {stats['bytes_after']} 字节（{ratio:.1f}x，编码 {compression.current_codec()}）")
+    if args.vacuum and not args.dry_run and settings.DATABASE_URL.startswith("sqlite"):
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+            connection.exec_driver_sql("VACUUM")
+        print("VACUUM 完成")
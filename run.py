@@ -1,7 +1,10 @@
 from app.main import app
+from app.database.migrations import migrate
 
 if __name__ == "__main__":
     import uvicorn
     import os
+    # 单进程启动入口（Docker镜像使用），启动前先执行尚未执行的迁移
+    migrate()
     port = int(os.environ.get("PORT", 8080))
     uvicorn.run(app, host="localhost", port=port)
\ No newline at end of file
@@ -0,0 +1,122 @@
+import os
+import shutil
+import tempfile
+import unittest
+from datetime import datetime
+from unittest.mock import patch
+from sqlalchemy import create_engine, event
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from app.database import database
+from app.database.database import Base
+from app.models.models import PlanBudgetRollup
+from app.schemas.schemas import ExpenseCreate, ItineraryCreate, TravelPlanCreate, TravelPlanUpdate
+from app.services import async_user_service, user_service
+
+
+def plan_data(title):
+    return TravelPlanCreate(
+        title=title, destination="成都", start_date=datetime(2025, 12, 1), end_date=datetime(2025, 12, 3),
+        budget=3000.0, preferences="美食"
+    )
+
+
+class TestAsyncDatabaseUrl(unittest.TestCase):
+    def test_derived_from_database_url(self):
+        cases = {
+            "sqlite:///./travel_planner.db": "sqlite+aiosqlite:///./travel_planner.db",
+            "postgresql://u:p@db/app": "postgresql+asyncpg://u:p@db/app",
+            "postgres://u:p@db/app": "postgresql+asyncpg://u:p@db/app",
+        }
+        for url, expected in cases.items():
+            with patch.object(database.settings, "DATABASE_URL", url), \
+                    patch.object(database.settings, "ASYNC_DATABASE_URL", ""):
+                self.assertEqual(database.get_async_database_url(), expected)
+
+    def test_explicit_async_url(self):
+        with patch.object(database.settings, "ASYNC_DATABASE_URL", "postgresql+asyncpg://other/app"):
+            self.assertEqual(database.get_async_database_url(), "postgresql+asyncpg://other/app")
+
+
+class TestAsyncUserServiceParity(unittest.IsolatedAsyncioTestCase):
+    """
+    同一个数据库上，同步和异步服务的读写结果一致
+    """
+
+    async def asyncSetUp(self):
+        self.directory = tempfile.mkdtemp()
+        path = os.path.join(self.directory, "test.db")
+        self.engine = create_engine(f"sqlite:///{path}")
+        Base.metadata.create_all(bind=self.engine)
+        self.db = sessionmaker(bind=self.engine)()
+        self.async_engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+        self.adb = async_sessionmaker(self.async_engine, autoflush=False, expire_on_commit=False)()
+
+    async def asyncTearDown(self):
+        await self.adb.close()
+        await self.async_engine.dispose()
+        self.db.close()
+        self.engine.dispose()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    async def test_plans(self):
+        sync_plan = user_service.create_travel_plan(self.db, plan_data("同步"), user_id=1)
+        async_plan = await async_user_service.create_travel_plan(self.adb, plan_data("异步"), user_id=1)
+        self.assertEqual(async_plan.user_id, sync_plan.user_id)
+        self.assertIsNotNone(async_plan.created_at)
+
+        sync_page = [plan.id for plan in user_service.get_travel_plans(self.db, user_id=1, limit=10)]
+        async_page = [plan.id for plan in await async_user_service.get_travel_plans(self.adb, user_id=1, limit=10)]
+        self.assertEqual(sync_page, [sync_plan.id, async_plan.id])
+        self.assertEqual(async_page, sync_page)
+
+        update = TravelPlanUpdate(**plan_data("改过").model_dump(), details="### 第1天\n宽窄巷子")
+        updated = await async_user_service.update_travel_plan(self.adb, sync_plan.id, update)
+        self.assertEqual(updated.details, "### 第1天\n宽窄巷子")
+        self.db.expire_all()
+        self.assertEqual(user_service.get_travel_plan(self.db, sync_plan.id).title, "改过")
+
+        await async_user_service.delete_travel_plan(self.adb, async_plan.id)
+        self.db.expire_all()
+        self.assertIsNone(user_service.get_travel_plan(self.db, async_plan.id))
+
+    async def test_plan_and_itinerary_saved_in_one_commit(self):
+        commits = []
+        event.listen(self.db, "after_commit", lambda session: commits.append(session))
+        itinerary = ItineraryCreate(days=[{"day_number": 1, "title": "宽窄巷子", "activities": [{"title": "喝茶"}]}])
+
+        plan = user_service.create_travel_plan(
+            self.db, plan_data("t"), user_id=1, details="### 第1天\n宽窄巷子", itinerary=itinerary
+        )
+        self.assertEqual(len(commits), 1)
+        self.assertEqual(plan.details, "### 第1天\n宽窄巷子")
+
+        itinerary = ItineraryCreate(days=[{"day_number": 1, "title": "武侯祠"}, {"day_number": 2, "title": "锦里"}])
+        update = TravelPlanUpdate(**plan_data("改过").model_dump(), details="### 第1天\n武侯祠\n### 第2天\n锦里")
+        user_service.update_travel_plan(self.db, plan.id, update, itinerary=itinerary)
+        self.assertEqual(len(commits), 2)
+
+        sync_days = user_service.get_itinerary(self.db, plan.id)
+        async_days = await async_user_service.get_itinerary(self.adb, plan.id)
+        self.assertEqual([day.title for day in sync_days], ["武侯祠", "锦里"])
+        self.assertEqual([day.title for day in async_days], ["武侯祠", "锦里"])
+
+    async def test_expenses_update_rollup(self):
+        plan = user_service.create_travel_plan(self.db, plan_data("t"), user_id=1)
+        user_service.create_expense(
+            self.db, ExpenseCreate(plan_id=plan.id, category="餐饮", amount=30.0, description="火锅"), user_id=1
+        )
+        await async_user_service.create_expense(
+            self.adb, ExpenseCreate(plan_id=plan.id, category="交通", amount=20.5, description="地铁"), user_id=1
+        )
+
+        sync_expenses = user_service.get_expenses(self.db, user_id=1, plan_id=plan.id)
+        async_expenses = await async_user_service.get_expenses(self.adb, user_id=1, plan_id=plan.id)
+        self.assertEqual([item.id for item in async_expenses], [item.id for item in sync_expenses])
+        self.db.expire_all()
+        rollup = self.db.get(PlanBudgetRollup, plan.id)
+        self.assertEqual((rollup.total_spent, rollup.expense_count), (50.5, 2))
+
+
+if __name__ == '__main__':
+    unittest.main()
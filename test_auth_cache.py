@@ -0,0 +1,46 @@
+import time
+import unittest
+from datetime import datetime
+from unittest.mock import patch
+from app.schemas.schemas import User
+from app.services import auth_cache
+
+
+class TestAuthCache(unittest.TestCase):
+    def setUp(self):
+        auth_cache.clear()
+        self.user = User(id=1, username="alice", email="alice@example.com", created_at=datetime.utcnow())
+
+    def test_cached_until_invalidated(self):
+        auth_cache.put_user("token", self.user, time.time() + 600, auth_cache.generation("alice"))
+        self.assertEqual(auth_cache.get_user("token"), self.user)
+        auth_cache.invalidate_user("alice")
+        self.assertIsNone(auth_cache.get_user("token"))
+
+    def test_not_cached_past_token_expiry(self):
+        auth_cache.put_user("token", self.user, time.time() - 1, auth_cache.generation("alice"))
+        self.assertIsNone(auth_cache.get_user("token"))
+
+    def test_invalidation_during_lookup_wins(self):
+        user_generation = auth_cache.generation("alice")
+        auth_cache.invalidate_user("alice")
+        auth_cache.put_user("token", self.user, time.time() + 600, user_generation)
+        self.assertIsNone(auth_cache.get_user("token"))
+
+    def test_generations_bounded(self):
+        auth_cache.put_user("token", self.user, time.time() + 600, auth_cache.generation("alice"))
+        with patch.object(auth_cache.settings, "AUTH_CACHE_MAX_ENTRIES", 3):
+            auth_cache.invalidate_user("alice")
+            for i in range(10):
+                auth_cache.invalidate_user(f"user{i}")
+            self.assertLessEqual(len(auth_cache._generations), 3)
+        # alice 的版本号已被淘汰，旧令牌仍然不能命中
+        self.assertNotIn("alice", auth_cache._generations)
+        self.assertIsNone(auth_cache.get_user("token"))
+
+        auth_cache.put_user("token", self.user, time.time() + 600, auth_cache.generation("alice"))
+        self.assertEqual(auth_cache.get_user("token"), self.user)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,112 @@
+import unittest
+from datetime import datetime
+from unittest.mock import patch
+from sqlalchemy import create_engine, inspect
+from sqlalchemy.orm import sessionmaker
+from app.database import database
+from app.database.database import Base
+from app.database.migrations import SchemaVersionError
+from app.models.models import Expense, TravelPlan, PlanBudgetRollup
+from app.schemas.schemas import ExpenseCreate
+from app.services import budget_service, user_service
+
+
+class TestBudgetService(unittest.TestCase):
+    def setUp(self):
+        engine = create_engine("sqlite://")
+        Base.metadata.create_all(bind=engine)
+        self.db = sessionmaker(bind=engine)()
+        self.plan = TravelPlan(user_id=1, title="t", destination="北京", budget=1000.0)
+        self.db.add(self.plan)
+        self.db.commit()
+        for i in range(150):
+            self.db.add(Expense(
+                user_id=1,
+                plan_id=self.plan.id,
+                category="餐饮" if i % 2 else "交通",
+                amount=10.0,
+                description=f"e{i}",
+                expense_date=datetime(2025, 12, 1 + i % 3, 12)
+            ))
+        self.db.add(Expense(user_id=2, plan_id=999, category="购物", amount=999.0))
+        self.db.commit()
+
+    def tearDown(self):
+        self.db.close()
+
+    def test_summary_covers_all_expenses(self):
+        summary = budget_service.get_budget_summary(self.db, self.plan)
+        self.assertEqual(summary.expense_count, 150)
+        self.assertEqual(summary.total_spent, 1500.0)
+        self.assertEqual(summary.remaining, -500.0)
+        self.assertEqual({item.category: item.count for item in summary.categories}, {"餐饮": 75, "交通": 75})
+        self.assertEqual([str(item.date) for item in summary.daily], ["2025-12-01", "2025-12-02", "2025-12-03"])
+        self.assertEqual(sum(item.total for item in summary.daily), 1500.0)
+        self.assertEqual(len(summary.largest), budget_service.LARGEST_EXPENSES)
+
+    def test_empty_plan(self):
+        plan = TravelPlan(user_id=1, title="空", destination="上海", budget=0.0)
+        self.db.add(plan)
+        self.db.commit()
+        summary = budget_service.get_budget_summary(self.db, plan)
+        self.assertEqual(summary.total_spent, 0.0)
+        self.assertEqual(summary.usage_rate, 0.0)
+        self.assertEqual(summary.categories, [])
+
+    def test_status_falls_back_to_expenses_without_rollup(self):
+        status = budget_service.get_budget_status(self.db, self.plan)
+        self.assertIsNone(status.updated_at)
+        self.assertEqual(status.total_spent, 1500.0)
+        self.assertEqual(budget_service.check_rollup(self.db, self.plan.id), ["missing"])
+
+    def test_create_expense_maintains_rollup(self):
+        expense = ExpenseCreate(plan_id=self.plan.id, category="住宿", amount=300.5, description="酒店",
+                                expense_date=datetime(2025, 12, 4, 20))
+        user_service.create_expense(self.db, expense, user_id=1)
+        rollup = self.db.get(PlanBudgetRollup, self.plan.id)
+        self.assertIsNotNone(rollup)
+        self.assertEqual(rollup.expense_count, 151)
+
+        expense.amount = 99.5
+        user_service.create_expense(self.db, expense, user_id=1)
+        status = budget_service.get_budget_status(self.db, self.plan)
+        summary = budget_service.get_budget_summary(self.db, self.plan)
+        self.assertIsNotNone(status.updated_at)
+        self.assertEqual(status.total_spent, 1900.0)
+        self.assertEqual(status.categories, summary.categories)
+        self.assertEqual(status.daily, summary.daily)
+        self.assertEqual(budget_service.check_rollup(self.db, self.plan.id), [])
+
+    def test_rebuild_fixes_drift(self):
+        rollup, _ = budget_service.rebuild_rollup(self.db, self.plan.id)
+        self.db.commit()
+        rollup.total_spent = 1.0
+        self.db.commit()
+        self.assertIn("total_spent", budget_service.check_rollup(self.db, self.plan.id))
+        _, mismatched = budget_service.rebuild_rollup(self.db, self.plan.id)
+        self.db.commit()
+        self.assertEqual(mismatched, ["total_spent"])
+        self.assertEqual(budget_service.check_rollup(self.db, self.plan.id), [])
+
+    def test_apply_expense_removal(self):
+        budget_service.rebuild_rollup(self.db, self.plan.id)
+        expense = self.db.query(Expense).filter(Expense.plan_id == self.plan.id).first()
+        self.db.delete(expense)
+        budget_service.apply_expense(self.db, expense, sign=-1)
+        self.db.commit()
+        self.assertEqual(budget_service.check_rollup(self.db, self.plan.id), [])
+
+
+class TestRebuildScript(unittest.TestCase):
+    def test_requires_migrated_schema(self):
+        from rebuild_budget_rollup import rebuild_budget_rollup
+
+        engine = create_engine("sqlite://")
+        with patch.object(database, "engine", engine), self.assertRaises(SchemaVersionError):
+            rebuild_budget_rollup(check_only=True)
+        # 汇总表由迁移创建，脚本不再自行建表
+        self.assertFalse(inspect(engine).has_table(PlanBudgetRollup.__tablename__))
+
+
+if __name__ == '__main__':
+    unittest.main()
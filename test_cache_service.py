@@ -0,0 +1,130 @@
+import asyncio
+import os
+import sqlite3
+import tempfile
+import time
+import unittest
+from app.services.cache_service import build_cache_key, BaseCache, MemoryCache, SQLiteCache
+
+
+class TestBuildCacheKey(unittest.TestCase):
+    def test_whitespace_is_normalized(self):
+        key1 = build_cache_key("目的地：北京\n        预算：5000元", "qwen-turbo", 0.7)
+        key2 = build_cache_key("目的地：北京 预算：5000元", "qwen-turbo", 0.7)
+        self.assertEqual(key1, key2)
+
+    def test_model_and_temperature_are_part_of_key(self):
+        key = build_cache_key("prompt", "qwen-turbo", 0.7)
+        self.assertNotEqual(key, build_cache_key("prompt", "gpt-3.5-turbo", 0.7))
+        self.assertNotEqual(key, build_cache_key("prompt", "qwen-turbo", 0.3))
+
+
+class TestBaseCache(unittest.TestCase):
+    def test_backends_must_implement_all_methods(self):
+        class Incomplete(BaseCache):
+            def get(self, key):
+                return None
+
+        with self.assertRaises(TypeError):
+            Incomplete()
+
+
+class TestMemoryCache(unittest.TestCase):
+    def test_lru_eviction(self):
+        cache = MemoryCache(max_entries=2)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+        self.assertEqual(cache.get("a"), 1)
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("c"), 3)
+
+    def test_ttl_expiry(self):
+        cache = MemoryCache(ttl=0.01)
+        cache.set("a", 1)
+        time.sleep(0.02)
+        self.assertIsNone(cache.get("a"))
+
+
+class TestSQLiteCache(unittest.TestCase):
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp(suffix=".db")
+        os.close(fd)
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def test_survives_reopen(self):
+        cache = SQLiteCache(self.path)
+        cache.set("a", "旅行计划")
+        cache.close()
+        cache = SQLiteCache(self.path)
+        self.assertEqual(cache.get("a"), "旅行计划")
+        cache.close()
+
+    def test_size_bounded(self):
+        cache = SQLiteCache(self.path, max_entries=2)
+        cache.set("a", 1)
+        time.sleep(0.01)
+        cache.set("b", 2)
+        time.sleep(0.01)
+        cache.set("c", 3)
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(cache.get("c"), 3)
+        cache.close()
+
+    def test_values_compressed(self):
+        cache = SQLiteCache(self.path)
+        response = {"content": "第1天：参观故宫。" * 200}
+        cache.set("a", response)
+        # 启用压缩之前写入的文本条目
+        cache._conn.execute(
+            "INSERT INTO cache_entries (key, value, expires_at, accessed_at) VALUES ('b', '[1, 2]', NULL, 0)"
+        )
+        stored = cache._conn.execute("SELECT value FROM cache_entries WHERE key = 'a'").fetchone()[0]
+        self.assertIsInstance(stored, bytes)
+        self.assertLess(len(stored), len(response["content"]))
+        self.assertEqual(cache.get("a"), response)
+        self.assertEqual(cache.get("b"), [1, 2])
+        cache.close()
+
+
+class TestSQLiteCacheAsync(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp(suffix=".db")
+        os.close(fd)
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    async def test_locked_database_does_not_block_event_loop(self):
+        cache = SQLiteCache(self.path)
+        await cache.aset("a", {"plan": "北京"})
+        # 另一个连接持有写锁，缓存写入需要等待
+        other = sqlite3.connect(self.path, isolation_level=None)
+        other.execute("BEGIN IMMEDIATE")
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        task = asyncio.create_task(ticker())
+        pending = asyncio.create_task(cache.aset("b", 2))
+        await asyncio.sleep(0.2)
+        self.assertFalse(pending.done())
+        self.assertGreaterEqual(ticks, 5)
+        other.execute("COMMIT")
+        await pending
+        task.cancel()
+        other.close()
+        self.assertEqual(await cache.aget("a"), {"plan": "北京"})
+        self.assertEqual(await cache.aget("b"), 2)
+        cache.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,115 @@
+import unittest
+import zlib
+from unittest.mock import patch
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker, undefer
+from app.core import compression
+from app.database.database import Base
+from app.models.models import TravelPlan
+from app.services import user_service
+
+DETAILS = "## 第1天\n- 上午：参观故宫博物院\n- 下午：游览景山公园，晚餐品尝北京烤鸭\n" * 40
+
+
+class TestCompression(unittest.TestCase):
+    def test_round_trip(self):
+        stored = compression.compress_text(DETAILS)
+        self.assertEqual(compression.stored_codec(stored), "zlib")
+        self.assertLess(len(stored), len(DETAILS.encode("utf-8")) // 3)
+        self.assertEqual(compression.decompress_text(stored), DETAILS)
+        self.assertEqual(compression.decompress_text(memoryview(stored)), DETAILS)
+
+    def test_short_and_legacy_values(self):
+        self.assertEqual(compression.stored_codec(compression.compress_text("北京")), "raw")
+        self.assertEqual(compression.decompress_text(compression.compress_text("")), "")
+        self.assertIsNone(compression.compress_text(None))
+        # 压缩之前写入的值：SQLite 中的文本，以及 PostgreSQL 转换列类型后的UTF-8字节
+        self.assertEqual(compression.decompress_text("旧数据"), "旧数据")
+        self.assertEqual(compression.decompress_text("旧数据".encode("utf-8")), "旧数据")
+
+    def test_needs_recompress(self):
+        self.assertTrue(compression.needs_recompress(DETAILS))
+        self.assertFalse(compression.needs_recompress(compression.compress_text(DETAILS)))
+        self.assertFalse(compression.needs_recompress(compression.compress_text("北京")))
+        with patch.object(compression.settings, "COMPRESSION_CODEC", "none"):
+            self.assertEqual(compression.decompress_text(compression.compress_text(DETAILS)), DETAILS)
+            self.assertTrue(compression.needs_recompress(b"\x01" + zlib.compress(DETAILS.encode("utf-8"))))
+
+
+class TestCompressedColumn(unittest.TestCase):
+    def setUp(self):
+        engine = create_engine("sqlite://")
+        Base.metadata.create_all(bind=engine)
+        self.db = sessionmaker(bind=engine)()
+
+    def tearDown(self):
+        self.db.close()
+
+    def test_details_stored_compressed(self):
+        self.db.add(TravelPlan(user_id=1, title="北京", destination="北京", budget=100.0, details=DETAILS))
+        # 旧版本写入的未压缩文本在旧列中
+        self.db.execute(text("INSERT INTO travel_plans (id, user_id, title, details) VALUES (100, 1, '旧', '旧的详情')"))
+        self.db.commit()
+        rows = {
+            row[0]: row[1:] for row in
+            self.db.execute(text("SELECT id, typeof(details_compressed), typeof(details) FROM travel_plans"))
+        }
+        self.assertEqual(rows.pop(100), ("null", "text"))
+        self.assertEqual(list(rows.values()), [("blob", "null")])
+
+        self.db.expire_all()
+        plans = {plan.id: plan.details for plan in self.db.query(TravelPlan).options(undefer(TravelPlan.details))}
+        self.assertEqual(plans[100], "旧的详情")
+        self.assertIn(DETAILS, plans.values())
+
+    def test_new_column_preferred_over_legacy(self):
+        self.db.execute(text("INSERT INTO travel_plans (id, user_id, title, details) VALUES (100, 1, '旧', '旧的详情')"))
+        self.db.commit()
+        plan = self.db.get(TravelPlan, 100)
+        self.assertEqual(plan.details, "旧的详情")
+        # 写入新列时清空旧列，清空详情后不会回退读到旧值
+        plan.details = None
+        self.db.commit()
+        self.db.expire_all()
+        self.assertIsNone(self.db.get(TravelPlan, 100).details)
+
+        self.assertIsNone(self.db.execute(text("SELECT details FROM travel_plans")).scalar())
+
+        self.db.execute(
+            text("UPDATE travel_plans SET details = '旧的详情', details_compressed = :value"),
+            {"value": compression.compress_text("新的详情")}
+        )
+        self.db.commit()
+        self.db.expire_all()
+        self.assertEqual(self.db.get(TravelPlan, 100).details, "新的详情")
+
+    def test_details_deferred_until_requested(self):
+        plan = TravelPlan(user_id=1, title="北京", destination="北京", budget=100.0, details=DETAILS)
+        self.db.add(plan)
+        self.db.commit()
+        plan_id = plan.id
+        self.db.expire_all()
+
+        # 不读取的列不会经过解压
+        loaded = user_service.get_travel_plan(self.db, plan_id)
+        self.assertEqual(loaded.title, "北京")
+        self.assertNotIn("details", loaded.__dict__)
+        # 首次访问时才读取并解压
+        self.assertEqual(loaded.details, DETAILS)
+
+        self.db.expire_all()
+        loaded = user_service.get_travel_plan_with_details(self.db, plan_id)
+        self.db.expunge(loaded)
+        self.assertEqual(loaded.details, DETAILS)
+
+    def test_writes_return_details(self):
+        plan = TravelPlan(user_id=1, title="北京", destination="北京", budget=100.0, details=DETAILS)
+        self.db.add(plan)
+        self.db.commit()
+        user_service.refresh_travel_plan(self.db, plan)
+        self.db.expunge(plan)
+        self.assertEqual((plan.title, plan.details), ("北京", DETAILS))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,125 @@
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from datetime import datetime
+from unittest.mock import patch
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+from app.database import database
+from app.database.database import Base, run_in_session
+from app.models.models import TravelPlan
+from app.services import llm_service
+from app.services.travel_service import TravelService
+
+
+class TestRunInSession(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.engine = create_engine(f"sqlite:///{os.path.join(self.directory, 'test.db')}")
+        Base.metadata.create_all(bind=self.engine)
+        patcher = patch.object(database, "SessionLocal", sessionmaker(bind=self.engine))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.engine.dispose()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    async def test_runs_in_worker_thread_and_releases_connection(self):
+        def count_plans(db, user_id):
+            count = db.query(TravelPlan).filter(TravelPlan.user_id == user_id).count()
+            self.assertEqual(self.engine.pool.checkedout(), 1)
+            return threading.get_ident(), count
+
+        thread_id, count = await run_in_session(count_plans, user_id=1)
+        self.assertNotEqual(thread_id, threading.get_ident())
+        self.assertEqual(count, 0)
+        self.assertEqual(self.engine.pool.checkedout(), 0)
+
+    async def test_releases_connection_on_error(self):
+        def fail(db):
+            db.query(TravelPlan).count()
+            raise ValueError("boom")
+
+        with self.assertRaises(ValueError):
+            await run_in_session(fail)
+        self.assertEqual(self.engine.pool.checkedout(), 0)
+
+    async def test_no_session_held_while_waiting_for_llm(self):
+        checked_out = []
+
+        async def generate(*args, **kwargs):
+            checked_out.append(self.engine.pool.checkedout())
+            return {"success": True, "plan": "### 第1天\n鼓浪屿"}
+
+        with patch.object(llm_service.llm_service, "generate_travel_plan", generate):
+            result = await TravelService().generate_and_save_travel_plan(
+                user_id=1, destination="厦门", start_date=datetime(2025, 12, 1), end_date=datetime(2025, 12, 2),
+                budget=2000.0, preferences="海边"
+            )
+
+        self.assertTrue(result["success"])
+        self.assertEqual(checked_out, [0])
+        self.assertEqual(self.engine.pool.checkedout(), 0)
+        # 会话已经关闭，返回的计划仍可读取
+        self.assertEqual(result["plan"].destination, "厦门")
+        self.assertIn("鼓浪屿", result["plan"].details)
+
+
+class TestSqlitePragmas(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        # 与应用引擎相同的连接监听，只是换成临时文件，避免改动仓库中的数据库
+        self.engine = create_engine(f"sqlite:///{os.path.join(self.directory, 'test.db')}")
+        event.listen(self.engine, "connect", database._apply_sqlite_pragmas)
+        # 不受本地 .env 中的取值影响
+        for name, value in (
+            ("SQLITE_JOURNAL_MODE", "WAL"), ("SQLITE_SYNCHRONOUS", "NORMAL"), ("SQLITE_TEMP_STORE", "MEMORY")
+        ):
+            patcher = patch.object(database.settings, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.engine.dispose()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def _pragma(self, connection, name):
+        return connection.exec_driver_sql(f"PRAGMA {name}").scalar()
+
+    def test_new_connection_has_pragmas(self):
+        with self.engine.connect() as connection:
+            self.assertEqual(self._pragma(connection, "journal_mode"), "wal")
+            self.assertEqual(self._pragma(connection, "foreign_keys"), 1)
+            self.assertEqual(self._pragma(connection, "busy_timeout"), database.settings.SQLITE_BUSY_TIMEOUT_MS)
+            # NORMAL = 1
+            self.assertEqual(self._pragma(connection, "synchronous"), 1)
+            self.assertEqual(self._pragma(connection, "cache_size"), database.settings.SQLITE_CACHE_SIZE)
+            # MEMORY = 2
+            self.assertEqual(self._pragma(connection, "temp_store"), 2)
+
+    def test_configured_values_are_applied(self):
+        with patch.object(database.settings, "SQLITE_SYNCHRONOUS", "full"), \
+                patch.object(database.settings, "SQLITE_BUSY_TIMEOUT_MS", 1234):
+            with self.engine.connect() as connection:
+                self.assertEqual(self._pragma(connection, "synchronous"), 2)
+                self.assertEqual(self._pragma(connection, "busy_timeout"), 1234)
+
+    def test_invalid_setting_rejected(self):
+        with patch.object(database.settings, "SQLITE_JOURNAL_MODE", "fast"):
+            with self.assertRaises(ValueError):
+                database._sqlite_pragmas()
+
+    def test_startup_check_reports_effective_values(self):
+        with patch.object(database, "engine", self.engine), \
+                patch.object(database.settings, "DATABASE_URL", "sqlite:///test.db"):
+            pragmas = database.check_sqlite_pragmas()
+        self.assertEqual(pragmas["journal_mode"], "wal")
+        self.assertEqual(pragmas["foreign_keys"], 1)
+        self.assertEqual(pragmas["busy_timeout"], database.settings.SQLITE_BUSY_TIMEOUT_MS)
+
+
+if __name__ == '__main__':
+    unittest.main()
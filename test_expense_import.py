@@ -0,0 +1,91 @@
+import asyncio
+import unittest
+from datetime import datetime
+from unittest.mock import patch
+from app.services import expense_import_service
+from app.services.expense_import_service import ExpenseImporter, iter_csv_records, iter_json_array
+
+
+async def _chunks(data: bytes, size: int):
+    for start in range(0, len(data), size):
+        yield data[start:start + size]
+
+
+def _records(data: bytes, size: int):
+    async def collect():
+        return [record async for record in iter_csv_records(_chunks(data, size))]
+    return asyncio.run(collect())
+
+
+class TestCsvRecords(unittest.TestCase):
+    CSV = '\ufeff类别,金额,描述\n餐饮,"1,200.50","多行\n描述"\r\n住宿,300,"含""引号"""\n交通,20,最后一行'.encode("utf-8")
+
+    def test_records_are_independent_of_chunk_size(self):
+        expected = [
+            (1, ["类别", "金额", "描述"]),
+            (2, ["餐饮", "1,200.50", "多行\n描述"]),
+            (4, ["住宿", "300", '含"引号"']),
+            (5, ["交通", "20", "最后一行"]),
+        ]
+        for size in (1, 2, 3, 7, len(self.CSV)):
+            self.assertEqual(_records(self.CSV, size), expected)
+
+    def test_non_utf8_is_rejected(self):
+        with self.assertRaises(ValueError):
+            _records("类别,金额\n".encode("gbk"), 4)
+
+
+def _items(data: bytes, size: int):
+    async def collect():
+        return [item async for item in iter_json_array(_chunks(data, size))]
+    return asyncio.run(collect())
+
+
+class TestJsonArray(unittest.TestCase):
+    JSON = '\ufeff [{"category": "餐饮", "amount": 12.5, "description": "含\\"引号\\"和]"},\n 120 , "交通", null]'.encode("utf-8")
+
+    def test_items_are_independent_of_chunk_size(self):
+        expected = [
+            (1, {"category": "餐饮", "amount": 12.5, "description": '含"引号"和]'}),
+            (2, 120),
+            (3, "交通"),
+            (4, None),
+        ]
+        for size in (1, 2, 3, 7, len(self.JSON)):
+            self.assertEqual(_items(self.JSON, size), expected)
+        self.assertEqual(_items(b"[ ]", 1), [])
+
+    def test_invalid_bodies_are_rejected(self):
+        for body in (b"", b"{}", b"[1,]", b"[,1]", b"[1 2]", b"[1", b"[1] 2", b'[{"a": }]', "[1]".encode("utf-16")):
+            with self.assertRaises(ValueError, msg=body):
+                _items(body, 2)
+
+    def test_oversized_item_is_rejected_without_buffering(self):
+        body = b'[{"description": "' + b"x" * 100
+        with patch.object(expense_import_service, "MAX_JSON_ITEM_CHARS", 50), \
+                self.assertRaisesRegex(ValueError, "第1个"):
+            _items(body, 10)
+
+
+class TestExpenseImporter(unittest.TestCase):
+    def test_rows_are_validated_and_normalized(self):
+        importer = ExpenseImporter(user_id=1, plan_id=7, chunk_size=2, max_rows=3)
+        self.assertTrue(importer.add(1, {"category": "", "amount": "12.5", "expense_date": "2025/12/3"}))
+        self.assertTrue(importer.add(2, {"category": "餐饮", "amount": "abc"}))
+        self.assertTrue(importer.add(3, ["not", "a", "dict"]))
+        self.assertFalse(importer.add(4, {"category": "餐饮", "amount": 1}))
+
+        self.assertTrue(importer.truncated)
+        self.assertEqual(importer.failed, 2)
+        self.assertEqual([error["row"] for error in importer.errors], [2, 3])
+        self.assertFalse(importer.chunk_ready)
+        (row, values), = importer._pending
+        self.assertEqual(row, 1)
+        self.assertEqual(values["plan_id"], 7)
+        self.assertEqual(values["user_id"], 1)
+        self.assertEqual(values["category"], "其他")
+        self.assertEqual(values["expense_date"], datetime(2025, 12, 3))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,32 @@
+import io
+import os
+import shutil
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+import explain_queries
+from app.core.config import settings
+from app.database import database
+
+
+class TestExplainQueries(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+
+    def test_workload_has_no_full_scans(self):
+        engine, url = database.engine, settings.DATABASE_URL
+        output = io.StringIO()
+        with redirect_stdout(output):
+            code = explain_queries.main(["--url", f"sqlite:///{os.path.join(self.directory, 'explain.db')}"])
+
+        self.assertNotIn("FULL SCAN", output.getvalue())
+        self.assertIn("0 条存在全表扫描", output.getvalue())
+        self.assertEqual(code, 0)
+        # 检查结束后恢复应用原来的数据库配置
+        self.assertIs(database.engine, engine)
+        self.assertEqual(settings.DATABASE_URL, url)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,97 @@
+import unittest
+from unittest.mock import AsyncMock, patch
+from app.models.models import TravelPlan
+from app.services import llm_service
+from app.services.itinerary_parser import (
+    StructuredOutputFilter,
+    parse_itinerary,
+    parse_markdown_itinerary,
+    replace_day_section,
+)
+from app.services.travel_service import TravelService
+
+MARKDOWN_PLAN = """
+# 北京旅行计划
+
+### 第一天: 抵达与适应
+- 上午: 抵达北京，入住酒店
+- 下午: 故宫博物院，门票60元，地点：东城区
+  - 建议提前预约
+
+**第2天 2024年5月2日 长城**
+1. 全天：八达岭长城 ¥45
+
+## 住宿推荐
+- 市中心商务酒店 500元
+"""
+
+JSON_BLOCK = """
+```json
+{"days": [{"day_number": 1, "date": "2024-05-01", "title": "到达",
+           "activities": [{"time": "09:00", "title": "故宫", "estimated_cost": "约60元"}]}]}
+```
+"""
+
+
+class TestItineraryParser(unittest.TestCase):
+    def test_markdown_fallback(self):
+        itinerary = parse_markdown_itinerary(MARKDOWN_PLAN)
+        self.assertEqual([day.day_number for day in itinerary.days], [1, 2])
+        first = itinerary.days[0]
+        self.assertEqual(first.title, "抵达与适应")
+        self.assertEqual(len(first.activities), 2)
+        museum = first.activities[1]
+        self.assertEqual(museum.time, "下午")
+        self.assertEqual(museum.location, "东城区")
+        self.assertEqual(museum.estimated_cost, 60.0)
+        self.assertIn("建议提前预约", museum.description)
+        second = itinerary.days[1]
+        self.assertEqual(str(second.date), "2024-05-02")
+        self.assertEqual(second.title, "长城")
+        self.assertEqual(second.activities[0].estimated_cost, 45.0)
+
+    def test_json_block_preferred(self):
+        body, itinerary, source = parse_itinerary(MARKDOWN_PLAN + JSON_BLOCK)
+        self.assertEqual(source, "json")
+        self.assertNotIn("```json", body)
+        self.assertEqual(itinerary.days[0].activities[0].estimated_cost, 60.0)
+
+    def test_invalid_json_falls_back_to_markdown(self):
+        body, itinerary, source = parse_itinerary(MARKDOWN_PLAN + "```json\n{\"days\": [{\"title\": 1}]}\n```")
+        self.assertEqual(source, "markdown")
+        self.assertEqual(len(itinerary.days), 2)
+
+    def test_stream_filter_hides_json_block(self):
+        text = MARKDOWN_PLAN + JSON_BLOCK
+        visible = StructuredOutputFilter()
+        output = "".join(visible.feed(text[i:i + 3]) for i in range(0, len(text), 3)) + visible.flush()
+        self.assertEqual(output.rstrip(), MARKDOWN_PLAN.rstrip())
+
+    def test_replace_day_section(self):
+        updated = replace_day_section(MARKDOWN_PLAN, 1, "### 第1天: 新安排\n- 上午: 天坛")
+        self.assertIn("天坛", updated)
+        self.assertNotIn("故宫", updated)
+        self.assertIn("八达岭长城", updated)
+        self.assertIn("## 住宿推荐", updated)
+        self.assertIsNone(replace_day_section(MARKDOWN_PLAN, 5, "x"))
+
+
+class TestRegenerateDay(unittest.IsolatedAsyncioTestCase):
+    async def test_plan_without_dates(self):
+        db_plan = TravelPlan(id=1, destination="北京", budget=3000.0, details=MARKDOWN_PLAN)
+        regenerate = AsyncMock(return_value={"success": True, "day": "### 第1天: 新安排\n- 上午: 天坛"})
+        splice = AsyncMock(return_value=db_plan)
+
+        with patch.object(llm_service.llm_service, "regenerate_day", regenerate), \
+                patch.object(TravelService, "_splice_day", splice):
+            result = await TravelService().regenerate_day(1, db_plan, [], 1)
+
+        self.assertTrue(result["success"])
+        self.assertIsNone(result["day"].date)
+        plan_summary, day_number, day_date = regenerate.call_args.args[:3]
+        self.assertIn("日期：未定 至 未定", plan_summary)
+        self.assertEqual((day_number, day_date), (1, None))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,264 @@
+import asyncio
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from datetime import datetime, timedelta
+from unittest.mock import patch
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from app.database import database
+from app.database.database import Base
+from app.main import app
+from app.models.models import GenerationJob, TravelPlan
+from app.schemas.schemas import User
+from app.services import auth_utils, job_service, travel_service
+from app.services.job_service import GenerationJobQueue, JobLimitExceeded
+
+JOB = {
+    "destination": "杭州",
+    "start_date": datetime(2025, 12, 1),
+    "end_date": datetime(2025, 12, 2),
+    "budget": 2000.0,
+    "preferences": "",
+    "travelers": 1
+}
+
+
+def memory_sessionmaker():
+    # 所有会话共用同一个内存数据库连接
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    return sessionmaker(bind=engine)
+
+
+class TestJobService(unittest.TestCase):
+    def setUp(self):
+        self.db = memory_sessionmaker()()
+
+    def tearDown(self):
+        self.db.close()
+
+    def test_per_user_limit(self):
+        jobs = [job_service.create_job(self.db, user_id=1, max_active=2, **JOB) for _ in range(2)]
+        with self.assertRaises(JobLimitExceeded):
+            job_service.create_job(self.db, user_id=1, max_active=2, **JOB)
+        # 超出上限的任务没有写入
+        self.assertEqual(self.db.query(GenerationJob).count(), 2)
+        job_service.create_job(self.db, user_id=2, max_active=2, **JOB)
+
+        job_service.claim_job(self.db, jobs[0].id, "w1")
+        job_service.finish_job(self.db, jobs[0].id, "w1", plan_id=1)
+        job_service.create_job(self.db, user_id=1, max_active=2, **JOB)
+
+    def test_claim_is_atomic(self):
+        job = job_service.create_job(self.db, user_id=1, max_active=3, **JOB)
+        claimed = job_service.claim_job(self.db, job.id, "w1")
+        self.assertEqual((claimed.status, claimed.worker_id), ("running", "w1"))
+        self.assertIsNotNone(claimed.heartbeat_at)
+        self.assertIsNone(job_service.claim_job(self.db, job.id, "w2"))
+        self.assertIsNone(job_service.claim_job(self.db, "missing", "w2"))
+
+    def test_only_lease_holder_can_finish(self):
+        job = job_service.create_job(self.db, user_id=1, max_active=3, **JOB)
+        job_service.claim_job(self.db, job.id, "w1")
+        self.assertFalse(job_service.heartbeat_job(self.db, job.id, "w2"))
+        self.assertFalse(job_service.finish_job(self.db, job.id, "w2", plan_id=9))
+        self.assertTrue(job_service.heartbeat_job(self.db, job.id, "w1"))
+        self.assertTrue(job_service.finish_job(self.db, job.id, "w1", error="超时"))
+        job = job_service.get_job(self.db, job.id)
+        self.assertEqual((job.status, job.error), ("failed", "超时"))
+
+    def test_recovery_requeues_only_expired_leases(self):
+        jobs = [job_service.create_job(self.db, user_id=user_id, max_active=3, **JOB) for user_id in (1, 2, 3, 4)]
+        for job in jobs[:3]:
+            job_service.claim_job(self.db, job.id, "other-process")
+        # 0: 仍在续期；1: 执行者已停止续期；2: 迁移之前领取的任务没有续期时间
+        self.db.query(GenerationJob).filter(GenerationJob.id == jobs[1].id).update(
+            {"heartbeat_at": datetime.utcnow() - timedelta(seconds=120)}
+        )
+        self.db.query(GenerationJob).filter(GenerationJob.id == jobs[2].id).update({"heartbeat_at": None})
+        self.db.commit()
+
+        pending = job_service.recover_jobs(self.db, lease_seconds=60)
+
+        self.assertEqual(set(pending), {jobs[1].id, jobs[2].id, jobs[3].id})
+        self.db.expire_all()
+        self.assertEqual(job_service.get_job(self.db, jobs[0].id).status, "running")
+        requeued = job_service.get_job(self.db, jobs[1].id)
+        self.assertEqual((requeued.status, requeued.worker_id), ("queued", None))
+        self.assertEqual(job_service.requeue_expired_jobs(self.db, lease_seconds=60), [])
+
+
+class TestConcurrentSubmit(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.engine = create_engine(
+            f"sqlite:///{os.path.join(self.directory, 'test.db')}", connect_args={"timeout": 10}
+        )
+        Base.metadata.create_all(bind=self.engine)
+
+    def tearDown(self):
+        self.engine.dispose()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def test_limit_holds_under_concurrent_submits(self):
+        Session = sessionmaker(bind=self.engine)
+        barrier = threading.Barrier(8)
+        outcomes = []
+
+        def submit():
+            with Session() as db:
+                barrier.wait()
+                try:
+                    job_service.create_job(db, user_id=1, max_active=3, **JOB)
+                    outcomes.append("created")
+                except JobLimitExceeded:
+                    outcomes.append("rejected")
+
+        threads = [threading.Thread(target=submit) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(outcomes.count("created"), 3)
+        with Session() as db:
+            self.assertEqual(db.query(GenerationJob).count(), 3)
+
+
+class TestGenerationJobQueue(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.Session = memory_sessionmaker()
+        patcher = patch.object(database, "SessionLocal", self.Session)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.queue = GenerationJobQueue(workers=1, lease_seconds=60)
+
+    async def asyncTearDown(self):
+        await self.queue.stop()
+
+    async def _wait_finished(self, job_id):
+        for _ in range(200):
+            with self.Session() as db:
+                job = job_service.get_job(db, job_id)
+                if job.status in ("done", "failed"):
+                    return job
+            await asyncio.sleep(0.01)
+        self.fail("任务没有完成")
+
+    async def test_worker_records_success_and_failure(self):
+        async def generate(user_id, destination, **kwargs):
+            if destination == "失败":
+                return {"success": False, "error": "AI服务不可用"}
+            return {"success": True, "plan": TravelPlan(id=42)}
+
+        with patch.object(travel_service.travel_service, "generate_and_save_travel_plan", generate):
+            await self.queue.start()
+            done = await self.queue.submit(user_id=1, **JOB)
+            failed = await self.queue.submit(user_id=1, **dict(JOB, destination="失败"))
+            done = await self._wait_finished(done.id)
+            failed = await self._wait_finished(failed.id)
+
+        self.assertEqual((done.status, done.plan_id, done.error), ("done", 42, None))
+        self.assertEqual((failed.status, failed.error), ("failed", "AI服务不可用"))
+        self.assertEqual(done.worker_id, self.queue.worker_id)
+
+    async def test_exception_marks_job_failed(self):
+        async def generate(**kwargs):
+            raise RuntimeError("连接被重置")
+
+        with patch.object(travel_service.travel_service, "generate_and_save_travel_plan", generate):
+            await self.queue.start()
+            job = await self._wait_finished((await self.queue.submit(user_id=1, **JOB)).id)
+        self.assertEqual(job.status, "failed")
+        self.assertIn("连接被重置", job.error)
+
+    async def test_submit_before_start_runs_once(self):
+        calls = []
+
+        async def generate(**kwargs):
+            calls.append(kwargs["destination"])
+            return {"success": True, "plan": TravelPlan(id=1)}
+
+        with patch.object(travel_service.travel_service, "generate_and_save_travel_plan", generate):
+            job = await self.queue.submit(user_id=1, **JOB)
+            await self.queue.start()
+            job = await self._wait_finished(job.id)
+            await asyncio.sleep(0.05)
+
+        self.assertEqual(job.status, "done")
+        self.assertEqual(calls, ["杭州"])
+
+    async def test_start_resumes_expired_jobs_only(self):
+        with self.Session() as db:
+            live = job_service.create_job(db, user_id=1, max_active=3, **JOB)
+            stale = job_service.create_job(db, user_id=1, max_active=3, **JOB)
+            job_service.claim_job(db, live.id, "other-process")
+            job_service.claim_job(db, stale.id, "crashed-process")
+            live_id, stale_id = live.id, stale.id
+            db.query(GenerationJob).filter(GenerationJob.id == stale_id).update(
+                {"heartbeat_at": datetime.utcnow() - timedelta(minutes=5)}
+            )
+            db.commit()
+        calls = []
+
+        async def generate(**kwargs):
+            calls.append(kwargs["destination"])
+            return {"success": True, "plan": TravelPlan(id=1)}
+
+        with patch.object(travel_service.travel_service, "generate_and_save_travel_plan", generate):
+            await self.queue.start()
+            await self._wait_finished(stale_id)
+
+        self.assertEqual(calls, ["杭州"])
+        with self.Session() as db:
+            self.assertEqual(job_service.get_job(db, live_id).worker_id, "other-process")
+
+
+class TestJobRoutes(unittest.TestCase):
+    def setUp(self):
+        self.Session = memory_sessionmaker()
+        self.user_id = 1
+        app.dependency_overrides[auth_utils.get_current_user] = lambda: User(
+            id=self.user_id, username="u", email="u@example.com", created_at=datetime(2025, 1, 1)
+        )
+        # 不启动工作协程，提交的任务保持排队
+        queue = GenerationJobQueue(workers=0, lease_seconds=60)
+        for patcher in (
+            patch.object(database, "SessionLocal", self.Session),
+            patch.object(job_service, "generation_job_queue", queue),
+            patch.object(job_service.settings, "GENERATION_JOB_MAX_PER_USER", 2),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.client = TestClient(app)
+
+    def tearDown(self):
+        app.dependency_overrides.clear()
+
+    def _submit(self):
+        return self.client.post("/api/plans/jobs", json={
+            "destination": "杭州", "start_date": "2025-12-01", "end_date": "2025-12-02",
+            "budget": 2000, "preferences": "", "travelers": 1
+        })
+
+    def test_submit_limit_and_ownership(self):
+        first = self._submit()
+        self.assertEqual(first.status_code, 202)
+        self.assertEqual(first.json()["status"], "queued")
+        self.assertEqual(self._submit().status_code, 202)
+        self.assertEqual(self._submit().status_code, 429)
+
+        job_id = first.json()["id"]
+        self.assertEqual(self.client.get(f"/api/plans/jobs/{job_id}").json()["id"], job_id)
+        self.assertEqual(self.client.get("/api/plans/jobs/missing").status_code, 404)
+        self.user_id = 2
+        self.assertEqual(self.client.get(f"/api/plans/jobs/{job_id}").status_code, 403)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,101 @@
+import unittest
+from unittest.mock import patch
+from app.services import llm_providers
+from app.services.llm_providers import (
+    DashScopeProvider, LLMProvider, OpenAIProvider, create_provider, detect_provider_name
+)
+
+MESSAGES = [{"role": "system", "content": "规划师"}, {"role": "user", "content": "去北京"}]
+
+
+class TestProviderRegistry(unittest.IsolatedAsyncioTestCase):
+    def _create(self, *args, **kwargs):
+        provider = create_provider(*args, **kwargs)
+        self.addAsyncCleanup(provider.close)
+        return provider
+
+    def test_detect_provider_name(self):
+        cases = {
+            "https://dashscope.aliyuncs.com/api/v1/services/aigc/text-generation/generation": "dashscope",
+            "https://bailian.cn-beijing.aliyuncs.com/v1": "dashscope",
+            "https://api.openai.com/v1/chat/completions": "openai",
+            "http://localhost:8000/v1/chat/completions": "openai",
+            "": "openai",
+        }
+        for endpoint, expected in cases.items():
+            self.assertEqual(detect_provider_name(endpoint), expected, endpoint)
+
+    async def test_create_provider(self):
+        provider = self._create("key", "https://dashscope.aliyuncs.com/api")
+        self.assertIsInstance(provider, DashScopeProvider)
+        self.assertEqual(provider.model, "qwen-turbo")
+        # 显式指定的名称和模型优先于端点推断
+        provider = self._create("key", "https://dashscope.aliyuncs.com/api", name="OpenAI", model="gpt-4o")
+        self.assertIsInstance(provider, OpenAIProvider)
+        self.assertEqual(provider.model, "gpt-4o")
+        with self.assertRaises(ValueError):
+            create_provider("key", "https://example.com", name="unknown")
+
+    def test_incomplete_provider_cannot_be_instantiated(self):
+        class Incomplete(LLMProvider):
+            name = "incomplete"
+
+            def build_payload(self, messages, temperature, max_tokens, stream=False):
+                return {}
+
+        with self.assertRaises(TypeError):
+            Incomplete("key", "https://example.com")
+
+    async def test_client_uses_pool_settings_and_falls_back_without_h2(self):
+        with patch.object(llm_providers.settings, "LLM_HTTP2", True), \
+                patch.object(llm_providers.importlib.util, "find_spec", return_value=None), \
+                self.assertLogs(llm_providers.logger, "WARNING"):
+            provider = self._create("key", "https://api.openai.com/v1/chat/completions")
+        self.assertEqual(provider.client.timeout.connect, llm_providers.settings.LLM_CONNECT_TIMEOUT)
+        self.assertEqual(provider.client.timeout.read, llm_providers.settings.LLM_READ_TIMEOUT)
+
+
+class TestProviderFormats(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.openai = OpenAIProvider("key", "https://api.openai.com/v1/chat/completions")
+        self.dashscope = DashScopeProvider("key", "https://dashscope.aliyuncs.com/api")
+
+    async def asyncTearDown(self):
+        await self.openai.close()
+        await self.dashscope.close()
+
+    def test_openai(self):
+        payload = self.openai.build_payload(MESSAGES, 0.7, 100, stream=True)
+        self.assertEqual(payload["messages"], MESSAGES)
+        self.assertTrue(payload["stream"])
+        self.assertNotIn("stream", self.openai.build_payload(MESSAGES, 0.7, 100))
+        self.assertEqual(self.openai.parse_response({"choices": [{"message": {"content": "行程"}}]}), "行程")
+        self.assertEqual(self.openai.parse_stream_chunk({"choices": [{"delta": {"content": "第"}}]}), "第")
+        self.assertEqual(self.openai.parse_stream_chunk({"choices": [{"delta": {}, "finish_reason": "stop"}]}), "")
+        self.assertEqual(self.openai.parse_stream_chunk({"choices": [], "usage": {"total_tokens": 30}}), "")
+        self.assertNotIn("X-DashScope-SSE", self.openai.headers(stream=True))
+
+    def test_dashscope(self):
+        payload = self.dashscope.build_payload(MESSAGES, 0.7, 100, stream=True)
+        self.assertEqual(payload["input"], {"messages": MESSAGES})
+        self.assertTrue(payload["parameters"]["incremental_output"])
+        self.assertEqual(self.dashscope.headers(stream=True)["X-DashScope-SSE"], "enable")
+        self.assertEqual(self.dashscope.parse_response({"output": {"text": "行程"}}), "行程")
+        self.assertEqual(self.dashscope.parse_stream_chunk({"output": {"text": None}}), "")
+
+    def test_parse_usage(self):
+        cases = [
+            ({"usage": {"prompt_tokens": 10, "completion_tokens": 20, "total_tokens": 30}}, 30),
+            ({"usage": {"input_tokens": 12, "output_tokens": 8}}, 20),
+            ({"usage": {"output_tokens": 8}}, 8),
+            ({"usage": None}, None),
+            ({"usage": {}}, None),
+            ({}, None),
+        ]
+        for result, expected in cases:
+            self.assertEqual(self.openai.parse_usage(result), expected, result)
+            self.assertEqual(self.dashscope.parse_usage(result), expected, result)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,112 @@
+import asyncio
+import unittest
+import httpx
+from app.services.llm_router import LLMRouter
+from app.services.resilience import CircuitOpenError, is_provider_failure
+
+
+def status_error(status_code):
+    request = httpx.Request("POST", "https://llm.example.com/v1/chat/completions")
+    return httpx.HTTPStatusError(
+        str(status_code), request=request, response=httpx.Response(status_code, request=request)
+    )
+
+
+class FakeProvider:
+    def __init__(self, name, delay=0.0, error=None):
+        self.name = name
+        self.delay = delay
+        self.error = error
+        self.cancelled = False
+
+
+async def attempt(provider):
+    try:
+        await asyncio.sleep(provider.delay)
+    except asyncio.CancelledError:
+        provider.cancelled = True
+        raise
+    if provider.error:
+        raise provider.error
+    return provider.name
+
+
+class TestLLMRouter(unittest.IsolatedAsyncioTestCase):
+    async def test_failover_to_next_provider(self):
+        router = LLMRouter([FakeProvider("primary", error=status_error(500)), FakeProvider("backup")])
+        self.assertEqual(await router.call(attempt), "backup")
+
+    async def test_unhealthy_provider_is_tried_last(self):
+        primary = FakeProvider("primary", error=status_error(500))
+        backup = FakeProvider("backup")
+        router = LLMRouter([primary, backup], failure_threshold=1, cooldown=60)
+        await router.call(attempt)
+        self.assertEqual(router.ordered_providers(), [backup, primary])
+
+    async def test_all_providers_fail(self):
+        router = LLMRouter([FakeProvider("a", error=RuntimeError("a")), FakeProvider("b", error=RuntimeError("b"))])
+        with self.assertRaisesRegex(RuntimeError, "b"):
+            await router.call(attempt)
+
+    async def test_hedged_request_cancels_slow_provider(self):
+        slow = FakeProvider("slow", delay=1.0)
+        fast = FakeProvider("fast", delay=0.01)
+        router = LLMRouter([slow, fast], hedge_enabled=True, hedge_default_delay=0.02, hedge_min_delay=0.01)
+        self.assertEqual(await router.call(attempt), "fast")
+        await asyncio.sleep(0)
+        self.assertTrue(slow.cancelled)
+
+    async def test_open_circuit_fails_fast(self):
+        primary = FakeProvider("primary", error=httpx.ConnectError("connection refused"))
+        router = LLMRouter([primary], failure_threshold=1, cooldown=60)
+        with self.assertRaises(httpx.ConnectError):
+            await router.call(attempt)
+        primary.delay = 60
+        with self.assertRaises(CircuitOpenError):
+            await asyncio.wait_for(router.call(attempt), timeout=1)
+
+    async def test_rate_limit_and_client_errors_do_not_open_circuit(self):
+        for error in (status_error(429), status_error(400)):
+            primary = FakeProvider("primary", error=error)
+            router = LLMRouter([primary], failure_threshold=2, cooldown=60)
+            for _ in range(5):
+                with self.assertRaises(httpx.HTTPStatusError):
+                    await router.call(attempt)
+            health = router.health[id(primary)]
+            self.assertTrue(health.is_healthy())
+            self.assertEqual(health.limiter.in_flight, 0)
+
+    async def test_rate_limit_shrinks_concurrency(self):
+        primary = FakeProvider("primary", error=status_error(429))
+        router = LLMRouter([primary])
+        limiter = router.health[id(primary)].limiter
+        before = limiter.limit
+        with self.assertRaises(httpx.HTTPStatusError):
+            await router.call(attempt)
+        self.assertLess(limiter.limit, before)
+
+    async def test_timeout_opens_circuit(self):
+        primary = FakeProvider("primary", error=httpx.ReadTimeout("timed out"))
+        router = LLMRouter([primary], failure_threshold=2, cooldown=60)
+        for _ in range(2):
+            with self.assertRaises(httpx.ReadTimeout):
+                await router.call(attempt)
+        self.assertFalse(router.health[id(primary)].is_healthy())
+
+    def test_is_provider_failure(self):
+        cases = {
+            status_error(500): True,
+            status_error(503): True,
+            status_error(429): False,
+            status_error(400): False,
+            httpx.ConnectError("refused"): True,
+            httpx.ReadTimeout("timed out"): True,
+            asyncio.TimeoutError(): True,
+            ValueError("bad json"): False,
+        }
+        for error, expected in cases.items():
+            self.assertEqual(is_provider_failure(error), expected, repr(error))
+
+
+if __name__ == '__main__':
+    unittest.main()
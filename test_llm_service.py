@@ -0,0 +1,74 @@
+import json
+import unittest
+from unittest.mock import patch
+import httpx
+from app.services import llm_service
+
+PRIMARY = "https://primary.llm.test/v1/chat/completions"
+BACKUP = "https://backup.llm.test/v1/chat/completions"
+PLAN_ARGS = ("厦门", "2025-12-01", "2025-12-03", 3000, "海边", 2)
+
+
+class TestFallbackCaching(unittest.IsolatedAsyncioTestCase):
+    """
+    缓存键使用首选模型，只缓存首选提供方的结果
+    """
+
+    async def asyncSetUp(self):
+        for name, value in (
+            ("AI_API_KEY", "key"),
+            ("AI_API_ENDPOINT", PRIMARY),
+            ("LLM_PROVIDER", None),
+            ("LLM_MODEL", "gpt-4o"),
+            ("LLM_FALLBACK_PROVIDERS", [{"api_key": "key", "endpoint": BACKUP, "model": "gpt-4o-mini"}]),
+            ("LLM_CACHE_BACKEND", "memory"),
+            ("LLM_HEDGE_ENABLED", False),
+        ):
+            patcher = patch.object(llm_service.settings, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.service = llm_service.LLMService()
+        self.addAsyncCleanup(self.service.close)
+        self.primary_up = True
+        self.calls = []
+
+        def handler(request):
+            model = json.loads(request.content)["model"]
+            self.calls.append(model)
+            if request.url.host == "primary.llm.test" and not self.primary_up:
+                return httpx.Response(503, json={"error": "overloaded"})
+            if json.loads(request.content).get("stream"):
+                chunk = {"choices": [{"delta": {"content": f"{model}的行程"}}]}
+                return httpx.Response(200, text=f"data: {json.dumps(chunk)}\n\ndata: [DONE]\n\n")
+            return httpx.Response(200, json={"choices": [{"message": {"content": f"{model}的行程"}}]})
+
+        for provider in self.service.providers:
+            await provider.client.aclose()
+            provider.client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+    async def test_fallback_result_not_cached(self):
+        self.primary_up = False
+        result = await self.service.generate_travel_plan(*PLAN_ARGS)
+        self.assertEqual(result["plan"], "gpt-4o-mini的行程")
+
+        self.primary_up = True
+        result = await self.service.generate_travel_plan(*PLAN_ARGS)
+        self.assertEqual(result["plan"], "gpt-4o的行程")
+        # 首选提供方的结果被缓存，再次请求不再访问上游
+        calls = len(self.calls)
+        result = await self.service.generate_travel_plan(*PLAN_ARGS)
+        self.assertEqual(result["raw_response"], {"cached": True})
+        self.assertEqual(len(self.calls), calls)
+
+    async def test_streamed_fallback_result_not_cached(self):
+        self.primary_up = False
+        events = [event async for event in self.service.stream_travel_plan(*PLAN_ARGS)]
+        self.assertEqual("".join(event["delta"] for event in events), "gpt-4o-mini的行程")
+
+        self.primary_up = True
+        events = [event async for event in self.service.stream_travel_plan(*PLAN_ARGS)]
+        self.assertEqual("".join(event["delta"] for event in events), "gpt-4o的行程")
+
+
+if __name__ == '__main__':
+    unittest.main()
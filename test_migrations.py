@@ -0,0 +1,173 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch
+from sqlalchemy import Column, String, create_engine, inspect, text
+from sqlalchemy.orm import Session
+from app.database import migrations
+from app.database.database import Base
+from app.database.migrations import MigrationContext, SchemaVersionError
+from app.models.models import TravelPlan
+from app.services import budget_service
+
+
+class TestMigrations(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.engine = create_engine(f"sqlite:///{os.path.join(self.directory, 'test.db')}")
+
+    def tearDown(self):
+        self.engine.dispose()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def _indexes(self, table):
+        return {item["name"] for item in inspect(self.engine).get_indexes(table)}
+
+    def test_fresh_database(self):
+        with self.assertRaises(SchemaVersionError):
+            migrations.verify_schema(self.engine)
+        self.assertEqual(migrations.migrate(self.engine), [version for version, _, _ in migrations.MIGRATIONS])
+        self.assertEqual(migrations.verify_schema(self.engine), migrations.latest_version())
+        self.assertEqual(migrations.migrate(self.engine), [])
+        self.assertIn("ix_expenses_user_plan_created", self._indexes("expenses"))
+
+    def test_fresh_schema_matches_models(self):
+        migrations.migrate(self.engine)
+        inspector = inspect(self.engine)
+        for table in Base.metadata.sorted_tables:
+            self.assertEqual(
+                {column["name"] for column in inspector.get_columns(table.name)},
+                {column.name for column in table.columns},
+                table.name
+            )
+            self.assertEqual(self._indexes(table.name), {index.name for index in table.indexes}, table.name)
+
+    def test_legacy_database(self):
+        # 引入迁移之前由 create_all 建立的表和单列索引
+        with self.engine.begin() as connection:
+            connection.execute(text(
+                "CREATE TABLE travel_plans (id INTEGER PRIMARY KEY, user_id INTEGER, title VARCHAR, "
+                "destination VARCHAR, start_date DATETIME, end_date DATETIME, budget FLOAT, preferences TEXT, "
+                "details TEXT, created_at DATETIME DEFAULT CURRENT_TIMESTAMP, updated_at DATETIME)"
+            ))
+            connection.execute(text("CREATE INDEX ix_travel_plans_title ON travel_plans (title)"))
+            connection.execute(text("CREATE INDEX ix_travel_plans_user_id ON travel_plans (user_id)"))
+            connection.execute(text(
+                "CREATE TABLE expenses (id INTEGER PRIMARY KEY, user_id INTEGER, plan_id INTEGER, category VARCHAR, "
+                "amount FLOAT, description VARCHAR, expense_date DATETIME, created_at DATETIME DEFAULT CURRENT_TIMESTAMP)"
+            ))
+            connection.execute(text("CREATE INDEX ix_expenses_plan_id ON expenses (plan_id)"))
+            connection.execute(text(
+                "INSERT INTO travel_plans (id, user_id, title, budget, details) "
+                "VALUES (1, 1, 't', 100, '第1天 参观故宫'), (2, 1, 't', 100, NULL)"
+            ))
+            connection.execute(text(
+                "INSERT INTO expenses (user_id, plan_id, category, amount, expense_date) "
+                "VALUES (1, 1, '餐饮', 30, '2025-12-01 12:00:00'), (1, 1, '交通', 20.5, '2025-12-02 09:00:00')"
+            ))
+
+        migrations.migrate(self.engine)
+
+        self.assertEqual(self._indexes("travel_plans"), {"ix_travel_plans_user_created"})
+        self.assertNotIn("ix_expenses_plan_id", self._indexes("expenses"))
+        self.assertIn("ix_expenses_plan_date", self._indexes("expenses"))
+        with self.engine.connect() as connection:
+            rows = connection.execute(text(
+                "SELECT plan_id, total_spent, expense_count FROM plan_budget_rollup ORDER BY plan_id"
+            )).all()
+        self.assertEqual([tuple(row) for row in rows], [(1, 50.5, 2), (2, 0.0, 0)])
+        with Session(self.engine) as db:
+            self.assertEqual(budget_service.check_rollup(db, 1), [])
+        with self.engine.connect() as connection:
+            indexed = connection.execute(text("SELECT rowid FROM plan_search ORDER BY rowid")).scalars().all()
+        self.assertEqual(indexed, [1, 2])
+        # 详情压缩后移到新列，旧列已删除并补为空列
+        with self.engine.connect() as connection:
+            stored = connection.execute(text(
+                "SELECT id, typeof(details_compressed), details FROM travel_plans ORDER BY id"
+            )).all()
+        self.assertEqual([tuple(row) for row in stored], [(1, "blob", None), (2, "null", None)])
+        with Session(self.engine) as db:
+            self.assertEqual(db.get(TravelPlan, 1).details, "第1天 参观故宫")
+
+    def test_contentless_search_rebuild(self):
+        migrations.migrate(self.engine)
+        # 第6步之前的检索表：保存正文，并留有一条已删除计划的旧行
+        with self.engine.begin() as connection:
+            connection.execute(text(
+                "INSERT INTO travel_plans (id, user_id, title, destination, budget) VALUES (1, 1, '北京之旅', '北京', 100)"
+            ))
+            connection.execute(text("DROP TABLE plan_search"))
+            connection.execute(text(
+                "CREATE VIRTUAL TABLE plan_search USING fts5(owner, title, destination, details, chars, tokenize = 'unicode61')"
+            ))
+            connection.execute(text(
+                "INSERT INTO plan_search (rowid, owner, title, destination, details, chars) "
+                "VALUES (1, 'u1', '北京 京之 之旅', '北京', '', ''), (9, 'u1', '北京', '', '', '')"
+            ))
+            connection.execute(text("DELETE FROM schema_version WHERE version = 6"))
+
+        self.assertEqual(migrations.migrate(self.engine), [6])
+
+        with self.engine.connect() as connection:
+            ddl = connection.execute(text("SELECT sql FROM sqlite_master WHERE name = 'plan_search'")).scalar()
+            matched = connection.execute(
+                text("SELECT rowid FROM plan_search WHERE plan_search MATCH 'title:北京'")
+            ).scalars().all()
+        self.assertIn("content = ''", ddl)
+        self.assertEqual(matched, [1])
+
+    def test_search_rebuild_catches_up_changes(self):
+        migrations.migrate(self.engine)
+        with self.engine.begin() as connection:
+            connection.execute(text(
+                "INSERT INTO travel_plans (id, user_id, title, destination, budget) "
+                "VALUES (1, 1, '北京之旅', '北京', 100), (2, 1, '杭州之旅', '杭州', 100), (3, 1, '成都之旅', '成都', 100)"
+            ))
+            connection.execute(text("DELETE FROM schema_version WHERE version = 6"))
+        backfill = MigrationContext.backfill
+
+        def changing_backfill(ctx, step, batch_size=1):
+            # 写入第一个计划之后，其他进程修改、删除和新增计划（通过会话执行，计划表上的触发器照常记录）
+            def changing_step(session, after, limit):
+                if after == 1:
+                    session.execute(text("UPDATE travel_plans SET title = '上海之旅' WHERE id IN (1, 2)"))
+                    session.execute(text("DELETE FROM travel_plans WHERE id = 3"))
+                    session.execute(text(
+                        "INSERT INTO travel_plans (id, user_id, title, destination, budget) "
+                        "VALUES (4, 1, '西安之旅', '西安', 100)"
+                    ))
+                return step(session, after, 1)
+            backfill(ctx, changing_step, 1)
+
+        with patch.object(MigrationContext, "backfill", changing_backfill):
+            self.assertEqual(migrations.migrate(self.engine), [6])
+
+        with self.engine.connect() as connection:
+            def matched(query):
+                return connection.execute(
+                    text("SELECT rowid FROM plan_search WHERE plan_search MATCH :query ORDER BY rowid"),
+                    {"query": query}
+                ).scalars().all()
+            self.assertEqual(matched("title:北京"), [])
+            self.assertEqual(matched("title:杭州"), [])
+            self.assertEqual(matched("title:成都"), [])
+            self.assertEqual(matched("title:上海"), [1, 2])
+            self.assertEqual(matched("title:西安"), [4])
+            self.assertEqual(matched("owner:u1"), [1, 2, 4])
+            names = set(connection.execute(text("SELECT name FROM sqlite_master")).scalars())
+        self.assertFalse({"plan_search_new", "plan_search_changes", "plan_search_changes_update"} & names)
+
+    def test_add_column(self):
+        migrations.migrate(self.engine)
+        ctx = MigrationContext(self.engine)
+        ctx.add_column("travel_plans", Column("note", String, nullable=True))
+        ctx.add_column("travel_plans", Column("note", String, nullable=True))
+        self.assertIn("note", {item["name"] for item in inspect(self.engine).get_columns("travel_plans")})
+        with self.assertRaises(ValueError):
+            ctx.add_column("travel_plans", Column("required", String, nullable=False))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,107 @@
+import unittest
+from datetime import datetime, timezone
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from app.database.database import Base, get_db
+from app.main import app
+from app.models.models import TravelPlan
+from app.schemas.schemas import User
+from app.services import auth_utils, pagination, user_service
+
+
+class TestCursor(unittest.TestCase):
+    def test_round_trip(self):
+        for created_at in (datetime(2025, 12, 1, 8, 30), datetime(2025, 12, 1, 8, 30, 0, 123, tzinfo=timezone.utc)):
+            cursor = pagination.encode_cursor(created_at, 42)
+            self.assertNotIn("=", cursor)
+            self.assertEqual(pagination.decode_cursor(cursor), (created_at, 42))
+
+    def test_invalid_cursor(self):
+        for cursor in ("garbage!", "e30", pagination.encode_cursor(None, 1)[:-2]):
+            with self.assertRaises(pagination.InvalidCursor):
+                pagination.decode_cursor(cursor)
+
+
+class TestKeysetPagination(unittest.TestCase):
+    def setUp(self):
+        engine = create_engine("sqlite://")
+        Base.metadata.create_all(bind=engine)
+        self.db = sessionmaker(bind=engine)()
+        # 同一秒内创建，只能靠 id 区分先后
+        self.db.add_all([
+            TravelPlan(user_id=1 if i % 4 else 2, title=f"plan{i}", destination="北京", budget=100.0, details="x" * 1000)
+            for i in range(12)
+        ])
+        self.db.commit()
+
+    def tearDown(self):
+        self.db.close()
+
+    def test_pages_cover_all_rows_once(self):
+        ids, cursor = [], None
+        while True:
+            page = user_service.get_travel_plans(self.db, user_id=1, cursor=cursor, limit=4)
+            ids.extend(plan.id for plan in page)
+            cursor = pagination.next_cursor(page, 4)
+            if cursor is None:
+                break
+        expected = [plan.id for plan in self.db.query(TravelPlan).filter(TravelPlan.user_id == 1).order_by(TravelPlan.id)]
+        self.assertEqual(ids, expected)
+
+    def test_details_not_loaded(self):
+        self.db.expire_all()
+        plan = user_service.get_travel_plans(self.db, user_id=1, limit=1)[0]
+        self.assertNotIn("details", plan.__dict__)
+
+    def test_deprecated_skip_uses_same_order(self):
+        ordered = [plan.id for plan in user_service.get_travel_plans(self.db, user_id=1, limit=100)]
+        page = user_service.get_travel_plans(self.db, user_id=1, limit=3, skip=2)
+        self.assertEqual([plan.id for plan in page], ordered[2:5])
+
+
+class TestListRoutes(unittest.TestCase):
+    def setUp(self):
+        engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+        Base.metadata.create_all(bind=engine)
+        self.Session = sessionmaker(bind=engine)
+        with self.Session() as db:
+            db.add_all([
+                TravelPlan(user_id=1, title=f"plan{i}", destination="北京", budget=100.0, preferences="",
+                           start_date=datetime(2025, 12, 1), end_date=datetime(2025, 12, 2))
+                for i in range(5)
+            ])
+            db.commit()
+
+        def override_get_db():
+            with self.Session() as db:
+                yield db
+
+        app.dependency_overrides[get_db] = override_get_db
+        app.dependency_overrides[auth_utils.get_current_user] = lambda: User(
+            id=1, username="u", email="u@example.com", created_at=datetime(2025, 1, 1)
+        )
+        self.client = TestClient(app)
+
+    def tearDown(self):
+        app.dependency_overrides.clear()
+
+    def test_skip_still_honoured(self):
+        all_ids = [plan["id"] for plan in self.client.get("/api/plans/").json()]
+        response = self.client.get("/api/plans/", params={"skip": 3, "limit": 2})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([plan["id"] for plan in response.json()], all_ids[3:5])
+        self.assertEqual(self.client.get("/api/expenses/", params={"skip": 1}).json(), [])
+
+    def test_skip_with_cursor_rejected(self):
+        cursor = self.client.get("/api/plans/", params={"limit": 2}).headers[pagination.NEXT_CURSOR_HEADER]
+        for path in ("/api/plans/", "/api/expenses/"):
+            response = self.client.get(path, params={"skip": 2, "cursor": cursor})
+            self.assertEqual(response.status_code, 400)
+            self.assertIn("cursor", response.json()["detail"])
+        self.assertEqual(self.client.get("/api/plans/", params={"skip": -1}).status_code, 422)
+
+
+if __name__ == '__main__':
+    unittest.main()
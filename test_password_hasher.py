@@ -0,0 +1,103 @@
+import asyncio
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from unittest.mock import patch
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from app.core import security
+from app.core.security import PasswordHasher, PasswordHasherBusy
+from app.database import database
+from app.database.database import Base
+from app.main import app
+from app.schemas.schemas import UserCreate
+from app.services import user_service
+
+
+class TestPasswordHasher(unittest.IsolatedAsyncioTestCase):
+    async def test_rejects_when_queue_is_full(self):
+        hasher = PasswordHasher(workers=1, max_queue=1)
+        release = threading.Event()
+        self.addCleanup(hasher.shutdown)
+
+        def slow_hash(value):
+            release.wait(5)
+            return f"hashed:{value}"
+
+        running = asyncio.create_task(hasher.run(slow_hash, "a"))
+        queued = asyncio.create_task(hasher.run(slow_hash, "b"))
+        await asyncio.sleep(0.05)
+        self.assertEqual(hasher.stats()["in_flight"], 2)
+        self.assertEqual(hasher.queue_depth, 1)
+
+        with self.assertRaises(PasswordHasherBusy):
+            await hasher.run(slow_hash, "c")
+
+        release.set()
+        self.assertEqual(await asyncio.gather(running, queued), ["hashed:a", "hashed:b"])
+        stats = hasher.stats()
+        self.assertEqual((stats["in_flight"], stats["completed"], stats["rejected"]), (0, 2, 1))
+        self.assertEqual(stats["max_queue_depth_seen"], 1)
+        # 队列空出后可以继续接受请求
+        self.assertEqual(await hasher.run(slow_hash, "d"), "hashed:d")
+
+    async def test_runs_outside_event_loop_thread(self):
+        hasher = PasswordHasher(workers=1, max_queue=0)
+        self.addCleanup(hasher.shutdown)
+        thread_name = await hasher.run(lambda: threading.current_thread().name)
+        self.assertTrue(thread_name.startswith("password-hash"))
+
+    async def test_failure_releases_slot(self):
+        hasher = PasswordHasher(workers=1, max_queue=0)
+        self.addCleanup(hasher.shutdown)
+
+        def fail():
+            raise ValueError("bad hash")
+
+        with self.assertRaises(ValueError):
+            await hasher.run(fail)
+        self.assertEqual(hasher.stats()["in_flight"], 0)
+        self.assertEqual(await hasher.run(lambda: "ok"), "ok")
+
+
+class TestHasherBusyResponse(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.engine = create_engine(f"sqlite:///{os.path.join(self.directory, 'test.db')}")
+        Base.metadata.create_all(bind=self.engine)
+        # 工作者和排队名额都已占满
+        busy = PasswordHasher(workers=1, max_queue=0)
+        busy.in_flight = 1
+        for patcher in (
+            patch.object(database, "SessionLocal", sessionmaker(bind=self.engine)),
+            patch.object(security, "password_hasher", busy),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.client = TestClient(app)
+
+    def tearDown(self):
+        self.engine.dispose()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def test_register_returns_503(self):
+        response = self.client.post(
+            "/auth/register", data={"username": "u", "email": "u@example.com", "password": "secret123"}
+        )
+        self.assertEqual(response.status_code, 503)
+        self.assertIn("繁忙", response.json()["detail"])
+
+    def test_login_returns_503(self):
+        with sessionmaker(bind=self.engine)() as db:
+            user_service.create_user(
+                db, UserCreate(username="u", email="u@example.com", password="secret123"), hashed_password="hashed"
+            )
+        response = self.client.post("/auth/login", data={"username": "u", "password": "secret123"})
+        self.assertEqual(response.status_code, 503)
+
+
+if __name__ == '__main__':
+    unittest.main()
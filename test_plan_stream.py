@@ -0,0 +1,240 @@
+import json
+import unittest
+from datetime import datetime
+from unittest.mock import patch
+import httpx
+from fastapi.testclient import TestClient
+from app.main import app
+from app.models.models import TravelPlan
+from app.schemas.schemas import User
+from app.services import auth_utils, llm_service
+from app.services.itinerary_parser import StructuredOutputFilter
+from app.services.rate_limiter import estimate_tokens
+from app.services.travel_service import TravelService
+
+PLAN_TEXT = "## 厦门3日游\n### 第1天\n鼓浪屿，``代码``不是标记\n### 第2天\n曾厝垵\n"
+JSON_BLOCK = "```json\n{\"days\": [{\"day_number\": 1, \"title\": \"鼓浪屿\", \"activities\": []}]}\n```\n"
+
+REQUEST = {
+    "destination": "厦门",
+    "start_date": "2025-12-01",
+    "end_date": "2025-12-03",
+    "budget": 3000,
+    "preferences": "海边",
+    "travelers": 2
+}
+
+
+def fake_stream(deltas, error=None):
+    async def stream(*args, **kwargs):
+        for delta in deltas:
+            yield {"success": True, "delta": delta}
+        if error:
+            yield {"success": False, "error": error}
+    return stream
+
+
+class TestStructuredOutputFilter(unittest.TestCase):
+    def test_plain_text_passes_through(self):
+        # 没有结构化代码块时全部转发，疑似标记开头的部分暂存后原样输出
+        for size in (1, 2, 5, len(PLAN_TEXT)):
+            visible = StructuredOutputFilter()
+            output = "".join(visible.feed(PLAN_TEXT[i:i + size]) for i in range(0, len(PLAN_TEXT), size))
+            self.assertEqual(output + visible.flush(), PLAN_TEXT)
+
+    def test_partial_marker_at_end_of_stream(self):
+        visible = StructuredOutputFilter()
+        self.assertEqual(visible.feed("正文```js"), "正文")
+        self.assertEqual(visible.flush(), "```js")
+
+
+class TestPlanStreamEndpoint(unittest.TestCase):
+    def setUp(self):
+        app.dependency_overrides[auth_utils.get_current_user] = lambda: User(
+            id=7, username="u", email="u@example.com", created_at=datetime(2025, 1, 1)
+        )
+        self.client = TestClient(app)
+        self.saved = []
+
+        async def persist(service, user_id, destination, start_date, end_date, budget, preferences, plan_content):
+            self.saved.append(plan_content)
+            return TravelPlan(
+                id=1, user_id=user_id, title=f"{destination}旅行计划", destination=destination,
+                start_date=start_date, end_date=end_date, budget=budget, preferences=preferences,
+                details=plan_content, created_at=datetime(2025, 1, 1)
+            )
+
+        patcher = patch.object(TravelService, "_persist_plan", persist)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        app.dependency_overrides.clear()
+
+    def _events(self, response):
+        return [json.loads(line) for line in response.text.splitlines() if line]
+
+    def test_deltas_then_done(self):
+        text = PLAN_TEXT + JSON_BLOCK
+        deltas = [text[i:i + 4] for i in range(0, len(text), 4)]
+        with patch.object(llm_service.llm_service, "stream_travel_plan", fake_stream(deltas)):
+            response = self.client.post("/api/plans/generate/stream", json=REQUEST)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.headers["content-type"].startswith("application/x-ndjson"))
+        events = self._events(response)
+        self.assertEqual({event["event"] for event in events[:-1]}, {"delta"})
+        # 结构化代码块不转发给客户端，但随正文一起保存
+        self.assertEqual("".join(event["content"] for event in events[:-1]).rstrip(), PLAN_TEXT.rstrip())
+        self.assertEqual(self.saved, [text])
+        self.assertEqual(events[-1]["event"], "done")
+        self.assertEqual(events[-1]["plan"]["id"], 1)
+        self.assertEqual(events[-1]["plan"]["user_id"], 7)
+
+    def test_error_event_and_nothing_saved(self):
+        with patch.object(llm_service.llm_service, "stream_travel_plan", fake_stream(["第1天"], error="超时")):
+            response = self.client.post("/api/plans/generate/stream", json=REQUEST)
+
+        events = self._events(response)
+        self.assertEqual(events[0], {"event": "delta", "content": "第1天"})
+        self.assertEqual(events[-1], {"event": "error", "error": "超时"})
+        self.assertEqual(self.saved, [])
+
+    def test_persist_failure_ends_with_error_event(self):
+        async def fail(*args, **kwargs):
+            raise RuntimeError("database is locked")
+
+        with patch.object(llm_service.llm_service, "stream_travel_plan", fake_stream([PLAN_TEXT])), \
+                patch.object(TravelService, "_persist_plan", fail), \
+                self.assertLogs("app.services.travel_service", "ERROR"):
+            response = self.client.post("/api/plans/generate/stream", json=REQUEST)
+
+        events = self._events(response)
+        self.assertEqual(events[-1]["event"], "error")
+        self.assertIn("database is locked", events[-1]["error"])
+        self.assertNotIn("done", {event["event"] for event in events})
+
+    def test_invalid_request_rejected_before_streaming(self):
+        with patch.object(llm_service.llm_service, "stream_travel_plan", fake_stream(["x"])):
+            response = self.client.post("/api/plans/generate/stream", json=dict(REQUEST, budget=0))
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.saved, [])
+
+
+def sse(*chunks):
+    return "".join(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n" for chunk in chunks) + "data: [DONE]\n\n"
+
+
+def delta_chunk(text):
+    return {"choices": [{"delta": {"content": text}}]}
+
+
+class TrackedStream(httpx.AsyncByteStream):
+    """
+    记录上游响应是否已关闭
+    """
+
+    def __init__(self, body):
+        self.body = body.encode("utf-8")
+        self.closed = False
+
+    async def __aiter__(self):
+        yield self.body
+
+    async def aclose(self):
+        self.closed = True
+
+
+class TestStreamQuota(unittest.IsolatedAsyncioTestCase):
+    """
+    流式生成结束或中断时按实际用量修正预扣的配额
+    """
+
+    async def asyncSetUp(self):
+        for name, value in (
+            ("AI_API_KEY", "key"),
+            ("AI_API_ENDPOINT", "https://api.openai.com/v1/chat/completions"),
+            ("LLM_PROVIDER", None),
+            ("LLM_FALLBACK_PROVIDERS", []),
+            ("LLM_RATE_LIMIT_TPM", 100000),
+            ("LLM_CACHE_BACKEND", "none"),
+        ):
+            patcher = patch.object(llm_service.settings, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.service = llm_service.LLMService()
+        self.addAsyncCleanup(self.service.close)
+        # 测试期间不补充配额，便于精确比较
+        self.bucket = self.service.scheduler.tokens
+        self.bucket.rate = 0
+        self.requests = []
+        self.body = ""
+        self.status_code = 200
+        self.upstream = None
+
+        def handler(request):
+            self.requests.append(json.loads(request.content))
+            self.upstream = TrackedStream(self.body)
+            return httpx.Response(self.status_code, stream=self.upstream, headers={"Content-Type": "text/event-stream"})
+
+        provider = self.service.provider
+        await provider.client.aclose()
+        provider.client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+    def _stream(self):
+        return self.service.stream_travel_plan("厦门", "2025-12-01", "2025-12-03", 3000, "海边", 2, user_id=7)
+
+    def _prompt_tokens(self):
+        prompt = self.service._build_travel_prompt("厦门", "2025-12-01", "2025-12-03", 3000, "海边", 2)
+        return estimate_tokens(self.service._build_messages(llm_service.TRAVEL_PLANNER_PROMPT, prompt), 0)
+
+    def _used(self):
+        return self.bucket.capacity - self.bucket.tokens
+
+    async def test_reconciles_with_reported_usage(self):
+        self.body = sse(delta_chunk("第1天"), delta_chunk("鼓浪屿"), {"choices": [], "usage": {"total_tokens": 321}})
+        events = [event async for event in self._stream()]
+
+        self.assertEqual("".join(event["delta"] for event in events), "第1天鼓浪屿")
+        self.assertEqual(self.requests[0]["stream_options"], {"include_usage": True})
+        self.assertEqual(self._used(), 321)
+
+    async def test_counts_output_without_usage(self):
+        self.body = sse(delta_chunk("第1天"), delta_chunk("鼓浪屿"))
+        events = [event async for event in self._stream()]
+
+        self.assertTrue(all(event["success"] for event in events))
+        self.assertEqual(self._used(), self._prompt_tokens() + len("第1天鼓浪屿"))
+
+    async def test_reconciles_when_client_disconnects(self):
+        self.body = sse(delta_chunk("第1天"), delta_chunk("鼓浪屿"), {"choices": [], "usage": {"total_tokens": 321}})
+        stream = self._stream()
+        self.assertEqual((await stream.__anext__())["delta"], "第1天")
+        self.assertGreater(self._used(), self._prompt_tokens() + 1000)
+        self.assertFalse(self.upstream.closed)
+        await stream.aclose()
+
+        # 上游连接随之关闭，不等待垃圾回收
+        self.assertTrue(self.upstream.closed)
+        self.assertEqual(self._used(), self._prompt_tokens() + len("第1天"))
+
+    async def test_upstream_status_errors(self):
+        for status_code, message in ((429, "过于频繁"), (503, "暂时不可用")):
+            self.status_code = status_code
+            events = [event async for event in self._stream()]
+            self.assertEqual(len(events), 1)
+            self.assertIn(message, events[0]["error"])
+
+    async def test_refunds_when_no_provider_was_called(self):
+        health = self.service.router.health[id(self.service.provider)]
+        for _ in range(health.breaker.failure_threshold):
+            health.breaker.record_failure()
+        events = [event async for event in self._stream()]
+
+        self.assertFalse(events[-1]["success"])
+        self.assertEqual(self.requests, [])
+        self.assertEqual(self._used(), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,67 @@
+import asyncio
+import unittest
+from app.services.rate_limiter import (
+    PRIORITY_BACKGROUND,
+    PRIORITY_INTERACTIVE,
+    QuotaScheduler,
+    RateLimitExceeded,
+    TokenBucket,
+    estimate_tokens,
+)
+
+
+class TestTokenBucket(unittest.TestCase):
+    def test_wait_time(self):
+        bucket = TokenBucket(60)
+        bucket.consume(60)
+        self.assertAlmostEqual(bucket.wait_time(1), 1.0, places=1)
+        bucket.refund(10)
+        self.assertEqual(bucket.wait_time(5), 0.0)
+
+
+class TestQuotaScheduler(unittest.IsolatedAsyncioTestCase):
+    async def test_disabled_by_default(self):
+        scheduler = QuotaScheduler()
+        await scheduler.acquire(10 ** 9)
+        self.assertEqual(scheduler.stats()["waited"], 0)
+
+    async def test_times_out_when_quota_exhausted(self):
+        scheduler = QuotaScheduler(rpm=1)
+        await scheduler.acquire(1)
+        with self.assertRaises(RateLimitExceeded):
+            await scheduler.acquire(1, timeout=0.01)
+        self.assertEqual(scheduler.stats()["queued"], 0)
+
+    async def test_priority_and_user_fairness(self):
+        scheduler = QuotaScheduler(rpm=600)  # 每0.1秒补充一个请求
+        scheduler.requests.tokens = 0
+        order = []
+
+        async def request(name, user_id, priority):
+            await scheduler.acquire(1, user_id=user_id, priority=priority, timeout=5)
+            order.append(name)
+
+        tasks = [
+            asyncio.ensure_future(request("analysis", 3, PRIORITY_BACKGROUND)),
+            asyncio.ensure_future(request("a1", 1, PRIORITY_INTERACTIVE)),
+            asyncio.ensure_future(request("a2", 1, PRIORITY_INTERACTIVE)),
+            asyncio.ensure_future(request("b1", 2, PRIORITY_INTERACTIVE)),
+        ]
+        await asyncio.gather(*tasks)
+        self.assertEqual(order, ["a1", "b1", "a2", "analysis"])
+
+    async def test_token_budget(self):
+        scheduler = QuotaScheduler(tpm=1000)
+        await scheduler.acquire(900)
+        with self.assertRaises(RateLimitExceeded):
+            await scheduler.acquire(500, timeout=0.01)
+        scheduler.refund(400)
+        await scheduler.acquire(500, timeout=0.01)
+
+    def test_estimate_tokens(self):
+        messages = [{"role": "user", "content": "你好"}]
+        self.assertEqual(estimate_tokens(messages, 100), 102)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,140 @@
+import asyncio
+import time
+import unittest
+import httpx
+from app.services.resilience import (
+    AdaptiveConcurrencyLimiter,
+    CircuitBreaker,
+    CircuitOpenError,
+    ConcurrencyLimitExceeded,
+    RetryPolicy,
+    parse_duration,
+    retry_after_from_headers,
+)
+
+
+def status_error(status_code, headers=None):
+    request = httpx.Request("POST", "https://example.com")
+    response = httpx.Response(status_code, headers=headers, request=request)
+    return httpx.HTTPStatusError("error", request=request, response=response)
+
+
+class TestCircuitBreaker(unittest.TestCase):
+    def test_opens_after_threshold(self):
+        breaker = CircuitBreaker(failure_threshold=2, recovery_timeout=60)
+        breaker.record_failure()
+        breaker.before_call()
+        breaker.record_failure()
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+        with self.assertRaises(CircuitOpenError):
+            breaker.before_call()
+
+    def test_half_open_probe(self):
+        breaker = CircuitBreaker(failure_threshold=1, recovery_timeout=0.01, half_open_max_calls=1)
+        breaker.record_failure()
+        time.sleep(0.02)
+        self.assertEqual(breaker.state, CircuitBreaker.HALF_OPEN)
+        breaker.before_call()
+        # 探测请求未返回前，其他请求仍被拒绝
+        with self.assertRaises(CircuitOpenError):
+            breaker.before_call()
+        breaker.record_success()
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+
+    def test_half_open_failure_reopens(self):
+        breaker = CircuitBreaker(failure_threshold=1, recovery_timeout=0.01)
+        breaker.record_failure()
+        time.sleep(0.02)
+        breaker.before_call()
+        breaker.record_failure()
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+
+
+class TestAdaptiveConcurrencyLimiter(unittest.IsolatedAsyncioTestCase):
+    async def test_rejects_when_full(self):
+        limiter = AdaptiveConcurrencyLimiter(initial_limit=1, queue_timeout=0.01)
+        await limiter.acquire()
+        with self.assertRaises(ConcurrencyLimitExceeded):
+            await limiter.acquire()
+        await limiter.release(0.1)
+        await limiter.acquire()
+        self.assertEqual(limiter.rejected, 1)
+
+    async def test_aimd_adjusts_limit(self):
+        limiter = AdaptiveConcurrencyLimiter(initial_limit=10, max_limit=20, latency_target=1.0, backoff_ratio=0.5)
+        await limiter.acquire()
+        await limiter.release(0.1, success=True)
+        self.assertGreater(limiter.limit, 10)
+        await limiter.acquire()
+        await limiter.release(2.0, success=True)
+        self.assertEqual(limiter.current_limit, 5)
+        await limiter.acquire()
+        await limiter.release(0.1, success=False)
+        self.assertEqual(limiter.current_limit, 2)
+
+    async def test_waiter_gets_released_slot(self):
+        limiter = AdaptiveConcurrencyLimiter(initial_limit=1, queue_timeout=1.0)
+        await limiter.acquire()
+        waiter = asyncio.ensure_future(limiter.acquire())
+        await asyncio.sleep(0.01)
+        self.assertFalse(waiter.done())
+        await limiter.release(0.1)
+        await waiter
+        self.assertEqual(limiter.in_flight, 1)
+
+
+class TestRetryHeaders(unittest.TestCase):
+    def test_parse_duration(self):
+        self.assertEqual(parse_duration("2"), 2.0)
+        self.assertEqual(parse_duration("20ms"), 0.02)
+        self.assertEqual(parse_duration("6m0s"), 360.0)
+        self.assertIsNone(parse_duration("soon"))
+
+    def test_retry_after_header(self):
+        self.assertEqual(retry_after_from_headers(httpx.Headers({"Retry-After": "3"})), 3.0)
+        self.assertEqual(retry_after_from_headers(httpx.Headers({"retry-after-ms": "250"})), 0.25)
+
+    def test_rate_limit_reset_only_when_exhausted(self):
+        headers = httpx.Headers({
+            "x-ratelimit-remaining-requests": "0",
+            "x-ratelimit-reset-requests": "1.5s",
+            "x-ratelimit-remaining-tokens": "100",
+            "x-ratelimit-reset-tokens": "30s",
+        })
+        self.assertEqual(retry_after_from_headers(headers), 1.5)
+        self.assertIsNone(retry_after_from_headers(httpx.Headers({"x-ratelimit-reset-requests": "1s"})))
+
+
+class TestRetryPolicy(unittest.IsolatedAsyncioTestCase):
+    async def test_retries_rate_limit_then_succeeds(self):
+        errors = [status_error(429, {"Retry-After": "0"}), status_error(503)]
+
+        async def call():
+            if errors:
+                raise errors.pop(0)
+            return "ok"
+
+        policy = RetryPolicy(max_attempts=3, base_delay=0.001, max_delay=0.01)
+        self.assertEqual(await policy.run(call), ("ok", 2))
+
+    async def test_does_not_retry_client_error(self):
+        async def call():
+            raise status_error(400)
+
+        with self.assertRaises(httpx.HTTPStatusError) as ctx:
+            await RetryPolicy(base_delay=0.001).run(call)
+        self.assertEqual(ctx.exception.retries, 0)
+
+    async def test_gives_up_when_retry_after_exceeds_deadline(self):
+        async def call():
+            raise status_error(429, {"Retry-After": "30"})
+
+        started = time.monotonic()
+        with self.assertRaises(httpx.HTTPStatusError) as ctx:
+            await RetryPolicy().run(call, deadline=time.monotonic() + 5)
+        self.assertEqual(ctx.exception.retries, 0)
+        self.assertLess(time.monotonic() - started, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+import unittest
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+from app.database.database import Base
+from app.database import search_index
+from app.models.models import TravelPlan
+from app.services import search_service
+
+
+class TestTokenize(unittest.TestCase):
+    def test_cjk_bigrams(self):
+        self.assertEqual(search_index.tokenize("北京市3日游, Beijing!"), ["北京", "京市", "3", "日游", "beijing"])
+        self.assertEqual(search_index.tokenize("去 A"), ["去", "a"])
+
+    def test_highlight_escapes_html(self):
+        self.assertEqual(
+            search_service.highlight("<b>北京</b>之旅", ["北京"]),
+            "&lt;b&gt;<mark>北京</mark>&lt;/b&gt;之旅"
+        )
+        self.assertIsNone(search_service.snippet("西湖", ["北京"]))
+
+
+class TestSearchPlans(unittest.TestCase):
+    def setUp(self):
+        engine = create_engine("sqlite://")
+        Base.metadata.create_all(bind=engine)
+        self.db = sessionmaker(bind=engine)()
+        self.db.add_all([
+            TravelPlan(user_id=1, title="北京三日游", destination="北京", budget=100.0,
+                       details="## 第1天\n- 参观故宫博物院，晚上品尝烤鸭"),
+            TravelPlan(user_id=1, title="杭州周末", destination="杭州", budget=100.0,
+                       details="西湖边散步，顺路去北京路吃小吃"),
+            TravelPlan(user_id=2, title="北京亲子游", destination="北京", budget=100.0, details="故宫"),
+        ])
+        self.db.commit()
+
+    def tearDown(self):
+        self.db.close()
+
+    def _ids(self, query):
+        return [item["id"] for item in search_service.search_plans(self.db, user_id=1, query=query)]
+
+    def test_ranked_and_limited_to_user(self):
+        results = search_service.search_plans(self.db, user_id=1, query="北京")
+        # 标题和目的地命中的计划排在只有详情命中的计划之前
+        self.assertEqual([item["title"] for item in results], ["北京三日游", "杭州周末"])
+        self.assertEqual(results[0]["title_highlight"], "<mark>北京</mark>三日游")
+        self.assertIn("<mark>北京</mark>路", results[1]["snippet"])
+
+    def test_terms_and_single_char(self):
+        self.assertEqual(len(self._ids("故宫 烤鸭")), 1)
+        self.assertEqual(self._ids("故宫 西湖"), [])
+        # 单字只在词尾出现（"北京"的"京"）也能命中
+        self.assertEqual(len(self._ids("京")), 2)
+        self.assertEqual(self._ids("  ，"), [])
+
+    def test_index_follows_writes(self):
+        plan = self.db.query(TravelPlan).filter(TravelPlan.title == "杭州周末").one()
+        plan.details = "灵隐寺"
+        self.db.commit()
+        self.assertEqual(self._ids("北京路"), [])
+        self.assertEqual(self._ids("灵隐寺"), [plan.id])
+
+        self.db.delete(plan)
+        self.db.commit()
+        self.assertEqual(self._ids("灵隐寺"), [])
+        # 无内容表按原值删除词元，值不一致时旧词元会残留在索引中
+        self.db.execute(text("CREATE VIRTUAL TABLE temp.plan_search_vocab USING fts5vocab(main, plan_search, 'row')"))
+        terms = dict(self.db.execute(text("SELECT term, doc FROM temp.plan_search_vocab")).all())
+        self.assertNotIn("灵隐", terms)
+        self.assertNotIn("京路", terms)
+        self.assertEqual(terms["u1"], 1)
+
+    def test_pagination(self):
+        first = self._ids("北京")
+        page = search_service.search_plans(self.db, user_id=1, query="北京", limit=1, offset=1)
+        self.assertEqual([item["id"] for item in page], first[1:])
+
+
+if __name__ == '__main__':
+    unittest.main()
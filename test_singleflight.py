@@ -0,0 +1,73 @@
+import asyncio
+import unittest
+from app.services.singleflight import SingleFlight
+
+
+class TestSingleFlight(unittest.IsolatedAsyncioTestCase):
+    async def test_concurrent_calls_are_coalesced(self):
+        group = SingleFlight()
+        calls = 0
+
+        async def fetch():
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.01)
+            return {"plan": "北京"}
+
+        results = await asyncio.gather(*(group.do("key", fetch) for _ in range(5)))
+        self.assertEqual(calls, 1)
+        self.assertTrue(all(result == {"plan": "北京"} for result in results))
+        self.assertEqual(group.in_flight(), 0)
+
+    async def test_failure_is_shared_and_not_remembered(self):
+        group = SingleFlight()
+        calls = 0
+
+        async def fetch():
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.01)
+            raise RuntimeError("upstream error")
+
+        results = await asyncio.gather(
+            group.do("key", fetch), group.do("key", fetch), return_exceptions=True
+        )
+        self.assertTrue(all(isinstance(result, RuntimeError) for result in results))
+        with self.assertRaises(RuntimeError):
+            await group.do("key", fetch)
+        self.assertEqual(calls, 2)
+
+    async def test_leader_cancellation_does_not_affect_followers(self):
+        group = SingleFlight()
+
+        async def fetch():
+            await asyncio.sleep(0.02)
+            return "ok"
+
+        leader = asyncio.ensure_future(group.do("key", fetch))
+        await asyncio.sleep(0)
+        follower = asyncio.ensure_future(group.do("key", fetch))
+        await asyncio.sleep(0)
+        leader.cancel()
+        self.assertEqual(await follower, "ok")
+
+    async def test_upstream_cancelled_when_all_waiters_cancel(self):
+        group = SingleFlight()
+        cancelled = asyncio.Event()
+
+        async def fetch():
+            try:
+                await asyncio.sleep(1)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        waiter = asyncio.ensure_future(group.do("key", fetch))
+        await asyncio.sleep(0)
+        waiter.cancel()
+        await asyncio.wait_for(cancelled.wait(), timeout=1)
+        self.assertEqual(group.in_flight(), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
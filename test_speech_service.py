@@ -0,0 +1,74 @@
+import base64
+import unittest
+from urllib.parse import parse_qs
+import httpx
+from app.core.config import settings
+from app.services.speech_service import SpeechService
+
+
+class TestSpeechService(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.service = SpeechService()
+        self.service.api_key = "key"
+        self.service.api_secret = "secret"
+        self.requests = []
+
+    async def asyncTearDown(self):
+        await self.service.close()
+
+    async def _use_transport(self, handler):
+        def handle(request):
+            self.requests.append(request)
+            return handler(request)
+
+        await self.service.client.aclose()
+        self.service.client = httpx.AsyncClient(transport=httpx.MockTransport(handle))
+
+    async def test_client_uses_configured_timeouts(self):
+        timeout = self.service.client.timeout
+        self.assertEqual(timeout.connect, settings.SPEECH_CONNECT_TIMEOUT)
+        self.assertEqual(timeout.read, settings.SPEECH_READ_TIMEOUT)
+
+    async def test_recognize_reuses_client(self):
+        await self._use_transport(lambda request: httpx.Response(200, json={"code": 0, "data": "去厦门三天", "desc": ""}))
+        client = self.service.client
+        for _ in range(3):
+            result = await self.service.recognize_speech(b"\x00\x01audio")
+            self.assertTrue(result["success"])
+            self.assertEqual(result["text"], "去厦门三天")
+        self.assertIs(self.service.client, client)
+        self.assertEqual(len(self.requests), 3)
+        request = self.requests[0]
+        self.assertTrue(request.headers["X-CheckSum"])
+        body = parse_qs(request.content.decode("ascii"))
+        self.assertEqual(base64.b64decode(body["audio"][0]), b"\x00\x01audio")
+
+    async def test_api_error(self):
+        await self._use_transport(lambda request: httpx.Response(200, json={"code": 10105, "desc": "illegal access"}))
+        result = await self.service.recognize_speech(b"audio")
+        self.assertFalse(result["success"])
+        self.assertIn("illegal access", result["error"])
+
+    async def test_timeout(self):
+        def handler(request):
+            raise httpx.ReadTimeout("timed out", request=request)
+
+        await self._use_transport(handler)
+        result = await self.service.recognize_speech(b"audio")
+        self.assertFalse(result["success"])
+        self.assertIn("超时", result["error"])
+
+    async def test_mock_without_credentials(self):
+        await self._use_transport(lambda request: httpx.Response(500))
+        self.service.api_key = ""
+        result = await self.service.recognize_speech(b"audio")
+        self.assertTrue(result["raw_response"]["mock"])
+        self.assertEqual(self.requests, [])
+
+    async def test_close(self):
+        await self.service.close()
+        self.assertTrue(self.service.client.is_closed)
+
+
+if __name__ == '__main__':
+    unittest.main()